@@ -0,0 +1,49 @@
+import hashlib
+import json
+from typing import Any
+
+from celpy import celtypes
+
+from koreo.cel.encoder import convert_bools
+
+
+def bounded_insert[K, V](cache: dict[K, V], key: K, value: V, size: int) -> int:
+    """Insert `value` at `key`, evicting the oldest entries to keep `cache`
+    within `size`. Returns the number of entries evicted.
+
+    The key is re-inserted, so entries are evicted least recently written
+    first.
+    """
+    cache.pop(key, None)
+
+    evicted = 0
+    while len(cache) >= size:
+        del cache[next(iter(cache))]
+        evicted += 1
+
+    cache[key] = value
+
+    return evicted
+
+
+def canonical_digest(value: Any) -> str:
+    """Return a stable hash of `value`'s canonical JSON encoding.
+
+    Raises TypeError or ValueError if `value` can not be encoded.
+    """
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+    return hashlib.blake2b(encoded.encode(), digest_size=16).hexdigest()
+
+
+def value_digest(value: celtypes.Value) -> str | None:
+    """Return a stable hash of a CEL value, or `None` if it can not be
+    canonically encoded.
+
+    The value is converted to native types first, so that values which differ
+    only in type, such as `true` and `1`, hash differently.
+    """
+    try:
+        return canonical_digest(convert_bools(value))
+    except (TypeError, ValueError):
+        return None
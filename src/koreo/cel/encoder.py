@@ -1,5 +1,6 @@
-from typing import Any
+from typing import Any, Callable
 import base64
+import re
 
 from celpy import celtypes
 
@@ -19,90 +20,194 @@ ConvertedType = (
 def convert_bools(
     cel_object: celtypes.Value,
 ) -> ConvertedType:
-    """Recursive walk through the CEL object, replacing celtypes with native
-    types. This lets the :py:mod:`json` module correctly represent the obects
-    and allows Python code to treat these as normal objects.
+    """Walk through the CEL object, replacing celtypes with native types. This
+    lets the :py:mod:`json` module correctly represent the obects and allows
+    Python code to treat these as normal objects.
+
+    The walk is iterative, so deeply nested resources are not bound by the
+    recursion limit.
     """
-    match cel_object:
-        case celtypes.BoolType():
-            return True if cel_object else False
+    converter = _converter_for(cel_object)
+    if converter is not list and converter is not dict:
+        return converter(cel_object)
+
+    converted = converter()
+    pending: list[tuple[Any, list | dict]] = [(cel_object, converted)]
+    while pending:
+        source, target = pending.pop()
+
+        if isinstance(target, list):
+            for item in source:
+                item_converter = _converter_for(item)
+                if item_converter is list or item_converter is dict:
+                    item_converted = item_converter()
+                    pending.append((item, item_converted))
+                else:
+                    item_converted = item_converter(item)
+                target.append(item_converted)
+            continue
+
+        for key, value in source.items():
+            value_converter = _converter_for(value)
+            if value_converter is list or value_converter is dict:
+                value_converted = value_converter()
+                pending.append((value, value_converted))
+            else:
+                value_converted = value_converter(value)
+            target[convert_bools(key)] = value_converted
+
+    return converted
+
+
+def _passthrough(value: Any) -> Any:
+    return value
+
+
+def _bytes_to_str(value: celtypes.BytesType) -> str:
+    return base64.b64encode(value).decode("ASCII")
+
+
+def _null_to_none(_: Any) -> None:
+    return None
+
+
+# Maps a type to its converter. Containers map to `list` or `dict`, which is
+# the type they are converted into. Types not listed are resolved, and cached,
+# by `_converter_for`.
+_CONVERTERS: dict[type, Callable[[Any], Any]] = {
+    celtypes.BoolType: bool,
+    celtypes.StringType: str,
+    celtypes.TimestampType: str,
+    celtypes.DurationType: str,
+    celtypes.IntType: int,
+    celtypes.UintType: int,
+    celtypes.DoubleType: float,
+    celtypes.BytesType: _bytes_to_str,
+    celtypes.NullType: _null_to_none,
+    celtypes.ListType: list,
+    list: list,
+    tuple: list,
+    celtypes.MapType: dict,
+    dict: dict,
+    str: _passthrough,
+    int: _passthrough,
+    float: _passthrough,
+    bool: _passthrough,
+    type(None): _passthrough,
+}
+
+# Checked in order, this mirrors the precedence of the type hierarchy.
+_SUBCLASS_CONVERTERS: tuple[tuple[type | tuple[type, ...], Callable], ...] = (
+    (celtypes.BoolType, bool),
+    ((celtypes.StringType, celtypes.TimestampType, celtypes.DurationType), str),
+    ((celtypes.IntType, celtypes.UintType), int),
+    (celtypes.DoubleType, float),
+    (celtypes.BytesType, _bytes_to_str),
+    ((celtypes.ListType, list, tuple), list),
+    ((celtypes.MapType, dict), dict),
+    (celtypes.NullType, _null_to_none),
+)
 
-        case celtypes.StringType() | celtypes.TimestampType() | celtypes.DurationType():
-            return str(cel_object)
 
-        case celtypes.IntType() | celtypes.UintType():
-            return int(cel_object)
+def _converter_for(value: Any) -> Callable[[Any], Any]:
+    value_type = type(value)
 
-        case celtypes.DoubleType():
-            return float(cel_object)
+    converter = _CONVERTERS.get(value_type)
+    if converter is not None:
+        return converter
 
-        case celtypes.BytesType():
-            return base64.b64encode(cel_object).decode("ASCII")
+    for base_types, converter in _SUBCLASS_CONVERTERS:
+        if isinstance(value, base_types):
+            break
+    else:
+        converter = _passthrough
 
-        case celtypes.ListType() | list() | tuple():
-            return [convert_bools(item) for item in cel_object]
+    _CONVERTERS[value_type] = converter
+    return converter
 
-        case celtypes.MapType() | dict():
-            return {
-                convert_bools(key): convert_bools(value)
-                for key, value in cel_object.items()
-            }
 
-        case celtypes.NullType():
-            return None
+class _Fragment(str):
+    """Pre-encoded CEL source, emitted as-is by :py:func:`encode_cel`."""
 
-        case _:
-            return cel_object
 
+_MAP_OPEN = "{"
+_MAP_CLOSE = _Fragment("}")
+_LIST_OPEN = "["
+_LIST_CLOSE = _Fragment("]")
+_SEPARATOR = _Fragment(",")
 
-def encode_cel(value: Any) -> str:
-    if isinstance(value, dict):
-        return f"{{{ ",".join(
-            f'"{f"{key}".replace('"', '\"')}":{encode_cel(value)}'
-            for key, value in value.items()
-        ) }}}"
+# Strings matching this are valid numeric literals, and are emitted unquoted.
+_NUMERIC_PATTERN = re.compile(r"\s*[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?\s*")
 
-    if isinstance(value, list):
-        return f"[{ ",".join(encode_cel(item) for item in value) }]"
 
+def encode_cel(value: Any) -> str:
+    """Encode a (YAML-loaded) spec structure into CEL source.
+
+    Strings prefixed with `=` are treated as CEL expressions, all other values
+    are encoded as CEL literals. The structure is walked iteratively, with
+    output appended to a single buffer.
+    """
+    output: list[str] = []
+    emit = output.append
+
+    pending: list[Any] = [value]
+    while pending:
+        current = pending.pop()
+
+        if type(current) is _Fragment:
+            emit(current)
+            continue
+
+        if isinstance(current, dict):
+            emit(_MAP_OPEN)
+            pending.append(_MAP_CLOSE)
+            items = list(current.items())
+            for idx in range(len(items) - 1, -1, -1):
+                key, item_value = items[idx]
+                pending.append(item_value)
+                if idx:
+                    pending.append(_Fragment(f',"{key}":'))
+                else:
+                    pending.append(_Fragment(f'"{key}":'))
+            continue
+
+        if isinstance(current, list):
+            emit(_LIST_OPEN)
+            pending.append(_LIST_CLOSE)
+            for idx in range(len(current) - 1, -1, -1):
+                pending.append(current[idx])
+                if idx:
+                    pending.append(_SEPARATOR)
+            continue
+
+        emit(_encode_scalar(current))
+
+    return "".join(output)
+
+
+def _encode_scalar(value: Any) -> str:
     if isinstance(value, bool):
         return "true" if value else "false"
 
     if value is None:
         return "null"
 
-    if _encode_plain(value):
+    if not isinstance(value, str):
         return f"{value}"
 
     if not value:
         return '""'
 
+    if _NUMERIC_PATTERN.fullmatch(value):
+        return value
+
     if not value.startswith(CEL_PREFIX):
         if "\n" in value:
-            return f'r"""{ value.replace('"', '\"') }"""'  # fmt: skip
+            return f'r"""{value}"""'
 
         if '"' in value:
             return f'"""{ value.replace('"', r'\"') }"""'  # fmt: skip
 
-        return f'"{value}"'  # fmt: skip
+        return f'"{value}"'
 
     return value.lstrip(CEL_PREFIX)
-
-
-def _encode_plain(maybe_number) -> bool:
-    if not isinstance(maybe_number, str):
-        return True
-
-    try:
-        int(maybe_number)
-        return True
-    except ValueError:
-        pass
-
-    try:
-        float(maybe_number)
-        return True
-    except ValueError:
-        pass
-
-    return False
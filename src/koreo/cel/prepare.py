@@ -1,12 +1,54 @@
 from typing import Any, NamedTuple
 import logging
+import threading
 
 import celpy
 
 from koreo.cel.encoder import encode_cel
-from koreo.cel.functions import koreo_cel_functions
+from koreo.cel.functions import koreo_cel_functions, koreo_function_annotations
 from koreo.result import PermFail
 
+_ENVIRONMENTS: dict[frozenset, celpy.Environment] = {}
+_ENVIRONMENTS_LOCK = threading.Lock()
+_default_environment: celpy.Environment | None = None
+
+
+def get_cel_environment(
+    annotations: dict[str, celpy.Annotation] | None = None,
+) -> celpy.Environment:
+    """Return the shared `celpy.Environment` for the annotation set, building
+    it on first use. Defaults to Koreo's function annotations.
+    """
+    global _default_environment
+
+    if annotations is None:
+        if _default_environment:
+            return _default_environment
+
+        annotations = koreo_function_annotations
+
+    # Environment merges the standard annotations into the mapping it is
+    # given, which may be this one, so they are part of the key.
+    environment_key = frozenset((annotations | celpy.googleapis).items())
+
+    cel_env = _ENVIRONMENTS.get(environment_key)
+    if cel_env:
+        return cel_env
+
+    with _ENVIRONMENTS_LOCK:
+        cel_env = _ENVIRONMENTS.get(environment_key)
+        if cel_env:
+            return cel_env
+
+        # Hand Environment a copy, so the caller's mapping is not mutated.
+        cel_env = celpy.Environment(annotations=dict(annotations))
+        _ENVIRONMENTS[environment_key] = cel_env
+
+        if annotations is koreo_function_annotations:
+            _default_environment = cel_env
+
+    return cel_env
+
 
 def prepare_expression(
     cel_env: celpy.Environment, spec: Any | None, location: str
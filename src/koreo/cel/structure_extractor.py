@@ -1,81 +1,197 @@
+import weakref
+
 from lark import Tree, Token
 
+type PathTrie = dict[str, PathTrie]
+
+# Extracted paths, keyed by the id of the compiled expression. Entries are
+# dropped once the expression is garbage collected.
+_PATH_CACHE: dict[int, frozenset[tuple[str, ...]]] = {}
+
 
 def extract_argument_structure(compiled: Tree) -> set[str]:
-    var_map: set[str] = set()
+    return {".".join(path) for path in _extract_paths(compiled)}
+
+
+def extract_argument_trie(compiled: Tree) -> PathTrie:
+    """Return the accessed paths as a trie, so that the members used under a
+    root (for instance `steps` or `parent`) can be directly looked up.
+    """
+    trie: PathTrie = {}
+    for path in _extract_paths(compiled):
+        node = trie
+        for segment in path:
+            node = node.setdefault(segment, {})
+
+    return trie
+
+
+def trie_paths(trie: PathTrie) -> set[str]:
+    """Flatten a trie back into dotted paths, including every prefix."""
+    paths: set[str] = set()
+
+    pending: list[tuple[str, PathTrie]] = [
+        (segment, children) for segment, children in trie.items()
+    ]
+    while pending:
+        path, children = pending.pop()
+        paths.add(path)
+        pending.extend(
+            (f"{path}.{segment}", grandchildren)
+            for segment, grandchildren in children.items()
+        )
+
+    return paths
+
+
+def extract_read_paths(compiled: Tree) -> frozenset[tuple[str, ...]]:
+    """Return the paths whose values the expression uses as a whole.
+
+    Unlike the argument trie, this includes bare identifiers (`parent` passed
+    to a function) and values indexed by a computed key (`parent.spec` in
+    `parent.spec[inputs.key]`), and omits the prefixes of accessed members.
+    """
+    node_paths: dict[int, tuple[str, ...] | None] = {}
+    accessed: set[int] = set()
     for thing in compiled.iter_subtrees():
+        if thing.data == "primary":
+            if thing.children[0].data == "ident":
+                node_paths[id(thing)] = (f"{thing.children[0].children[0]}",)
+            continue
+
         if thing.data == "member_dot":
-            member_dot: str = _process_member_dot(thing)
-            var_map.add(member_dot)
+            segment = f"{thing.children[1]}"
+        elif thing.data == "member_index":
+            segment = _literal_index(thing.children[1])
+        else:
+            continue
+
+        root: Tree = thing.children[0].children[0]
+        if id(root) not in node_paths:
+            # Members of a method call's result are not paths.
+            continue
+
+        root_path = node_paths[id(root)]
+        if segment is None:
+            # Any member of the root may be read, so it is read as a whole;
+            # nothing beneath the computed index is a known path.
+            node_paths[id(thing)] = None
+            continue
+
+        accessed.add(id(root))
+        node_paths[id(thing)] = None if root_path is None else (*root_path, segment)
+
+    return frozenset(
+        path
+        for node_id, path in node_paths.items()
+        if path is not None and node_id not in accessed
+    )
+
+
+def _literal_index(terminal: Tree) -> str | None:
+    """The value of an index which is a literal, or `None` if it is computed."""
+    while isinstance(terminal, Tree) and len(terminal.children) == 1:
+        if terminal.data == "primary":
+            if terminal.children[0].data == "literal":
+                return _process_primary(terminal)
+            return None
+
+        terminal = terminal.children[0]
+
+    return None
+
+
+def _extract_paths(compiled: Tree) -> frozenset[tuple[str, ...]]:
+    cache_key = id(compiled)
+    cached = _PATH_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # `iter_subtrees` yields children before their parents, so each member
+    # access is computed once, extending the already computed path of its
+    # root rather than re-walking the access chain.
+    member_paths: dict[int, tuple[str, ...]] = {}
+    paths: set[tuple[str, ...]] = set()
+    for thing in compiled.iter_subtrees():
+        if thing.data == "member_dot":
+            path = _process_member_dot(thing, member_paths)
 
-        if thing.data == "member_index":
-            member_index: str = _process_member_index(thing)
-            var_map.add(member_index)
+        elif thing.data == "member_index":
+            path = _process_member_index(thing, member_paths)
 
-    return var_map
+        else:
+            continue
 
+        member_paths[id(thing)] = path
+        paths.add(path)
 
-def _process_member_dot(tree: Tree):
-    if len(tree.children) != 2:
-        # TODO: Not sure this is possible?
-        raise Exception(f"UNKNOWN MEMBER_DOT LENGTH! {len(tree.children)}: {tree}")
+    extracted = frozenset(paths)
+    _PATH_CACHE[cache_key] = extracted
+    weakref.finalize(compiled, _PATH_CACHE.pop, cache_key, None)
 
-    # print(f"{len(tree.children)}: {tree.children[0]}")
+    return extracted
 
-    terminal = f"{tree.children[1]}"
 
+def _root_path(
+    tree: Tree, member_paths: dict[int, tuple[str, ...]], allow_ident: bool = False
+) -> tuple[str, ...] | None:
     root: Tree = tree.children[0].children[0]
 
-    if root.data == "member_dot":
-        return f"{_process_member_dot(root)}.{terminal}"
-
-    if root.data == "member_index":
-        return f"{_process_member_index(root)}.{terminal}"
+    if root.data == "member_dot" or root.data == "member_index":
+        return member_paths[id(root)]
 
     if root.data == "member_dot_arg":
-        return f"{_process_member_dot_arg(root)}.{terminal}"
+        # Method calls are only part of a path when a member is accessed on
+        # their result, so these are resolved on demand.
+        root_path = member_paths.get(id(root))
+        if root_path is None:
+            root_path = _process_member_dot_arg(root, member_paths)
+            member_paths[id(root)] = root_path
+        return root_path
 
-    if root.data == "primary":
-        return f"{_process_primary(root)}.{terminal}"
+    if root.data == "primary" or (allow_ident and root.data == "ident"):
+        return (_process_primary(root),)
 
-    # TODO: Is this possible?
-    raise Exception(f"UNKNOWN MEMBER_DOT ROOT TYPE! {root}")
+    return None
 
 
-def _process_member_dot_arg(tree: Tree):
-    if len(tree.children) != 3:
+def _process_member_dot(
+    tree: Tree, member_paths: dict[int, tuple[str, ...]]
+) -> tuple[str, ...]:
+    if len(tree.children) != 2:
         # TODO: Not sure this is possible?
-        raise Exception(f"UNKNOWN MEMBER_DOT_ARG LENGTH! {len(tree.children)}: {tree}")
-
-    # print(f"{len(tree.children)}: {tree.children[0]}")
-
-    terminal = f"{tree.children[1]}"
+        raise Exception(f"UNKNOWN MEMBER_DOT LENGTH! {len(tree.children)}: {tree}")
 
-    root: Tree = tree.children[0].children[0]
+    root_path = _root_path(tree, member_paths)
+    if root_path is None:
+        # TODO: Is this possible?
+        raise Exception(f"UNKNOWN MEMBER_DOT ROOT TYPE! {tree.children[0]}")
 
-    if root.data == "member_dot":
-        return f"{_process_member_dot(root)}.{terminal}"
+    return (*root_path, f"{tree.children[1]}")
 
-    if root.data == "member_index":
-        return f"{_process_member_index(root)}.{terminal}"
 
-    if root.data == "member_dot_arg":
-        return f"{_process_member_dot_arg(root)}.{terminal}"
+def _process_member_dot_arg(
+    tree: Tree, member_paths: dict[int, tuple[str, ...]]
+) -> tuple[str, ...]:
+    if len(tree.children) != 3:
+        # TODO: Not sure this is possible?
+        raise Exception(f"UNKNOWN MEMBER_DOT_ARG LENGTH! {len(tree.children)}: {tree}")
 
-    if root.data == "primary" or root.data == "ident":
-        return f"{_process_primary(root)}.{terminal}"
+    root_path = _root_path(tree, member_paths, allow_ident=True)
+    if root_path is None:
+        # TODO: Is this possible?
+        raise Exception(f"UNKNOWN MEMBER_DOT_ARG ROOT TYPE! {tree.children[0]}")
 
-    # TODO: Is this possible?
-    raise Exception(f"UNKNOWN MEMBER_DOT_ARG ROOT TYPE! {root}")
+    return (*root_path, f"{tree.children[1]}")
 
 
-def _process_member_index(tree: Tree):
+def _process_member_index(
+    tree: Tree, member_paths: dict[int, tuple[str, ...]]
+) -> tuple[str, ...]:
     if len(tree.children) != 2:
         # TODO: Not sure this is possible?
         raise Exception(f"UNKNOWN MEMBER_INDEX LENGTH! {len(tree.children)}: {tree}")
 
-    # print(f"{len(tree.children)}: {tree.children[0]}")
-
     terminal: Tree = tree.children[1]
 
     if terminal.data == "primary":
@@ -96,20 +212,11 @@ def _process_member_index(tree: Tree):
     else:
         raise Exception(f"UNKNOWN MEMBER_INDEX terminal TYPE: {terminal}")
 
-    root: Tree = tree.children[0].children[0]
-
-    if root.data == "member_dot":
-        root_value = _process_member_dot(root)
-    elif root.data == "member_index":
-        root_value = _process_member_index(root)
-    elif root.data == "member_dot_arg":
-        root_value = _process_member_dot_arg(root)
-    elif root.data == "primary":
-        root_value: str = _process_primary(root)
-    else:
-        raise Exception(f"UNKNOWN MEMBER_INDEX root TYPE: {root}")
+    root_path = _root_path(tree, member_paths)
+    if root_path is None:
+        raise Exception(f"UNKNOWN MEMBER_INDEX root TYPE: {tree.children[0]}")
 
-    return f"{root_value}.{terminal_value}"
+    return (*root_path, terminal_value)
 
 
 def _process_primary(tree: Tree) -> str:
@@ -118,8 +225,6 @@ def _process_primary(tree: Tree) -> str:
 
     primary: Tree = tree.children[0]
 
-    # print(f"{len(tree.children)}: {primary}")
-
     if primary.data == "ident":
         return f"{primary.children[0]}"
 
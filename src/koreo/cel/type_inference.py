@@ -0,0 +1,136 @@
+from lark import Token, Tree
+
+import celpy
+from celpy import celtypes
+
+from koreo.result import PermFail
+
+CelType = type[celtypes.Value]
+
+_LITERAL_TYPES: dict[str, CelType] = {
+    "BOOL_LIT": celtypes.BoolType,
+    "INT_LIT": celtypes.IntType,
+    "UINT_LIT": celtypes.UintType,
+    "FLOAT_LIT": celtypes.DoubleType,
+    "STRING_LIT": celtypes.StringType,
+    "MLSTRING_LIT": celtypes.StringType,
+    "BYTES_LIT": celtypes.BytesType,
+    "NULL_LIT": celtypes.NullType,
+}
+
+_FUNCTION_TYPES: dict[str, CelType] = {
+    "has": celtypes.BoolType,
+    "size": celtypes.IntType,
+    "bool": celtypes.BoolType,
+    "int": celtypes.IntType,
+    "uint": celtypes.UintType,
+    "double": celtypes.DoubleType,
+    "string": celtypes.StringType,
+    "bytes": celtypes.BytesType,
+}
+
+_METHOD_TYPES: dict[str, CelType] = {
+    "all": celtypes.BoolType,
+    "exists": celtypes.BoolType,
+    "exists_one": celtypes.BoolType,
+    "contains": celtypes.BoolType,
+    "startsWith": celtypes.BoolType,
+    "endsWith": celtypes.BoolType,
+    "matches": celtypes.BoolType,
+    "size": celtypes.IntType,
+    "map": celtypes.ListType,
+    "filter": celtypes.ListType,
+}
+
+# Nodes which, with a single child, simply wrap the next precedence level.
+_PASS_THROUGH = {
+    "expr",
+    "conditionalor",
+    "conditionaland",
+    "relation",
+    "addition",
+    "multiplication",
+    "unary",
+    "member",
+    "primary",
+    "paren_expr",
+}
+
+
+def infer_result_type(compiled: Tree) -> CelType | None:
+    """Return the celtypes type `compiled` is proven to evaluate to, or `None`
+    if it can not be determined without evaluating it.
+
+    This is intentionally conservative; only the expression's structure is
+    used, such as comparisons, logical operators and literals. Anything that
+    depends on runtime values (field access, for instance) is unknown.
+    """
+    node = compiled
+    while True:
+        match node:
+            case Tree(data=data, children=[Tree() as child]) if data in _PASS_THROUGH:
+                node = child
+
+            case Tree(data="expr", children=[_, when_true, when_false]):
+                true_type = infer_result_type(when_true)
+                if true_type and true_type == infer_result_type(when_false):
+                    return true_type
+                return None
+
+            case Tree(
+                data="conditionalor" | "conditionaland" | "relation", children=[_, _]
+            ):
+                return celtypes.BoolType
+
+            case Tree(data="unary", children=[Tree(data="unary_not"), _]):
+                return celtypes.BoolType
+
+            case Tree(data="literal", children=[Token(type=token_type)]):
+                return _LITERAL_TYPES.get(token_type)
+
+            case Tree(data="map_lit"):
+                return celtypes.MapType
+
+            case Tree(data="list_lit"):
+                return celtypes.ListType
+
+            case Tree(data="ident_arg", children=[Token() as function, *_]):
+                return _FUNCTION_TYPES.get(function.value)
+
+            case Tree(data="member_dot_arg", children=[_, Token() as method, *_]):
+                return _METHOD_TYPES.get(method.value)
+
+            case Tree(data="unary", children=[Tree(data="unary_neg"), operand]):
+                match infer_result_type(operand):
+                    case celtypes.IntType | celtypes.DoubleType as numeric_type:
+                        return numeric_type
+                return None
+
+            case _:
+                return None
+
+
+def is_proven_type(expression: celpy.Runner, allowed: tuple[CelType, ...]) -> bool:
+    """If `expression` is proven to evaluate to one of the `allowed` types, so
+    its result need not be type checked at runtime.
+    """
+    return infer_result_type(expression.ast) in allowed
+
+
+def check_result_type(
+    expression: celpy.Runner,
+    allowed: tuple[CelType, ...],
+    description: str,
+    location: str,
+) -> PermFail | None:
+    """Return a `PermFail` if `expression` is proven to evaluate to a type
+    outside of `allowed`; unknown types are left to be checked at runtime.
+    """
+    result_type = infer_result_type(expression.ast)
+    if result_type is None or result_type in allowed:
+        return None
+
+    return PermFail(
+        message=f"`{location}` must evaluate to {description}, but always evaluates to {result_type.__name__}.",
+        location=location,
+    )
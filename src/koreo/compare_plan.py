@@ -0,0 +1,69 @@
+from typing import NamedTuple
+
+from koreo.cel.encoder import CEL_PREFIX
+from koreo.constants import KOREO_DIRECTIVE_KEYS
+
+
+class ComparePlan(NamedTuple):
+    """The compare directives of an object, and of its nested objects, as
+    compiled from a static template.
+    """
+
+    as_set: frozenset[str]
+    last_applied: frozenset[str]
+    as_map: dict[str, tuple[int | str, ...]]
+    children: dict[str, "ComparePlan"]
+    has_directives: bool
+
+
+def compile_compare_plan(template) -> ComparePlan | None:
+    """Compile the compare directives within a (spec) template into a plan.
+
+    Only objects whose directives are static are planned; `None` is returned
+    where nothing is known, leaving the directives to be discovered from the
+    target while comparing.
+    """
+    if not isinstance(template, dict):
+        return None
+
+    as_set = template.get("x-koreo-compare-as-set", ())
+    last_applied = template.get("x-koreo-compare-last-applied", ())
+    as_map = template.get("x-koreo-compare-as-map", {})
+
+    if not (
+        _static_names(as_set)
+        and _static_names(last_applied)
+        and isinstance(as_map, dict)
+        and all(_static_names(fields) for fields in as_map.values())
+    ):
+        return None
+
+    children: dict[str, ComparePlan] = {}
+    for key, value in template.items():
+        if key in KOREO_DIRECTIVE_KEYS:
+            continue
+
+        if child_plan := compile_compare_plan(value):
+            children[key] = child_plan
+
+    has_directives = not KOREO_DIRECTIVE_KEYS.isdisjoint(template)
+    if not (has_directives or children):
+        return None
+
+    return ComparePlan(
+        as_set=frozenset(key for key in as_set if key),
+        last_applied=frozenset(key for key in last_applied if key),
+        as_map={
+            key: tuple(field_name for field_name in fields if field_name)
+            for key, fields in as_map.items()
+            if key
+        },
+        children=children,
+        has_directives=has_directives,
+    )
+
+
+def _static_names(names) -> bool:
+    return isinstance(names, (list, tuple)) and all(
+        isinstance(name, str) and not name.startswith(CEL_PREFIX) for name in names
+    )
@@ -8,8 +8,8 @@ from koreo import registry
 from koreo import schema
 from koreo.cache import get_resource_from_cache
 from koreo.cel.evaluation import evaluate
-from koreo.cel.functions import _overlay, koreo_function_annotations
-from koreo.cel.prepare import prepare_overlay_expression
+from koreo.cel.functions import _overlay
+from koreo.cel.prepare import get_cel_environment, prepare_overlay_expression
 from koreo.cel.structure_extractor import extract_argument_structure
 from koreo.result import DepSkip, PermFail, UnwrappedOutcome, is_error, is_unwrapped_ok
 
@@ -62,7 +62,7 @@ async def prepare_function_test(
 
     initial_resource = spec.get("currentResource")
 
-    cel_env = celpy.Environment(annotations=koreo_function_annotations)
+    cel_env = get_cel_environment()
 
     test_cases_spec = spec.get("testCases")
     test_cases = _prepare_test_cases(
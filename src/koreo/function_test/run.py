@@ -55,8 +55,9 @@ class MockApi:
     async def lookup_kind(self, kind: str):
         return (None, kind.lower(), None)
 
-    async def async_get(self, *args, **kwargs):
-        if self._current_resource:
+    async def async_get(self, resource_api=None, name=None, *args, **kwargs):
+        current_name = (self._current_resource or {}).get("metadata", {}).get("name")
+        if self._current_resource and (name is None or current_name in (None, name)):
             # TODO: This should probably be loaded and built from the Function,
             # using _build_resource_config
 
@@ -90,6 +91,8 @@ class MockApi:
 
         if not self._current_resource:
             merged = data
+        elif args and "PATCH" in args:
+            merged = _apply_merge_patch(self._current_resource, data)
         else:
             merged = _merge_overlay(self._current_resource, data)
 
@@ -111,6 +114,27 @@ def _merge_overlay(base, overlay):
     return updated
 
 
+def _apply_merge_patch(target, patch):
+    """Apply an RFC 7386 merge patch, as the API server would: objects are
+    merged, `null` removes a key, and any other value replaces it.
+    """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+
+    if isinstance(target, dict):
+        updated = copy.deepcopy(target)
+    else:
+        updated = {}
+
+    for key, value in patch.items():
+        if value is None:
+            updated.pop(key, None)
+        else:
+            updated[key] = _apply_merge_patch(updated.get(key), value)
+
+    return updated
+
+
 class TestCaseResult(NamedTuple):
     test_pass: bool
 
@@ -8,19 +8,25 @@ from kr8s._objects import APIObject
 import kr8s
 
 import celpy
+from celpy import celtypes
 
 from koreo import cache
 from koreo import constants
 from koreo import registry
 from koreo import schema
-from koreo.cel.functions import koreo_function_annotations
 from koreo.cel.prepare import (
+    get_cel_environment,
     Overlay,
     prepare_expression,
     prepare_map_expression,
     prepare_overlay_expression,
 )
-from koreo.cel.structure_extractor import extract_argument_structure
+from koreo.cel.structure_extractor import (
+    extract_argument_structure,
+    extract_argument_trie,
+)
+from koreo.cel.type_inference import check_result_type
+from koreo.compare_plan import compile_compare_plan
 from koreo.predicate_helpers import predicate_extractor
 from koreo.result import (
     PermFail,
@@ -32,6 +38,7 @@ from koreo.result import (
 from koreo.value_function.structure import ValueFunction
 
 from . import structure
+from .reconcile.kind_lookup import cached_plural_kind, schedule_plural_prefetch
 
 # Try to reduce the incredibly verbose logging from celpy
 logging.getLogger("Environment").setLevel(logging.WARNING)
@@ -54,7 +61,7 @@ async def prepare_resource_function(
             location=_location(cache_key, "spec"),
         )
 
-    env = celpy.Environment(annotations=koreo_function_annotations)
+    env = get_cel_environment()
 
     used_vars = set[str]()
 
@@ -163,6 +170,9 @@ async def prepare_resource_function(
                 overlays=overlays,
                 create=create,
                 update=update,
+                resource_id_inputs=_resource_id_inputs(
+                    resource_id=resource_id, local_values=local_values
+                ),
             ),
             postconditions=postconditions,
             return_value=return_value,
@@ -192,8 +202,14 @@ def _prepare_api_config(
         )
 
     plural = spec.get("plural")
+    if not plural:
+        # Unknown plurals are queued, so that they are all resolved within a
+        # single discovery pass.
+        plural = cached_plural_kind(kind=kind, api_version=api_version)
+
     if not plural:
         plural = constants.PLURAL_LOOKUP_NEEDED
+        schedule_plural_prefetch()
 
     namespaced = spec.get("namespaced", True)
     owned = spec.get("owned", True)
@@ -238,6 +254,31 @@ def _prepare_api_config(
     return (resource_api, resource_id, owned, readonly, delete_if_exists)
 
 
+def _resource_id_inputs(
+    resource_id: celpy.Runner, local_values: celpy.Runner | None
+) -> frozenset[str] | None:
+    """Return the `inputs` keys the resource's name and namespace are computed
+    from, following any `locals` they use.
+    """
+    used = extract_argument_trie(resource_id.ast)
+    if not set(used).issubset(("inputs", "locals")):
+        return None
+
+    input_keys = set(used.get("inputs", {}))
+
+    if "locals" in used:
+        if not local_values:
+            return None
+
+        used_by_locals = extract_argument_trie(local_values.ast)
+        if not set(used_by_locals).issubset(("inputs",)):
+            return None
+
+        input_keys.update(used_by_locals.get("inputs", {}))
+
+    return frozenset(input_keys)
+
+
 def _prepare_resource_template(
     cel_env: celpy.Environment, spec: dict
 ) -> structure.InlineResourceTemplate | structure.ResourceTemplateRef | PermFail:
@@ -252,7 +293,8 @@ def _prepare_resource_template(
                     return structure.InlineResourceTemplate()
                 case celpy.Runner() as template_expression:
                     return structure.InlineResourceTemplate(
-                        template=template_expression
+                        template=template_expression,
+                        compare_plan=compile_compare_plan(resource_template),
                     )
 
         case {"resourceTemplateRef": resource_template_ref}:
@@ -268,6 +310,14 @@ def _prepare_resource_template(
                 case PermFail() as err:
                     return err
                 case celpy.Runner() as name_expression:
+                    if type_error := check_result_type(
+                        name_expression,
+                        allowed=(celtypes.StringType,),
+                        description="a string",
+                        location="spec.resourceTemplateRef.name",
+                    ):
+                        return type_error
+
                     return structure.ResourceTemplateRef(name=name_expression)
 
         case _:
@@ -313,6 +363,15 @@ def _prepare_overlays(
             case None:
                 skip_if = None
             case celpy.Runner() as skip_if:
+                if type_error := check_result_type(
+                    skip_if,
+                    allowed=(celtypes.BoolType,),
+                    description="a bool",
+                    location=f"spec.overlays[{idx}].skipIf",
+                ):
+                    overlays.append(type_error)
+                    continue
+
                 used_inputs.update(extract_argument_structure(skip_if.ast))
 
         match overlay_spec:
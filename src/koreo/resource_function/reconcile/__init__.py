@@ -1,4 +1,5 @@
 from typing import NamedTuple, Sequence
+import asyncio
 import copy
 import json
 import logging
@@ -20,6 +21,7 @@ from koreo.cel.evaluation import (
     evaluate_predicates,
     check_for_celevalerror,
 )
+from koreo.compare_plan import ComparePlan
 from koreo.constants import (
     DEFAULT_LOAD_RETRY_DELAY,
     KOREO_DIRECTIVE_KEYS,
@@ -32,8 +34,19 @@ from koreo.value_function.reconcile import reconcile_value_function
 
 from koreo.resource_function import structure
 
+from . import fingerprint
 from .kind_lookup import get_plural_kind
-from .validate import validate_match
+from .last_applied import extract_last_applied
+from .patch import build_merge_patch
+from .validate import DEFAULT_DIFFERENCE_LIMIT, Difference, collect_differences
+
+# Bound on the differences collected while checking a resource. Beyond this,
+# the full intended resource is patched rather than a minimal patch.
+PATCH_DIFFERENCE_LIMIT = 100
+
+# Number of resources within one namespace, loaded together, at which a single
+# LIST of the namespace is used instead of a GET per resource.
+BULK_LOAD_MIN_RESOURCES = 3
 
 
 class Result(NamedTuple):
@@ -41,43 +54,76 @@ class Result(NamedTuple):
     resource_id: dict | None = None
 
 
+class PrefetchedResource(NamedTuple):
+    """A resource identified before the step managing it was ready to run.
+
+    `resource` is a load of just this resource, `listing` a shared LIST of its
+    namespace; with neither, the step loads the resource itself. `local_values`
+    is set only when the name was computed from the step's own inputs, in which
+    case the step may reuse both.
+    """
+
+    resource_api: type[APIObject]
+    name: str
+    namespace: str | None
+    resource: asyncio.Task | None = None
+    listing: asyncio.Task[dict[str, APIObject] | None] | None = None
+    local_values: celtypes.MapType | None = None
+
+
 async def reconcile_resource_function(
     api: kr8s.Api,
     location: str,
     function: structure.ResourceFunction,
     owner: tuple[str, dict],
     inputs: celtypes.Value,
+    prefetched: PrefetchedResource | None = None,
+    preconditions_checked: bool = False,
+    local_values: celtypes.MapType | None = None,
 ) -> Result:
+    """Reconcile the ResourceFunction's resource.
+
+    Callers which already checked the preconditions, or evaluated `locals`,
+    for these `inputs` may say so to avoid repeating the work.
+    """
     full_inputs: dict[str, celtypes.Value] = {
         "inputs": inputs,
     }
 
-    if precondition_error := evaluate_predicates(
-        predicates=function.preconditions,
-        inputs=full_inputs,
-        location=f"{location}:spec.preconditions",
+    if not preconditions_checked and (
+        precondition_error := evaluate_predicates(
+            predicates=function.preconditions,
+            inputs=full_inputs,
+            location=f"{location}:spec.preconditions",
+        )
     ):
         return Result(outcome=precondition_error)
 
-    match evaluate(
-        expression=function.local_values,
-        inputs=full_inputs,
-        location=f"{location}:spec.locals",
-    ):
-        case PermFail() as err:
-            return Result(outcome=err)
-        case None:
-            full_inputs["locals"] = celtypes.MapType({})
-        case celtypes.MapType() as local_values:
-            full_inputs["locals"] = local_values
-        case bad_type:
-            # Due to validation within `prepare`, this should never happen.
-            return Result(
-                outcome=PermFail(
-                    message=f"Invalid `locals` expression type ({type(bad_type)})",
-                    location=f"{location}:spec.locals",
+    if local_values is None and prefetched:
+        local_values = prefetched.local_values
+
+    if local_values is not None:
+        full_inputs["locals"] = local_values
+    else:
+        match evaluate(
+            expression=function.local_values,
+            inputs=full_inputs,
+            location=f"{location}:spec.locals",
+        ):
+            case PermFail() as err:
+                return Result(outcome=err)
+            case None:
+                full_inputs["locals"] = celtypes.MapType({})
+            case celtypes.MapType() as evaluated_locals:
+                full_inputs["locals"] = evaluated_locals
+            case bad_type:
+                # Due to validation within `prepare`, this should never happen.
+                return Result(
+                    outcome=PermFail(
+                        message=f"Invalid `locals` expression type ({type(bad_type)})",
+                        location=f"{location}:spec.locals",
+                    )
                 )
-            )
 
     ###########################
     # Start Kubernetes Specific
@@ -88,6 +134,7 @@ async def reconcile_resource_function(
         crud_config=function.crud_config,
         owner=owner,
         inputs=full_inputs,
+        prefetched=prefetched,
     )
     resource_id = reconcile_result.resource_id
     if resource_id:
@@ -129,58 +176,24 @@ async def reconcile_krm_resource(
     crud_config: structure.CRUDConfig,
     owner: tuple[str, dict],
     inputs: dict[str, celtypes.Value],
+    prefetched: PrefetchedResource | None = None,
 ) -> ReconcileResult:
-    match evaluate(
-        expression=crud_config.resource_id,
-        inputs=inputs,
-        location="spec.apiConfig.name",
+    if (
+        prefetched
+        and prefetched.local_values is not None
+        and prefetched.local_values is inputs.get("locals")
     ):
-        case PermFail(message=message, location=name_location):
-            return ReconcileResult(
-                result=PermFail(
-                    message=message,
-                    location=(
-                        name_location if name_location else f"spec.apiConfig.name"
-                    ),
-                )
-            )
-
-        case None:
-            return ReconcileResult(
-                result=PermFail(
-                    message="Could not evaluate `spec.apiConfig.name`, evaluated to `null`",
-                    location=f"spec.apiConfig.name",
-                )
-            )
-
-        case celtypes.MapType({"name": name_value}) as resource_name_values:
-            name = f"{name_value}"
-            namespace_value = resource_name_values.get("namespace")
-            if namespace_value:
-                namespace = f"{namespace_value}"
-            else:
-                namespace = None
-
-            if not namespace and crud_config.resource_api.namespaced:
-                return ReconcileResult(
-                    result=PermFail(
-                        message="`namespace` is required when `spec.apiConfig.namespaced` is `true`",
-                        location=f"spec.apiConfig.namespace",
-                    )
-                )
-
-        case bad_type:
-            # Due to validation within `prepare`, this should never happen.
-            return ReconcileResult(
-                result=PermFail(
-                    message=f"Invalid `spec.apiConfig.name` expression type ({type(bad_type)})",
-                    location=f"spec.apiConfig.name",
-                )
-            )
+        # Computed from these very inputs, so there is no need to repeat it.
+        name, namespace = prefetched.name, prefetched.namespace
+    else:
+        match _evaluate_resource_key(crud_config=crud_config, inputs=inputs):
+            case PermFail() as failure:
+                return ReconcileResult(result=failure)
+            case (name, namespace):
+                pass
 
-    # TODO: Would we rather do this at prepare time? Or, perhaps there should
-    # be some other process that ensures we lookup the plurals in advance when
-    # the resource function is loaded?
+    # Plurals are normally resolved in the background once the function is
+    # prepared; this covers those which that could not resolve.
     if crud_config.resource_api.plural == PLURAL_LOOKUP_NEEDED:
         kind = crud_config.resource_api.kind
 
@@ -221,6 +234,7 @@ async def reconcile_krm_resource(
         resource_api=crud_config.resource_api,
         name=name,
         namespace=namespace,
+        prefetched=prefetched,
     )
     if not is_unwrapped_ok(api_resource):
         return ReconcileResult(result=api_resource, resource_id=resource_id)
@@ -264,19 +278,21 @@ async def reconcile_krm_resource(
             resource_id=resource_id,
         )
 
-    expected_resource = await _construct_resource_template(
+    match await _construct_resource_template(
         resource_template=crud_config.resource_template,
         inputs=inputs,
         forced_overlay=forced_overlay,
         full_resource_name=full_resource_name,
-    )
-    if not is_unwrapped_ok(expected_resource):
-        return ReconcileResult(
-            result=expected_resource,
-            resource_id=resource_id,
-        )
+    ):
+        case (expected_resource, compare_plan):
+            pass
+        case failure:
+            return ReconcileResult(result=failure, resource_id=resource_id)
 
     if crud_config.overlays:
+        # Overlays may add directives the template's plan does not know of.
+        compare_plan = None
+
         if not is_unwrapped_ok(crud_config.overlays):
             return ReconcileResult(
                 result=crud_config.overlays,
@@ -321,16 +337,32 @@ async def reconcile_krm_resource(
 
     converted_resource = convert_bools(expected_resource)
 
-    last_applied = _extract_last_applied(api_resource.raw)
+    # If this exact intent was already verified against this resourceVersion,
+    # the full structural compare can be skipped.
+    intent_fingerprint = fingerprint.intent_fingerprint(converted_resource)
+    if owner_reffed and fingerprint.is_known_match(
+        api_resource.raw, intent_fingerprint
+    ):
+        logger.debug(f"{full_resource_name} unchanged, no update required.")
 
-    resource_match = validate_match(
+        return ReconcileResult(result=api_resource.raw, resource_id=resource_id)
+
+    last_applied = extract_last_applied(api_resource.raw)
+
+    # Gather several differences at once, so that the reported reason covers
+    # what the patch will change rather than only the first field found.
+    differences = collect_differences(
         target=converted_resource,
         actual=api_resource.raw,
         last_applied_value=last_applied,
+        limit=PATCH_DIFFERENCE_LIMIT,
+        plan=compare_plan,
     )
-    if resource_match.match and owner_reffed:
+    if not differences and owner_reffed:
         logger.debug(f"{full_resource_name} matched spec, no update required.")
 
+        fingerprint.record_match(api_resource.raw, intent_fingerprint)
+
         return ReconcileResult(result=api_resource.raw, resource_id=resource_id)
 
     match crud_config.update:
@@ -346,7 +378,7 @@ async def reconcile_krm_resource(
                 result=Retry(
                     message=(
                         f"Deleting {full_resource_name} to recreate due to "
-                        f"{' -> '.join(resource_match.differences)}."
+                        f"{_describe_differences(differences, owner_reffed)}."
                     ),
                     delay=delay,
                     location="spec.update.recreate",
@@ -360,14 +392,28 @@ async def reconcile_krm_resource(
                 if not is_unwrapped_ok(owner_refs):
                     return ReconcileResult(result=owner_refs, resource_id=resource_id)
 
-                converted_resource["metadata"]["ownerReferences"] = owner_refs
+            else:
+                owner_refs = None
 
-            await api_resource.patch(_prepare_for_api(converted_resource))
+            if len(differences) < PATCH_DIFFERENCE_LIMIT:
+                patch = _prepare_patch_for_api(
+                    obj=converted_resource,
+                    differences=differences,
+                    resource=api_resource.raw,
+                )
+            else:
+                # Too many to enumerate, send the full intended resource.
+                patch = _prepare_for_api(converted_resource)
+
+            if owner_refs:
+                patch.setdefault("metadata", {})["ownerReferences"] = owner_refs
+
+            await api_resource.patch(patch)
             return ReconcileResult(
                 result=Retry(
                     message=(
                         f"Patching `{full_resource_name}` due to "
-                        f"{' -> '.join(resource_match.differences)}."
+                        f"{_describe_differences(differences, owner_reffed)}."
                     ),
                     delay=delay,
                     location="spec.update.patch",
@@ -376,12 +422,218 @@ async def reconcile_krm_resource(
             )
 
 
+def _evaluate_resource_key(
+    crud_config: structure.CRUDConfig, inputs: dict[str, celtypes.Value]
+) -> tuple[str, str | None] | PermFail:
+    match evaluate(
+        expression=crud_config.resource_id,
+        inputs=inputs,
+        location="spec.apiConfig.name",
+    ):
+        case PermFail(message=message, location=name_location):
+            return PermFail(
+                message=message,
+                location=(name_location if name_location else f"spec.apiConfig.name"),
+            )
+
+        case None:
+            return PermFail(
+                message="Could not evaluate `spec.apiConfig.name`, evaluated to `null`",
+                location=f"spec.apiConfig.name",
+            )
+
+        case celtypes.MapType({"name": name_value}) as resource_name_values:
+            name = f"{name_value}"
+            namespace_value = resource_name_values.get("namespace")
+            if namespace_value:
+                namespace = f"{namespace_value}"
+            else:
+                namespace = None
+
+            if not namespace and crud_config.resource_api.namespaced:
+                return PermFail(
+                    message="`namespace` is required when `spec.apiConfig.namespaced` is `true`",
+                    location=f"spec.apiConfig.namespace",
+                )
+
+            return name, namespace
+
+        case bad_type:
+            # Due to validation within `prepare`, this should never happen.
+            return PermFail(
+                message=f"Invalid `spec.apiConfig.name` expression type ({type(bad_type)})",
+                location=f"spec.apiConfig.name",
+            )
+
+
+def prefetch_api_resource(
+    api: kr8s.Api,
+    function: structure.ResourceFunction,
+    inputs: celtypes.Value,
+) -> PrefetchedResource | None:
+    """Start loading the resource `function` manages, using `inputs` which
+    contain (at least) the keys its name is computed from.
+
+    Nothing is loaded if the name can not be computed; any problem is reported
+    once the function is actually reconciled.
+    """
+    resource_key = _prefetch_key(function=function, inputs=inputs)
+    if not resource_key:
+        return None
+
+    # Only a subset of the step's inputs may be present, so the `locals` are
+    # not kept for reuse.
+    name, namespace, _ = resource_key
+    resource_api = function.crud_config.resource_api
+
+    return PrefetchedResource(
+        resource_api=resource_api,
+        name=name,
+        namespace=namespace,
+        resource=asyncio.create_task(
+            load_api_resource(
+                api=api,
+                resource_api=resource_api,
+                name=name,
+                namespace=namespace,
+            ),
+            name=f"prefetch:{resource_api.kind}:{name}",
+        ),
+    )
+
+
+def prefetch_api_resources(
+    api: kr8s.Api,
+    function: structure.ResourceFunction,
+    inputs: Sequence[celtypes.Value],
+    local_values: celtypes.MapType | None = None,
+) -> list[PrefetchedResource | None]:
+    """Identify the resources `function` manages for each of `inputs`, which
+    are the full inputs of each item. `local_values`, if given, are used rather
+    than evaluating `locals` for every item.
+
+    When at least BULK_LOAD_MIN_RESOURCES are in one namespace, they are all
+    resolved by a single (paginated) LIST of that namespace. Others, or all
+    should the LIST fail, are loaded individually when their item runs.
+    """
+    resource_keys = [
+        _prefetch_key(function=function, inputs=item_inputs, local_values=local_values)
+        for item_inputs in inputs
+    ]
+
+    namespace_counts: dict[str | None, int] = {}
+    for resource_key in resource_keys:
+        if resource_key:
+            _, namespace, _ = resource_key
+            namespace_counts[namespace] = namespace_counts.get(namespace, 0) + 1
+
+    resource_api = function.crud_config.resource_api
+
+    listings: dict[str | None, asyncio.Task[dict[str, APIObject] | None]] = {
+        namespace: asyncio.create_task(
+            _list_api_resources(
+                api=api, resource_api=resource_api, namespace=namespace
+            ),
+            name=f"prefetch:{resource_api.kind}:{namespace}",
+        )
+        for namespace, count in namespace_counts.items()
+        if count >= BULK_LOAD_MIN_RESOURCES
+    }
+
+    prefetched: list[PrefetchedResource | None] = []
+    for resource_key in resource_keys:
+        if not resource_key:
+            prefetched.append(None)
+            continue
+
+        name, namespace, item_local_values = resource_key
+        prefetched.append(
+            PrefetchedResource(
+                resource_api=resource_api,
+                name=name,
+                namespace=namespace,
+                listing=listings.get(namespace),
+                local_values=item_local_values,
+            )
+        )
+
+    return prefetched
+
+
+def _prefetch_key(
+    function: structure.ResourceFunction,
+    inputs: celtypes.Value,
+    local_values: celtypes.MapType | None = None,
+) -> tuple[str, str | None, celtypes.MapType] | None:
+    crud_config = function.crud_config
+    if crud_config.resource_api.plural == PLURAL_LOOKUP_NEEDED:
+        return None
+
+    full_inputs: dict[str, celtypes.Value] = {"inputs": inputs}
+
+    if local_values is None:
+        match evaluate(
+            expression=function.local_values,
+            inputs=full_inputs,
+            location="prefetch:spec.locals",
+        ):
+            case None:
+                local_values = celtypes.MapType({})
+            case celtypes.MapType() as evaluated_locals:
+                local_values = evaluated_locals
+            case _:
+                return None
+
+    full_inputs["locals"] = local_values
+
+    match _evaluate_resource_key(crud_config=crud_config, inputs=full_inputs):
+        case PermFail():
+            return None
+        case (name, namespace):
+            return name, namespace, local_values
+
+
+async def _list_api_resources(
+    api: kr8s.Api, resource_api: type[APIObject], namespace: str | None
+) -> dict[str, APIObject] | None:
+    try:
+        return {
+            resource.name: resource
+            async for resource in api.async_get(resource_api, namespace=namespace)
+        }
+    except Exception as err:
+        logger.warning(
+            f"Failure listing {resource_api.kind} in {namespace}, loading "
+            f"individually. ({type(err)}: {err})"
+        )
+        return None
+
+
 async def load_api_resource(
     api: kr8s.Api,
     resource_api: type[APIObject],
     name: str,
     namespace: str | None,
+    prefetched: PrefetchedResource | None = None,
 ):
+    if (
+        prefetched
+        and prefetched.resource_api is resource_api
+        and prefetched.name == name
+        and prefetched.namespace == namespace
+    ):
+        if prefetched.resource:
+            return await prefetched.resource
+
+        if prefetched.listing:
+            # Shielded, as the listing is shared with other items.
+            resources = await asyncio.shield(prefetched.listing)
+
+            # The listing is as current as a GET issued in its place, so
+            # resources absent from it do not exist.
+            if resources is not None:
+                return resources.get(name)
+
     try:
         matches = [
             match
@@ -437,10 +689,10 @@ async def _construct_resource_template(
     ),
     forced_overlay: celtypes.MapType,
     full_resource_name: str,
-):
+) -> tuple[celtypes.MapType, ComparePlan | None] | PermFail | Retry:
     match resource_template:
         case None:
-            return forced_overlay
+            return forced_overlay, None
 
         case structure.ResourceTemplateRef(name=template_name):
             match evaluate(
@@ -477,8 +729,11 @@ async def _construct_resource_template(
                 )
 
             materialized = dynamic_resource_template.template
+            compare_plan = dynamic_resource_template.compare_plan
 
-        case structure.InlineResourceTemplate(template=template):
+        case structure.InlineResourceTemplate(
+            template=template, compare_plan=compare_plan
+        ):
             match evaluate(
                 expression=template,
                 inputs=inputs,
@@ -505,7 +760,7 @@ async def _construct_resource_template(
     # This can not be, it is for type checkers
     assert not isinstance(materialized, celpy.CELEvalError)
 
-    return materialized
+    return materialized, compare_plan
 
 
 async def _materialize_from_overlays(
@@ -819,23 +1074,19 @@ def _validate_owner_reffed(resource_view: dict, owner_ref: dict):
     return False
 
 
-def _extract_last_applied(resource: dict) -> dict | None:
-    if not resource:
-        return None
-
-    metadata = resource.get("metadata")
-    if not metadata:
-        return None
-
-    annotations = metadata.get("annotations")
-    if not annotations:
-        return None
-
-    last_applied = annotations.get(LAST_APPLIED_ANNOTATION)
-    if not last_applied:
-        return None
+def _describe_differences(differences: list[Difference], owner_reffed: bool) -> str:
+    descriptions = [
+        f"{difference.pointer or '/'} {difference.message}"
+        for difference in differences[:DEFAULT_DIFFERENCE_LIMIT]
+    ]
+    if len(differences) > DEFAULT_DIFFERENCE_LIMIT:
+        descriptions.append(
+            f"<{len(differences) - DEFAULT_DIFFERENCE_LIMIT} more differences>"
+        )
+    if not owner_reffed:
+        descriptions.append("<missing ownerReference>")
 
-    return json.loads(last_applied)
+    return "; ".join(descriptions)
 
 
 def _prepare_for_api(obj: dict) -> dict:
@@ -854,6 +1105,24 @@ def _prepare_for_api(obj: dict) -> dict:
     return prepared
 
 
+def _prepare_patch_for_api(
+    obj: dict, differences: list[Difference], resource: dict
+) -> dict:
+    prepared = _strip_koreo_directives(obj)
+
+    patch = build_merge_patch(target=prepared, differences=differences)
+
+    # The last-applied value is only rewritten when the intent changed.
+    dumped = json.dumps(prepared)
+    annotations = resource.get("metadata", {}).get("annotations") or {}
+    if annotations.get(LAST_APPLIED_ANNOTATION) != dumped:
+        patch_metadata = patch.setdefault("metadata", {})
+        patch_annotations = patch_metadata.setdefault("annotations", {})
+        patch_annotations[LAST_APPLIED_ANNOTATION] = dumped
+
+    return patch
+
+
 def _strip_koreo_directives[T](obj: T) -> T:
     match obj:
         case dict():
@@ -0,0 +1,68 @@
+from koreo.cache_helpers import bounded_insert, canonical_digest
+
+# Bound on the number of resources with a remembered match.
+MATCH_CACHE_SIZE = 4096
+
+# Keyed by resource uid, the resourceVersion and intent fingerprint which were
+# last verified to match.
+_matched: dict[str, tuple[str, str]] = {}
+
+
+def intent_fingerprint(intent: dict) -> str | None:
+    """Return a stable hash of the (converted) intended resource, or `None` if
+    it can not be canonically encoded.
+    """
+    try:
+        return canonical_digest(intent)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_known_match(resource: dict, fingerprint: str | None) -> bool:
+    """Check if `resource`, at its current resourceVersion, was already
+    verified to match the intent with `fingerprint`.
+    """
+    if not fingerprint:
+        return False
+
+    resource_key = _resource_key(resource)
+    if not resource_key:
+        return False
+
+    uid, resource_version = resource_key
+
+    return _matched.get(uid) == (resource_version, fingerprint)
+
+
+def record_match(resource: dict, fingerprint: str | None) -> None:
+    """Remember that `resource`, at its current resourceVersion, matches the
+    intent with `fingerprint`.
+    """
+    if not fingerprint:
+        return
+
+    resource_key = _resource_key(resource)
+    if not resource_key:
+        return
+
+    uid, resource_version = resource_key
+
+    bounded_insert(_matched, uid, (resource_version, fingerprint), MATCH_CACHE_SIZE)
+
+
+def _resource_key(resource: dict) -> tuple[str, str] | None:
+    metadata = resource.get("metadata")
+    if not metadata:
+        return None
+
+    uid = metadata.get("uid")
+    resource_version = metadata.get("resourceVersion")
+    if not (uid and resource_version):
+        return None
+
+    return uid, resource_version
+
+
+def _reset():
+    """Helper for unit testing; not intended for usage in normal code."""
+    _matched.clear()
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import time
 
 import kr8s.asyncio
 
@@ -7,22 +8,228 @@ logger = logging.getLogger("koreo.resource_function.reconcile")
 
 LOOKUP_TIMEOUT = 15
 
+# How long a kind which was not found, or whose lookup repeatedly timed out,
+# is remembered before it is looked up again.
+MISSING_KIND_TTL = 60
+FAILED_LOOKUP_TTL = 15
+
 _plural_map: dict[str, str] = {}
 
 _lookup_locks: dict[str, asyncio.Event] = {}
 
+# Negative entries, keyed by lookup kind, holding their (monotonic) expiry.
+_missing_kinds: dict[str, float] = {}
+_failed_lookups: dict[str, float] = {}
+
+# Kinds which were missing, but whose entry expired. The API's discovery data
+# is cached (by kr8s, for hours), so would still omit them; they are instead
+# looked up in their group-version's discovery.
+_recheck_kinds: set[str] = set()
+
+# Kinds whose plural is needed, but not yet known; keyed by lookup kind.
+_pending_kinds: dict[str, tuple[str, str]] = {}
+
+# Set while a discovery pass is running, so concurrent lookups can wait on it.
+_prefetching: asyncio.Event | None = None
+
+# The background discovery pass started by `schedule_plural_prefetch`.
+_scheduled: asyncio.Task | None = None
+
+
+def _lookup_kind(kind: str, api_version: str) -> str:
+    if api_version == "v1":
+        return f"{kind}"
+
+    return f"{kind}.{api_version}"
+
+
+def cached_plural_kind(kind: str, api_version: str) -> str | None:
+    """Return the plural of kind, if already known, otherwise queue the kind
+    to be resolved within the next discovery pass. Kinds recently found to be
+    missing are not queued.
+    """
+    lookup_kind = _lookup_kind(kind=kind, api_version=api_version)
+
+    plural_kind = _plural_map.get(lookup_kind)
+    if not plural_kind and not _is_negative(_missing_kinds, lookup_kind):
+        _pending_kinds[lookup_kind] = (kind, api_version)
+
+    return plural_kind
+
+
+async def prefetch_plural_kinds(api: kr8s.asyncio.Api) -> None:
+    """Resolve every queued kind using a single API discovery pass."""
+    global _prefetching
+
+    if _prefetching:
+        try:
+            await asyncio.wait_for(_prefetching.wait(), timeout=LOOKUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        return
+
+    pending = {
+        (kind, api_version): lookup_kind
+        for lookup_kind, (kind, api_version) in _pending_kinds.items()
+        if lookup_kind not in _plural_map
+    }
+    _pending_kinds.clear()
+
+    if not pending:
+        return
+
+    recheck_versions = {
+        api_version
+        for (_, api_version), lookup_kind in pending.items()
+        if lookup_kind in _recheck_kinds
+    }
+
+    prefetching = _prefetching = asyncio.Event()
+    try:
+        async with asyncio.timeout(LOOKUP_TIMEOUT):
+            api_resources = []
+            for api_version in sorted(recheck_versions):
+                api_resources.extend(await _discover_group_version(api, api_version))
+
+            if {api_version for _, api_version in pending} - recheck_versions:
+                api_resources.extend(await api.api_resources())
+
+        _record_discovered(pending=pending, api_resources=api_resources)
+        _recheck_kinds.difference_update(pending.values())
+    except Exception as err:
+        logger.warning(f"API discovery for {len(pending)} kinds failed ({err}).")
+    finally:
+        _prefetching = None
+        prefetching.set()
+
+
+def schedule_plural_prefetch() -> None:
+    """Resolve the queued kinds in the background, using the default API
+    client, so that they are known before the ResourceFunctions which need
+    them are reconciled. Kinds this fails to resolve are looked up on use.
+    """
+    global _scheduled
+
+    if _scheduled or not _pending_kinds:
+        return
+
+    _scheduled = asyncio.create_task(
+        _prefetch_pending_kinds(), name="prefetch:plural-kinds"
+    )
+
+
+async def _prefetch_pending_kinds():
+    global _scheduled
+
+    try:
+        api = await kr8s.asyncio.api()
+
+        # Kinds queued while a pass runs are resolved by a following pass.
+        while _pending_kinds:
+            await prefetch_plural_kinds(api)
+    except Exception as err:
+        logger.info(f"Kinds will be looked up on use, discovery unavailable ({err}).")
+    finally:
+        _scheduled = None
+
+
+async def _discover_group_version(
+    api: kr8s.asyncio.Api, api_version: str
+) -> list[dict]:
+    """Fetch the (uncached) discovery of a single group-version, in the form
+    of `api.api_resources()`.
+    """
+    base = "/apis" if "/" in api_version else "/api"
+    async with api.call_api(
+        method="GET", version="", base=base, url=api_version, raise_for_status=False
+    ) as response:
+        if response.status_code == 404:
+            # The group-version is not (yet) served.
+            return []
+
+        response.raise_for_status()
+        discovery = response.json()
+
+    return [
+        {"version": api_version, **resource}
+        for resource in discovery.get("resources", ())
+        if "/" not in resource.get("name", "")
+    ]
+
+
+async def _lookup_plural_kind(
+    api: kr8s.asyncio.Api, lookup_kind: str, kind: str, api_version: str
+) -> str:
+    """Return the plural of the kind, raising `ValueError` if it is not found."""
+    if lookup_kind not in _recheck_kinds:
+        (_, plural_kind, _) = await api.lookup_kind(lookup_kind)
+        return plural_kind
+
+    for api_resource in await _discover_group_version(api, api_version):
+        if api_resource.get("kind") == kind:
+            _recheck_kinds.discard(lookup_kind)
+            return api_resource["name"]
+
+    _recheck_kinds.discard(lookup_kind)
+    raise ValueError(f"Kind {kind} not found.")
+
+
+def _record_discovered(pending: dict[tuple[str, str], str], api_resources: list[dict]):
+    for api_resource in api_resources:
+        lookup_kind = pending.get(
+            (api_resource.get("kind"), api_resource.get("version"))
+        )
+        if not lookup_kind or lookup_kind in _plural_map:
+            continue
+
+        _plural_map[lookup_kind] = api_resource["name"]
+
+    # A full discovery pass which did not include a kind means it is missing.
+    missing_expiry = time.monotonic() + MISSING_KIND_TTL
+    for lookup_kind in pending.values():
+        if lookup_kind not in _plural_map:
+            logger.error(f"Failed to find Kind (`{lookup_kind}`) information.")
+            _missing_kinds[lookup_kind] = missing_expiry
+
+
+def _is_negative(negative_entries: dict[str, float], lookup_kind: str) -> bool:
+    expiry = negative_entries.get(lookup_kind)
+    if expiry is None:
+        return False
+
+    if expiry > time.monotonic():
+        return True
+
+    del negative_entries[lookup_kind]
+    if negative_entries is _missing_kinds:
+        _recheck_kinds.add(lookup_kind)
+    return False
+
 
 async def get_plural_kind(
     api: kr8s.asyncio.Api, kind: str, api_version: str
 ) -> str | None:
-    if api_version == "v1":
-        lookup_kind = f"{kind}"
-    else:
-        lookup_kind = f"{kind}.{api_version}"
+    lookup_kind = _lookup_kind(kind=kind, api_version=api_version)
 
     if lookup_kind in _plural_map:
         return _plural_map[lookup_kind]
 
+    if _is_negative(_missing_kinds, lookup_kind):
+        return None
+
+    if _is_negative(_failed_lookups, lookup_kind):
+        raise Exception(f"Recent lookups of plural kind for {lookup_kind} failed.")
+
+    if lookup_kind in _pending_kinds or _prefetching:
+        # Resolve this, and every other queued kind, in one discovery pass.
+        await prefetch_plural_kinds(api)
+
+        if lookup_kind in _plural_map:
+            return _plural_map[lookup_kind]
+
+        if lookup_kind in _missing_kinds:
+            return None
+
     lookup_lock = _lookup_locks.get(lookup_kind)
     if lookup_lock:
         try:
@@ -33,6 +240,9 @@ async def get_plural_kind(
         if lookup_kind in _plural_map:
             return _plural_map[lookup_kind]
 
+        if lookup_kind in _missing_kinds:
+            return None
+
         raise Exception(f"Waiting on {lookup_kind} failed.")
 
     lookup_lock = asyncio.Event()
@@ -42,19 +252,29 @@ async def get_plural_kind(
         try:
             async with asyncio.timeout(LOOKUP_TIMEOUT):
                 try:
-                    (_, plural_kind, _) = await api.lookup_kind(lookup_kind)
+                    plural_kind = await _lookup_plural_kind(
+                        api=api,
+                        lookup_kind=lookup_kind,
+                        kind=kind,
+                        api_version=api_version,
+                    )
                     break
                 except ValueError:
                     del _lookup_locks[lookup_kind]
                     logger.error(f"Failed to find Kind (`{lookup_kind}`) information.")
+                    _missing_kinds[lookup_kind] = time.monotonic() + MISSING_KIND_TTL
+                    lookup_lock.set()
                     return None
         except asyncio.TimeoutError:
             continue
         except:
             del _lookup_locks[lookup_kind]
+            lookup_lock.set()
             raise
     else:
         del _lookup_locks[lookup_kind]
+        _failed_lookups[lookup_kind] = time.monotonic() + FAILED_LOOKUP_TTL
+        lookup_lock.set()
         raise Exception(
             f"Too many failed attempts to find plural kind for {lookup_kind} failed."
         )
@@ -68,7 +288,21 @@ async def get_plural_kind(
 
 def _reset():
     """Helper for unit testing; not intended for usage in normal code."""
+    global _prefetching, _scheduled
+
+    if _scheduled:
+        _scheduled.cancel()
+        _scheduled = None
+
+    if _prefetching:
+        _prefetching.set()
+        _prefetching = None
+
     _plural_map.clear()
+    _pending_kinds.clear()
+    _missing_kinds.clear()
+    _failed_lookups.clear()
+    _recheck_kinds.clear()
 
     for lock in _lookup_locks.values():
         lock.set()
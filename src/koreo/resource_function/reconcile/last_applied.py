@@ -0,0 +1,87 @@
+import json
+from typing import NamedTuple
+
+from koreo.cache_helpers import bounded_insert
+from koreo.constants import LAST_APPLIED_ANNOTATION
+
+# Bound on the number of resources with a remembered last-applied value.
+LAST_APPLIED_CACHE_SIZE = 4096
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+
+
+# Keyed by resource uid, the resourceVersion and the last-applied value parsed
+# from it. Parsed values are shared, so they must not be mutated.
+_parsed: dict[str, tuple[str, dict | None]] = {}
+
+_hits = 0
+_misses = 0
+_evictions = 0
+
+
+def extract_last_applied(resource: dict) -> dict | None:
+    """Return the parsed last-applied annotation of `resource`.
+
+    The annotation is only parsed once per resourceVersion of a resource.
+    """
+    global _hits, _misses, _evictions
+
+    if not resource:
+        return None
+
+    metadata = resource.get("metadata")
+    if not metadata:
+        return None
+
+    uid = metadata.get("uid")
+    resource_version = metadata.get("resourceVersion")
+    if not (uid and resource_version):
+        return _parse_last_applied(metadata)
+
+    cached = _parsed.get(uid)
+    if cached and cached[0] == resource_version:
+        _hits += 1
+        return cached[1]
+
+    _misses += 1
+
+    last_applied = _parse_last_applied(metadata)
+
+    _evictions += bounded_insert(
+        _parsed, uid, (resource_version, last_applied), LAST_APPLIED_CACHE_SIZE
+    )
+
+    return last_applied
+
+
+def cache_stats() -> CacheStats:
+    return CacheStats(
+        hits=_hits, misses=_misses, evictions=_evictions, size=len(_parsed)
+    )
+
+
+def _parse_last_applied(metadata: dict) -> dict | None:
+    annotations = metadata.get("annotations")
+    if not annotations:
+        return None
+
+    last_applied = annotations.get(LAST_APPLIED_ANNOTATION)
+    if not last_applied:
+        return None
+
+    return json.loads(last_applied)
+
+
+def _reset():
+    """Helper for unit testing; not intended for usage in normal code."""
+    global _hits, _misses, _evictions
+
+    _parsed.clear()
+    _hits = 0
+    _misses = 0
+    _evictions = 0
@@ -0,0 +1,41 @@
+from typing import Iterable
+
+from .validate import Difference
+
+
+def build_merge_patch(target: dict, differences: Iterable[Difference]) -> dict:
+    """Build an RFC 7386 merge patch which sets only the parts of `target`
+    containing the given differences.
+
+    `target` must already be stripped of Koreo directives. Objects are merged,
+    but merge patches replace arrays wholesale, so a difference within an
+    array includes the entire (target) array.
+    """
+    patch: dict = {}
+    replaced: set[tuple[str, ...]] = set()
+
+    for difference in differences:
+        prefix: list[str] = []
+        for segment in difference.path:
+            if not isinstance(segment, str):
+                break
+            prefix.append(segment)
+
+        if not prefix:
+            # The entire object differs.
+            return dict(target)
+
+        if any(tuple(prefix[:depth]) in replaced for depth in range(1, len(prefix))):
+            # Already covered by replacing a containing value.
+            continue
+
+        value = target
+        patch_node = patch
+        for segment in prefix[:-1]:
+            value = value[segment]
+            patch_node = patch_node.setdefault(segment, {})
+
+        patch_node[prefix[-1]] = value[prefix[-1]]
+        replaced.add(tuple(prefix))
+
+    return patch
@@ -1,38 +1,128 @@
-from typing import NamedTuple, Sequence
+from typing import Callable, Hashable, NamedTuple, Sequence
+import functools
 
+from koreo.compare_plan import ComparePlan
 from koreo.constants import KOREO_DIRECTIVE_KEYS
 
+# Bound on the number of differences collected when reporting all of them.
+DEFAULT_DIFFERENCE_LIMIT = 10
+
+_NO_KEYS: frozenset[str] = frozenset()
+_NO_MAP_KEYS: dict[str, tuple[int | str, ...]] = {}
+_NO_CHILD_PLANS: dict[str, ComparePlan] = {}
+
 
 class ResourceMatch(NamedTuple):
     match: bool
     differences: Sequence[str]
 
 
+class Difference(NamedTuple):
+    """A single difference, located by its path within the target."""
+
+    path: tuple[str | int, ...]
+    message: str
+
+    @property
+    def pointer(self) -> str:
+        """The path as an RFC 6901 JSON pointer."""
+        return "".join(
+            f"/{f'{segment}'.replace('~', '~0').replace('/', '~1')}"
+            for segment in self.path
+        )
+
+
 def validate_match(
     target,
     actual,
     last_applied_value=None,
     compare_list_as_set: bool = False,
+    plan: ComparePlan | None = None,
 ) -> ResourceMatch:
     """Compare the specified (`target`) state against the actual (`actual`)
     reosurce state. We compare all target fields and ignore anything extra so
     that defaults, controller set, or explicitly set values do not cause
     compare issues.
     """
+    found: list[Difference] = []
+    _compare(
+        target=target,
+        actual=actual,
+        last_applied_value=last_applied_value,
+        compare_list_as_set=compare_list_as_set,
+        path=[],
+        found=found,
+        limit=1,
+        plan=plan,
+    )
+    return _to_resource_match(found)
+
+
+def collect_differences(
+    target,
+    actual,
+    last_applied_value=None,
+    limit: int = DEFAULT_DIFFERENCE_LIMIT,
+    plan: ComparePlan | None = None,
+) -> list[Difference]:
+    """Compare as `validate_match` does, but rather than stopping at the first
+    difference, collect up to `limit` of them in the same traversal.
+
+    If given, `plan` supplies the compare directives of the target's objects
+    so that they need not be discovered while comparing.
+    """
+    found: list[Difference] = []
+    _compare(
+        target=target,
+        actual=actual,
+        last_applied_value=last_applied_value,
+        compare_list_as_set=False,
+        path=[],
+        found=found,
+        limit=max(limit, 1),
+        plan=plan,
+    )
+    return found
+
+
+def _to_resource_match(found: list[Difference]) -> ResourceMatch:
+    if not found:
+        return ResourceMatch(match=True, differences=())
+
+    difference = found[0]
+
+    differences = [
+        f"at index '{segment}'" if isinstance(segment, int) else f"'{segment}'"
+        for segment in difference.path
+    ]
+    differences.append(difference.message)
+
+    return ResourceMatch(match=False, differences=differences)
 
+
+def _compare(
+    target,
+    actual,
+    last_applied_value,
+    compare_list_as_set: bool,
+    path: list[str | int],
+    found: list[Difference],
+    limit: int,
+    plan: ComparePlan | None = None,
+):
     match (target, actual):
         # Objects need a special comparator
         case dict(), dict():
-            return _validate_dict_match(target, actual, last_applied_value)
+            return _compare_dict(
+                target, actual, last_applied_value, path, found, limit, plan
+            )
         case dict(), _:
-            return ResourceMatch(
-                match=False,
-                differences=[f"<target:object, resource:{type(actual)}>"],
+            return found.append(
+                Difference(tuple(path), f"<target:object, resource:{type(actual)}>")
             )
         case _, dict():
-            return ResourceMatch(
-                match=False,
-                differences=[f"<target:{type(target)}, resource:object>"],
+            return found.append(
+                Difference(tuple(path), f"<target:{type(target)}, resource:object>")
             )
 
         # Arrays need a special comparator
@@ -40,65 +130,70 @@ def validate_match(
             if compare_list_as_set:
                 # Sets must be simple, so if needed last_applied_value is
                 # already the compare value.
-                return _validate_set_match(target, actual)
+                return _compare_set(target, actual, path, found, limit)
 
-            return _validate_list_match(target, actual, last_applied_value)
+            return _compare_list(target, actual, last_applied_value, path, found, limit)
 
         case (list() | tuple(), _):
-            return ResourceMatch(
-                match=False,
-                differences=[f"<target:array, resource:{type(actual)}>"],
+            return found.append(
+                Difference(tuple(path), f"<target:array, resource:{type(actual)}>")
             )
         case (_, list() | tuple()):
-            return ResourceMatch(
-                match=False,
-                differences=[f"<target:{type(target)}, resource:array>"],
+            return found.append(
+                Difference(tuple(path), f"<target:{type(target)}, resource:array>")
             )
 
         # Bool needs a special comparator, due to Python's int truthiness rules
         case bool(), bool():
-            if target == actual:
-                return ResourceMatch(match=True, differences=())
-            else:
-                return ResourceMatch(
-                    match=False,
-                    differences=[f"<target:[{target}], resource:[{actual}]>"],
+            if target != actual:
+                found.append(
+                    Difference(tuple(path), f"<target:[{target}], resource:[{actual}]>")
                 )
+            return
         case bool(), _:
-            return ResourceMatch(
-                match=False,
-                differences=[f"<target:bool, resource:{type(actual)}>"],
+            return found.append(
+                Difference(tuple(path), f"<target:bool, resource:{type(actual)}>")
             )
         case _, bool():
-            return ResourceMatch(
-                match=False,
-                differences=[f"<target:{type(target)}, resource:bool>"],
+            return found.append(
+                Difference(tuple(path), f"<target:{type(target)}, resource:bool>")
             )
 
         case _, None if target:
-            return ResourceMatch(
-                match=False,
-                differences=[f"<target:{type(target)}, resource:null or missing>"],
+            return found.append(
+                Difference(
+                    tuple(path), f"<target:{type(target)}, resource:null or missing>"
+                )
             )
 
         case None, _ if actual:
-            return ResourceMatch(
-                match=False,
-                differences=[f"<target:null, resource:{type(actual)}"],
+            return found.append(
+                Difference(tuple(path), f"<target:null, resource:{type(actual)}")
             )
 
     # Hopefully anything else is a simple type.
-    if target == actual:
-        return ResourceMatch(match=True, differences=())
-    else:
-        return ResourceMatch(
-            match=False,
-            differences=[f"<target:[{target}], resource:[{actual}]>"],
+    if target != actual:
+        found.append(
+            Difference(tuple(path), f"<target:[{target}], resource:[{actual}]>")
         )
 
 
-def _obj_to_key(obj: dict, fields: Sequence[int | str]) -> str:
-    return "$".join(f"{obj.get(field)}".strip() for field in fields)
+@functools.lru_cache(maxsize=256)
+def _key_extractor(fields: tuple[int | str, ...]) -> Callable[[dict], str]:
+    """Build (once per distinct set of fields) the function computing the
+    compare-as-map key of an item.
+    """
+    match fields:
+        case (field,):
+            return lambda obj: f"{obj.get(field)}".strip()
+
+        case (first, second):
+            return lambda obj: (
+                f"{f'{obj.get(first)}'.strip()}${f'{obj.get(second)}'.strip()}"
+            )
+
+        case _:
+            return lambda obj: "$".join(f"{obj.get(field)}".strip() for field in fields)
 
 
 def _list_to_object(
@@ -107,76 +202,191 @@ def _list_to_object(
     if not obj_list:
         return None
 
-    return {_obj_to_key(obj, key_fields): obj for obj in obj_list}
+    key_for = _key_extractor(tuple(key_fields))
+    return {key_for(obj): obj for obj in obj_list}
+
+
+def _canonical(value) -> Hashable:
+    """Return a hashable form of a JSON value, equal for equal values.
+
+    Objects are order-independent and booleans are kept distinct from
+    numbers, matching how values are otherwise compared.
+    """
+    match value:
+        case str() | int() | float() if not isinstance(value, bool):
+            return value
+        case bool():
+            return (bool, value)
+        case dict():
+            return frozenset(
+                [(key, _canonical(sub_value)) for key, sub_value in value.items()]
+            )
+        case list() | tuple():
+            return tuple([_canonical(item) for item in value])
+        case _:
+            return value
 
 
 def _validate_dict_match(
     target: dict, actual: dict, last_applied_value: dict | None = None
 ) -> ResourceMatch:
-    target_keys = set(target.keys()) - KOREO_DIRECTIVE_KEYS
+    found: list[Difference] = []
+    _compare_dict(target, actual, last_applied_value, [], found, 1)
+    return _to_resource_match(found)
+
+
+def _compare_dict(
+    target: dict,
+    actual: dict,
+    last_applied_value: dict | None,
+    path: list[str | int],
+    found: list[Difference],
+    limit: int,
+    plan: ComparePlan | None = None,
+):
+    if plan:
+        if plan.has_directives:
+            target_keys = target.keys() - KOREO_DIRECTIVE_KEYS
+        else:
+            target_keys = target.keys()
+        compare_list_as_set_keys = plan.as_set
+        compare_last_applied_keys = plan.last_applied
+        compare_as_map = plan.as_map
+        child_plans = plan.children
+
+    elif KOREO_DIRECTIVE_KEYS.isdisjoint(target):
+        # The common case, an object without any compare directives.
+        target_keys = target.keys()
+        compare_list_as_set_keys = compare_last_applied_keys = _NO_KEYS
+        compare_as_map = _NO_MAP_KEYS
+        child_plans = _NO_CHILD_PLANS
+
+    else:
+        target_keys = target.keys() - KOREO_DIRECTIVE_KEYS
+
+        compare_list_as_set_keys = {
+            key for key in target.get("x-koreo-compare-as-set", ()) if key
+        }
 
-    compare_list_as_set_keys = {
-        key for key in target.get("x-koreo-compare-as-set", ()) if key
-    }
+        compare_last_applied_keys = {
+            key for key in target.get("x-koreo-compare-last-applied", ()) if key
+        }
 
-    compare_last_applied_keys = {
-        key for key in target.get("x-koreo-compare-last-applied", ()) if key
-    }
+        compare_as_map = {
+            key: tuple(field_name for field_name in fields if field_name)
+            for key, fields in target.get("x-koreo-compare-as-map", {}).items()
+            if key
+        }
 
-    compare_as_map = {
-        key: [field_name for field_name in fields if field_name]
-        for key, fields in target.get("x-koreo-compare-as-map", {}).items()
-        if key
-    }
+        child_plans = _NO_CHILD_PLANS
 
-    if not last_applied_value:
+    if not isinstance(last_applied_value, dict):
         last_applied_value = {}
 
     for target_key in target_keys:
         # TODO: At some point, this will appear outside metadata and eventually
-        # cause a problem. Perhaps `_extract_last_applied` should instead
+        # cause a problem. Perhaps `extract_last_applied` should instead
         # mutate the object for compare?
         if target_key == "ownerReferences":
             continue
 
         # NOTE: I'm not sure this is correct.
-        if target_key not in last_applied_value:
-            last_applied_value[target_key] = None
+        last_applied_key_value = last_applied_value.get(target_key)
+
+        path.append(target_key)
 
         if target_key in compare_last_applied_keys:
-            compare_value = last_applied_value[target_key]
+            compare_value = last_applied_key_value
 
-        else:
-            if target_key not in actual:
-                return ResourceMatch(
-                    match=False, differences=[f"<missing '{target_key}' in resource>"]
-                )
+        elif target_key not in actual:
+            found.append(
+                Difference(tuple(path), f"<missing '{target_key}' in resource>")
+            )
+            path.pop()
+            if len(found) >= limit:
+                return
+            continue
 
+        else:
             compare_value = actual[target_key]
 
         if target_key in compare_as_map:
-            map_keys = compare_as_map[target_key]
-            key_match = validate_match(
-                target=_list_to_object(target[target_key], map_keys),
-                actual=_list_to_object(compare_value, map_keys),
-                last_applied_value=_list_to_object(
-                    last_applied_value[target_key], map_keys
-                ),
+            _compare_map(
+                target=target[target_key],
+                actual=compare_value,
+                last_applied_value=last_applied_key_value,
+                key_fields=compare_as_map[target_key],
+                path=path,
+                found=found,
+                limit=limit,
             )
         else:
-            key_match = validate_match(
+            _compare(
                 target=target[target_key],
                 actual=compare_value,
-                last_applied_value=last_applied_value[target_key],
+                last_applied_value=last_applied_key_value,
                 compare_list_as_set=(target_key in compare_list_as_set_keys),
+                path=path,
+                found=found,
+                limit=limit,
+                plan=child_plans.get(target_key),
             )
 
-        if not key_match.match:
-            differences = [f"'{target_key}'"]
-            differences.extend(key_match.differences)
-            return ResourceMatch(match=False, differences=differences)
+        path.pop()
+        if len(found) >= limit:
+            return
+
+
+def _compare_map(
+    target,
+    actual,
+    last_applied_value,
+    key_fields: Sequence[int | str],
+    path: list[str | int],
+    found: list[Difference],
+    limit: int,
+):
+    actual_map = _list_to_object(actual, key_fields)
+    last_applied_map = _list_to_object(last_applied_value, key_fields)
+
+    if not (target and actual_map):
+        return _compare(
+            target=_list_to_object(target, key_fields),
+            actual=actual_map,
+            last_applied_value=last_applied_map,
+            compare_list_as_set=False,
+            path=path,
+            found=found,
+            limit=limit,
+        )
+
+    if not last_applied_map:
+        last_applied_map = {}
+
+    # Differences are located by the item's index within the target. As with
+    # a mapping, the last item with a given key wins.
+    key_for = _key_extractor(tuple(key_fields))
+    target_map = {key_for(obj): (idx, obj) for idx, obj in enumerate(target)}
 
-    return ResourceMatch(match=True, differences=())
+    for key, (idx, target_value) in target_map.items():
+        path.append(idx)
+
+        if key not in actual_map:
+            found.append(Difference(tuple(path), f"<missing '{key}' in resource>"))
+        else:
+            _compare(
+                target=target_value,
+                actual=actual_map[key],
+                last_applied_value=last_applied_map.get(key),
+                compare_list_as_set=False,
+                path=path,
+                found=found,
+                limit=limit,
+            )
+
+        path.pop()
+        if len(found) >= limit:
+            return
 
 
 def _validate_list_match(
@@ -184,23 +394,34 @@ def _validate_list_match(
     actual: list | tuple,
     last_applied_value: list | tuple | None = None,
 ) -> ResourceMatch:
+    found: list[Difference] = []
+    _compare_list(target, actual, last_applied_value, [], found, 1)
+    return _to_resource_match(found)
+
+
+def _compare_list(
+    target: list | tuple,
+    actual: list | tuple,
+    last_applied_value: list | tuple | None,
+    path: list[str | int],
+    found: list[Difference],
+    limit: int,
+):
     if not target and not actual:
-        return ResourceMatch(match=True, differences=())
+        return
 
     if target is None and actual:
-        return ResourceMatch(match=False, differences=("<expected null array>",))
+        return found.append(Difference(tuple(path), "<expected null array>"))
 
     if target and actual is None:
-        return ResourceMatch(
-            match=False, differences=("<unexpectedly found null array>",)
-        )
+        return found.append(Difference(tuple(path), "<unexpectedly found null array>"))
 
     if len(target) != len(actual):
-        return ResourceMatch(
-            match=False,
-            differences=[
-                f"<length mismatch target:{len(target)}, actual:{len(actual)}"
-            ],
+        return found.append(
+            Difference(
+                tuple(path),
+                f"<length mismatch target:{len(target)}, actual:{len(actual)}",
+            )
         )
 
     if last_applied_value:
@@ -214,64 +435,95 @@ def _validate_list_match(
         else:
             last_applied_item_value = None
 
-        item_match = validate_match(
+        path.append(idx)
+        _compare(
             target=target_value,
             actual=actual_value,
             last_applied_value=last_applied_item_value,
+            compare_list_as_set=False,
+            path=path,
+            found=found,
+            limit=limit,
         )
-        if not item_match.match:
-            differences = [f"at index '{idx}'"]
-            differences.extend(item_match.differences)
-            return ResourceMatch(match=False, differences=differences)
-
-    return ResourceMatch(match=True, differences=())
+        path.pop()
+        if len(found) >= limit:
+            return
 
 
 def _validate_set_match(target: list | tuple, actual: list | tuple) -> ResourceMatch:
+    found: list[Difference] = []
+    _compare_set(target, actual, [], found, 1)
+    return _to_resource_match(found)
+
+
+def _compare_set(
+    target: list | tuple,
+    actual: list | tuple,
+    path: list[str | int],
+    found: list[Difference],
+    limit: int,
+):
     if not target and not actual:
-        return ResourceMatch(match=True, differences=())
+        return
 
     if target is None and actual:
-        return ResourceMatch(match=False, differences=("<expected null set>",))
+        return found.append(Difference(tuple(path), "<expected null set>"))
 
     if target and actual is None:
-        return ResourceMatch(
-            match=False, differences=("<unexpectedly found null set>",)
-        )
+        return found.append(Difference(tuple(path), "<unexpectedly found null set>"))
 
     try:
         target_set = set(target)
         actual_set = set(actual)
-    except TypeError as err:
-        if "dict" in f"{err}":
-            return ResourceMatch(
-                match=False,
-                differences=(
-                    f"Could not compare array-as-set, try: `x-koreo-compare-as-map`",
-                ),
-            )
-
-        return ResourceMatch(
-            match=False, differences=(f"Could not compare array-as-set ({err})",)
-        )
+    except TypeError:
+        # Objects and arrays are compared by their canonical form.
+        return _compare_canonical_set(target, actual, path, found, limit)
     except Exception as err:
-        return ResourceMatch(
-            match=False, differences=(f"Could not compare array-as-set ({err})",)
+        return found.append(
+            Difference(tuple(path), f"Could not compare array-as-set ({err})")
         )
 
-    missing_values = target_set - actual_set
-    unexpected_values = actual_set - target_set
+    for missing_value in target_set - actual_set:
+        found.append(Difference(tuple(path), f"<missing '{missing_value}'>"))
+        if len(found) >= limit:
+            return
 
-    if not (missing_values or unexpected_values):
-        return ResourceMatch(match=True, differences=())
+    for unexpected_value in actual_set - target_set:
+        found.append(
+            Difference(tuple(path), f"<unexpectedly found '{unexpected_value}'>")
+        )
+        if len(found) >= limit:
+            return
 
-    for missing_value in missing_values:
-        return ResourceMatch(match=False, differences=(f"<missing '{missing_value}'>",))
 
-    for unexpected_value in unexpected_values:
-        return ResourceMatch(
-            match=False, differences=(f"<unexpectedly found '{unexpected_value}'>",)
+def _compare_canonical_set(
+    target: list | tuple,
+    actual: list | tuple,
+    path: list[str | int],
+    found: list[Difference],
+    limit: int,
+):
+    try:
+        target_values = {_canonical(value): value for value in target}
+        actual_values = {_canonical(value): value for value in actual}
+    except Exception as err:
+        return found.append(
+            Difference(tuple(path), f"Could not compare array-as-set ({err})")
         )
 
-    # This is impossible
-    return ResourceMatch(match=True, differences=())
+    for missing_key in target_values.keys() - actual_values.keys():
+        found.append(
+            Difference(tuple(path), f"<missing '{target_values[missing_key]}'>")
+        )
+        if len(found) >= limit:
+            return
+
+    for unexpected_key in actual_values.keys() - target_values.keys():
+        found.append(
+            Difference(
+                tuple(path),
+                f"<unexpectedly found '{actual_values[unexpected_key]}'>",
+            )
+        )
+        if len(found) >= limit:
+            return
@@ -5,6 +5,7 @@ from kr8s._objects import APIObject
 import celpy
 
 from koreo.cel.prepare import Overlay
+from koreo.compare_plan import ComparePlan
 from koreo.result import UnwrappedOutcome
 from koreo.value_function.structure import ValueFunction
 
@@ -15,6 +16,7 @@ class ResourceTemplateRef(NamedTuple):
 
 class InlineResourceTemplate(NamedTuple):
     template: celpy.Runner | None = None
+    compare_plan: ComparePlan | None = None
 
 
 class ValueFunctionOverlay(NamedTuple):
@@ -70,6 +72,10 @@ class CRUDConfig(NamedTuple):
     create: Create
     update: Update
 
+    # The `inputs` keys which determine the resource's name and namespace, or
+    # `None` if they depend on anything else.
+    resource_id_inputs: frozenset[str] | None = None
+
 
 class ResourceFunction(NamedTuple):
     name: str
@@ -1,5 +1,7 @@
 import logging
 
+from koreo.compare_plan import compile_compare_plan
+
 logger = logging.getLogger("koreo.resourcetemplate.prepare")
 
 import celpy
@@ -60,6 +62,7 @@ async def prepare_resource_template(
         structure.ResourceTemplate(
             context=context,
             template=template,
+            compare_plan=compile_compare_plan(template_spec),
         ),
         None,
     )
@@ -2,8 +2,12 @@ from typing import NamedTuple
 
 from celpy import celtypes
 
+from koreo.compare_plan import ComparePlan
+
 
 class ResourceTemplate(NamedTuple):
     context: celtypes.MapType
 
     template: celtypes.MapType
+
+    compare_plan: ComparePlan | None = None
@@ -5,8 +5,8 @@ logger = logging.getLogger("koreo.valuefunction.prepare")
 import celpy
 
 from koreo import schema
-from koreo.cel.functions import koreo_function_annotations
 from koreo.cel.prepare import (
+    get_cel_environment,
     Overlay,
     prepare_map_expression,
     prepare_overlay_expression,
@@ -38,7 +38,7 @@ async def prepare_value_function(
             location=_location(cache_key, "spec"),
         )
 
-    env = celpy.Environment(annotations=koreo_function_annotations)
+    env = get_cel_environment()
 
     used_vars = set[str]()
 
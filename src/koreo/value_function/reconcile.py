@@ -13,7 +13,14 @@ async def reconcile_value_function(
     function: ValueFunction,
     inputs: celtypes.Value,
     value_base: celtypes.MapType | None = None,
+    preconditions_checked: bool = False,
+    local_values: celtypes.MapType | None = None,
 ) -> UnwrappedOutcome[celtypes.Value]:
+    """Evaluate the ValueFunction.
+
+    Callers which already checked the preconditions, or evaluated `locals`,
+    for these `inputs` may say so to avoid repeating the work.
+    """
     full_inputs: dict[str, celtypes.Value] = {
         "inputs": inputs,
     }
@@ -22,10 +29,12 @@ async def reconcile_value_function(
     if value_base:
         full_inputs = full_inputs | {celtypes.StringType("resource"): value_base}
 
-    if precondition_error := evaluate_predicates(
-        predicates=function.preconditions,
-        inputs=full_inputs,
-        location=f"{location}:spec.preconditions",
+    if not preconditions_checked and (
+        precondition_error := evaluate_predicates(
+            predicates=function.preconditions,
+            inputs=full_inputs,
+            location=f"{location}:spec.preconditions",
+        )
     ):
         return precondition_error
 
@@ -33,23 +42,26 @@ async def reconcile_value_function(
     if not function.return_value:
         return celpy.json_to_cel(None)
 
-    match evaluate(
-        expression=function.local_values,
-        inputs=full_inputs,
-        location=f"{location}:spec.locals",
-    ):
-        case PermFail() as err:
-            return err
-        case celtypes.MapType() as local_values:
-            full_inputs["locals"] = local_values
-        case None:
-            full_inputs["locals"] = celtypes.MapType({})
-        case bad_type:
-            # Due to validation within `prepare`, this should never happen.
-            return PermFail(
-                message=f"Invalid `locals` expression type ({type(bad_type)})",
-                location=f"{location}:spec.locals",
-            )
+    if local_values is not None:
+        full_inputs["locals"] = local_values
+    else:
+        match evaluate(
+            expression=function.local_values,
+            inputs=full_inputs,
+            location=f"{location}:spec.locals",
+        ):
+            case PermFail() as err:
+                return err
+            case celtypes.MapType() as evaluated_locals:
+                full_inputs["locals"] = evaluated_locals
+            case None:
+                full_inputs["locals"] = celtypes.MapType({})
+            case bad_type:
+                # Due to validation within `prepare`, this should never happen.
+                return PermFail(
+                    message=f"Invalid `locals` expression type ({type(bad_type)})",
+                    location=f"{location}:spec.locals",
+                )
 
     if value_base is None:
         value_base = celtypes.MapType({})
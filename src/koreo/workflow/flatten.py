@@ -0,0 +1,117 @@
+from typing import Sequence
+
+import celpy
+
+from koreo.result import is_unwrapped_ok
+
+from .structure import ErrorStep, Step, SubWorkflowEntry, SubWorkflowExit, Workflow
+
+
+def flatten_sub_workflows(
+    steps: Sequence[Step | ErrorStep],
+) -> list[Step | ErrorStep]:
+    """Inline the steps of each sub-workflow step into `steps`.
+
+    A flattened sub-workflow step is replaced by an entry step, which
+    evaluates the step's inputs, the sub-workflow's steps (labeled
+    `<step>.<sub-step>`), then an exit step which keeps the original label
+    and combines the sub-workflow's outcomes. The Workflow's scheduler then
+    runs the sub-workflow's steps alongside its own.
+    """
+    flattened: list[Step | ErrorStep] = []
+    for step in steps:
+        if _can_flatten(step):
+            flattened.extend(_flatten_step(step))
+        else:
+            flattened.append(step)
+
+    return flattened
+
+
+def _can_flatten(step: Step | ErrorStep) -> bool:
+    if not isinstance(step, Step):
+        return False
+
+    if not isinstance(step.logic, Workflow) or step.for_each:
+        return False
+
+    return is_unwrapped_ok(step.logic.steps_ready) and bool(step.logic.steps)
+
+
+def _flatten_step(step: Step) -> list[Step]:
+    assert isinstance(step.logic, Workflow)
+    sub_workflow = step.logic
+
+    entry_label = f"{step.label}.parent"
+    labels = {
+        sub_step.label: f"{step.label}.{sub_step.label}"
+        for sub_step in sub_workflow.steps
+    }
+
+    entry = step._replace(
+        label=entry_label,
+        logic=SubWorkflowEntry(),
+        condition=None,
+        state=None,
+        prefetch=None,
+        timeout=None,
+    )
+
+    inlined: list[Step] = []
+    exit_steps: list[tuple[str, str, celpy.Runner | None]] = []
+    for sub_step in sub_workflow.steps:
+        # Only sub-workflows which are ready are flattened.
+        assert isinstance(sub_step, Step)
+
+        if sub_step.dependency_labels is None:
+            dependency_labels = {
+                labels[label]: label
+                for label in sub_step.dynamic_input_keys
+                if label in labels
+            }
+        else:
+            dependency_labels = {
+                labels[label]: known_as
+                for label, known_as in sub_step.dependency_labels.items()
+            }
+
+        dynamic_input_keys = set(dependency_labels)
+        if sub_step.parent_step is None:
+            parent_step = entry_label
+        else:
+            parent_step = labels[sub_step.parent_step]
+        dynamic_input_keys.add(parent_step)
+
+        inlined.append(
+            sub_step._replace(
+                label=labels[sub_step.label],
+                dynamic_input_keys=dynamic_input_keys,
+                prefetch=None,
+                parent_step=parent_step,
+                dependency_labels=dependency_labels,
+            )
+        )
+
+        if sub_step.parent_step is None and not isinstance(
+            sub_step.logic, SubWorkflowEntry
+        ):
+            exit_steps.append((labels[sub_step.label], sub_step.label, sub_step.state))
+
+    exit_dependencies = {entry_label}
+    exit_dependencies.update(label for label, _, _ in exit_steps)
+
+    exit = step._replace(
+        logic=SubWorkflowExit(
+            workflow_name=sub_workflow.name,
+            entry=entry_label,
+            steps=tuple(exit_steps),
+        ),
+        skip_if=None,
+        inputs=None,
+        dynamic_input_keys=exit_dependencies,
+        prefetch=None,
+        timeout=None,
+        dependency_labels={label: label for label in exit_dependencies},
+    )
+
+    return [entry, *inlined, exit]
@@ -1,15 +1,27 @@
 from typing import Sequence
 import logging
-import re
+
+from lark import Tree
 
 import celpy
+from celpy import celtypes
 
 from koreo import registry
 from koreo import schema
 from koreo.cache import get_resource_from_cache
-from koreo.cel.functions import koreo_function_annotations
-from koreo.cel.prepare import prepare_expression, prepare_map_expression
-from koreo.cel.structure_extractor import extract_argument_structure
+from koreo.cel.prepare import (
+    get_cel_environment,
+    prepare_expression,
+    prepare_map_expression,
+)
+from koreo.cel.structure_extractor import (
+    PathTrie,
+    extract_argument_structure,
+    extract_argument_trie,
+    extract_read_paths,
+    trie_paths,
+)
+from koreo.cel.type_inference import check_result_type, is_proven_type
 from koreo.resource_function.structure import ResourceFunction
 from koreo.result import (
     Ok,
@@ -24,6 +36,8 @@ from koreo.result import (
 from koreo.value_function.structure import ValueFunction
 
 from . import structure
+from .flatten import flatten_sub_workflows
+from .step_graph import build_step_graph
 
 logger = logging.getLogger("koreo.workflow")
 
@@ -41,7 +55,7 @@ async def prepare_workflow(
             location=_location(cache_key, "spec"),
         )
 
-    cel_env = celpy.Environment(annotations=koreo_function_annotations)
+    cel_env = get_cel_environment()
 
     # Used to  update our cross-reference registries
     watched_resources = set[registry.Resource]()
@@ -66,6 +80,9 @@ async def prepare_workflow(
             )
         )
 
+    if spec.get("flattenSubWorkflows") and is_unwrapped_ok(steps_ready):
+        steps = flatten_sub_workflows(steps)
+
     crd_ref = _build_crd_ref(spec.get("crdRef", {}))
 
     return (
@@ -75,11 +92,95 @@ async def prepare_workflow(
             steps_ready=steps_ready,
             steps=steps,
             dynamic_input_keys=parent_properties,
+            step_graph=build_step_graph(steps),
+            timeout=spec.get("timeoutSeconds"),
+            max_concurrent_steps=spec.get("maxConcurrentSteps"),
+            result_key_paths=_result_key_paths(spec=spec, steps=steps),
         ),
         tuple(watched_resources),
     )
 
 
+def _result_key_paths(
+    spec: dict,
+    steps: Sequence[structure.Step | structure.ErrorStep],
+) -> tuple[str, ...] | None:
+    """The `parent` paths a cached result is keyed by, or `None` if results
+    may not be cached.
+
+    Only Workflows whose steps are all ValueFunctions are cached, as their
+    results depend only upon `parent`. A step reading `parent` as a whole
+    would require keying on the entire trigger, so its Workflow is not cached.
+    """
+    if not spec.get("cacheResults"):
+        return None
+
+    if not all(
+        isinstance(step, structure.Step) and _value_functions_only(step.logic)
+        for step in steps
+    ):
+        return None
+
+    read_paths: set[str] = set()
+    for step in steps:
+        assert isinstance(step, structure.Step)
+        if step.parent_step:
+            # Inlined from a sub-workflow, its `parent` is the sub-workflow
+            # step's inputs.
+            continue
+
+        for expression in _parent_expressions(step):
+            for root, *path in extract_read_paths(expression.ast):
+                if root != "parent":
+                    continue
+
+                if not path:
+                    return None
+
+                read_paths.add(".".join(path))
+
+    # A value read as a whole covers any of its members also read.
+    return tuple(
+        sorted(
+            path
+            for path in read_paths
+            if not any(path.startswith(f"{other}.") for other in read_paths)
+        )
+    )
+
+
+def _parent_expressions(step: structure.Step) -> list[celpy.Runner]:
+    """The step's expressions which are evaluated with the Workflow's `parent`."""
+    expressions = [step.inputs, step.skip_if]
+    if step.for_each:
+        expressions.append(step.for_each.source_iterator)
+    if isinstance(step.logic, structure.LogicSwitch):
+        expressions.append(step.logic.switch_on)
+
+    return [expression for expression in expressions if expression]
+
+
+def _value_functions_only(logic) -> bool:
+    match logic:
+        case (
+            ValueFunction() | structure.SubWorkflowEntry() | structure.SubWorkflowExit()
+        ):
+            return True
+
+        case structure.Workflow(steps=steps):
+            return all(
+                isinstance(step, structure.Step) and _value_functions_only(step.logic)
+                for step in steps
+            )
+
+        case structure.LogicSwitch(logic_map=logic_map, default_logic=default_logic):
+            return all(
+                _value_functions_only(case_logic) for case_logic in logic_map.values()
+            ) and (default_logic is None or _value_functions_only(default_logic))
+
+    return False
+
+
 def _location(cache_key: str, extra: str | None = None) -> str:
     base = f"prepare:Workflow:{cache_key}"
     if not extra:
@@ -99,8 +200,11 @@ def _build_crd_ref(crd_ref_spec: dict) -> structure.ConfigCRDRef | None:
     return structure.ConfigCRDRef(api_group=api_group, version=version, kind=kind)
 
 
-PARENT_NAME_PATTERN = re.compile(r"parent.(?P<name>.*)")
-STEPS_NAME_PATTERN = re.compile(r"steps.(?P<name>[^.[]+)?\[?.*")
+def _used_keys(argument_trie: PathTrie) -> tuple[set[str], set[str]]:
+    """Return the `parent` properties and the step labels an expression uses."""
+    parent_properties = trie_paths(argument_trie.get("parent", {}))
+    step_labels = set(argument_trie.get("steps", {}))
+    return parent_properties, step_labels
 
 
 LogicRegistryResource = registry.Resource[
@@ -202,19 +306,11 @@ def _load_step(
             cel_env=cel_env, logic_switch=logic_ref_switch, location=step_location
         )
         if is_unwrapped_ok(logic):
-            arg_structure = extract_argument_structure(logic.switch_on.ast)
-
-            needed_parent_properties.update(
-                match.group("name")
-                for match in (PARENT_NAME_PATTERN.match(key) for key in arg_structure)
-                if match
-            )
-
-            needed_steps.update(
-                match.group("name")
-                for match in (STEPS_NAME_PATTERN.match(key) for key in arg_structure)
-                if match
+            parent_keys, step_keys = _used_keys(
+                extract_argument_trie(logic.switch_on.ast)
             )
+            needed_parent_properties.update(parent_keys)
+            needed_steps.update(step_keys)
 
     if step_label == "<missing label>":
         # Note, this should be impossible due to schema validation.
@@ -269,42 +365,43 @@ def _load_step(
         case None:
             skip_if = None
         case celpy.Runner() as skip_if:
-            arg_structure = extract_argument_structure(skip_if.ast)
-
-            needed_parent_properties.update(
-                match.group("name")
-                for match in (PARENT_NAME_PATTERN.match(key) for key in arg_structure)
-                if match
-            )
+            if type_error := check_result_type(
+                skip_if,
+                allowed=(celtypes.BoolType,),
+                description="a bool",
+                location=f"{step_location}.skipIf",
+            ):
+                return (
+                    resources,
+                    structure.ErrorStep(
+                        label=step_label,
+                        outcome=type_error,
+                        condition=None,
+                    ),
+                    needed_parent_properties,
+                )
 
-            needed_steps.update(
-                match.group("name")
-                for match in (STEPS_NAME_PATTERN.match(key) for key in arg_structure)
-                if match
-            )
+            parent_keys, step_keys = _used_keys(extract_argument_trie(skip_if.ast))
+            needed_parent_properties.update(parent_keys)
+            needed_steps.update(step_keys)
 
     for_each_spec = step_spec.get("forEach")
-    match _prepare_for_each(cel_env=cel_env, step_label=step_label, spec=for_each_spec):
+    match _prepare_for_each(
+        cel_env=cel_env,
+        step_label=step_label,
+        step_location=step_location,
+        spec=for_each_spec,
+    ):
         case structure.ErrorStep() as error:
             return resources, error, needed_parent_properties
         case None:
             for_each = None
-        case (structure.ForEach() as for_each, for_each_input_keys):
-            needed_parent_properties.update(
-                match.group("name")
-                for match in (
-                    PARENT_NAME_PATTERN.match(key) for key in for_each_input_keys
-                )
-                if match
-            )
+        case (structure.ForEach() as for_each, for_each_input_trie):
+            parent_keys, step_keys = _used_keys(for_each_input_trie)
+            needed_parent_properties.update(parent_keys)
+            needed_steps.update(step_keys)
 
-            needed_steps.update(
-                match.group("name")
-                for match in (
-                    STEPS_NAME_PATTERN.match(key) for key in for_each_input_keys
-                )
-                if match
-            )
+            for_each = _mark_invariants(for_each=for_each, logic=logic)
 
     input_mapper_spec = step_spec.get("inputs")
     match prepare_map_expression(
@@ -323,19 +420,9 @@ def _load_step(
         case None:
             input_mapper = None
         case celpy.Runner() as input_mapper:
-            arg_structure = extract_argument_structure(input_mapper.ast)
-
-            needed_parent_properties.update(
-                match.group("name")
-                for match in (PARENT_NAME_PATTERN.match(key) for key in arg_structure)
-                if match
-            )
-
-            needed_steps.update(
-                match.group("name")
-                for match in (STEPS_NAME_PATTERN.match(key) for key in arg_structure)
-                if match
-            )
+            parent_keys, step_keys = _used_keys(extract_argument_trie(input_mapper.ast))
+            needed_parent_properties.update(parent_keys)
+            needed_steps.update(step_keys)
 
     condition_spec = step_spec.get("condition")
     if not condition_spec:
@@ -353,19 +440,9 @@ def _load_step(
         case None:
             state = None
         case celpy.Runner() as state:
-            arg_structure = extract_argument_structure(state.ast)
-
-            needed_parent_properties.update(
-                match.group("name")
-                for match in (PARENT_NAME_PATTERN.match(key) for key in arg_structure)
-                if match
-            )
-
-            needed_steps.update(
-                match.group("name")
-                for match in (STEPS_NAME_PATTERN.match(key) for key in arg_structure)
-                if match
-            )
+            parent_keys, step_keys = _used_keys(extract_argument_trie(state.ast))
+            needed_parent_properties.update(parent_keys)
+            needed_steps.update(step_keys)
         case PermFail() as failure:
             return (
                 resources,
@@ -403,16 +480,69 @@ def _load_step(
             dynamic_input_keys=needed_steps,
             condition=condition,
             state=state,
+            prefetch=_prepare_prefetch(
+                cel_env=cel_env,
+                logic=logic,
+                for_each=for_each,
+                inputs_spec=input_mapper_spec,
+                needed_steps=needed_steps,
+                location=f"{step_location}.inputs",
+            ),
+            timeout=step_spec.get("timeoutSeconds"),
+            skip_if_typed=bool(
+                skip_if and is_proven_type(skip_if, allowed=(celtypes.BoolType,))
+            ),
         ),
         needed_parent_properties,
     )
 
 
+def _prepare_prefetch(
+    cel_env: celpy.Environment,
+    logic: Logic | structure.LogicSwitch,
+    for_each: structure.ForEach | None,
+    inputs_spec: dict | None,
+    needed_steps: set[str],
+    location: str,
+) -> structure.StepPrefetch | None:
+    """A step which waits on other steps, but whose ResourceFunction's
+    resource name depends only on `parent`, may load that resource up front.
+    """
+    if not needed_steps or for_each or not isinstance(logic, ResourceFunction):
+        return None
+
+    input_keys = logic.crud_config.resource_id_inputs
+    if input_keys is None:
+        return None
+
+    if not input_keys:
+        return structure.StepPrefetch(inputs=None)
+
+    if not isinstance(inputs_spec, dict) or not input_keys.issubset(inputs_spec):
+        return None
+
+    match prepare_map_expression(
+        cel_env=cel_env,
+        spec={key: inputs_spec[key] for key in sorted(input_keys)},
+        location=location,
+    ):
+        case celpy.Runner() as prefetch_inputs:
+            pass
+        case _:
+            return None
+
+    if not set(extract_argument_trie(prefetch_inputs.ast)).issubset(("parent",)):
+        return None
+
+    return structure.StepPrefetch(inputs=prefetch_inputs)
+
+
 def _prepare_for_each(
     cel_env: celpy.Environment,
     step_label: str,
+    step_location: str,
     spec: dict | None,
-) -> None | structure.ErrorStep | tuple[structure.ForEach, set[str]]:
+) -> None | structure.ErrorStep | tuple[structure.ForEach, PathTrie]:
     if not spec:
         return None
 
@@ -420,7 +550,7 @@ def _prepare_for_each(
     match prepare_expression(
         cel_env=cel_env,
         spec=source_iterator_spec,
-        location=f"{step_label}.forEach.itemIn",
+        location=f"{step_location}.forEach.itemIn",
     ):
         case None:
             return structure.ErrorStep(
@@ -439,7 +569,17 @@ def _prepare_for_each(
                 condition=None,
             )
         case celpy.Runner() as source_iterator:
-            dynamic_input_keys = extract_argument_structure(source_iterator.ast)
+            if type_error := check_result_type(
+                source_iterator,
+                allowed=(celtypes.ListType,),
+                description="a list",
+                location=f"{step_location}.forEach.itemIn",
+            ):
+                return structure.ErrorStep(
+                    label=step_label, outcome=type_error, condition=None
+                )
+
+            dynamic_input_trie = extract_argument_trie(source_iterator.ast)
 
     input_key = spec.get("inputKey")
     if not input_key:
@@ -464,9 +604,13 @@ def _prepare_for_each(
         source_iterator=source_iterator,
         input_key=input_key,
         condition=condition,
+        source_iterator_typed=is_proven_type(
+            source_iterator, allowed=(celtypes.ListType,)
+        ),
+        summarize_resource_ids=spec.get("summarizeResourceIds", False),
     )
 
-    return (for_each, dynamic_input_keys)
+    return (for_each, dynamic_input_trie)
 
 
 def _load_logic(
@@ -562,6 +706,14 @@ def _load_logic_switch(
         case PermFail() as err:
             return None, err
         case celpy.Runner() as switch_on:
+            if type_error := check_result_type(
+                switch_on,
+                allowed=(celtypes.StringType, celtypes.IntType),
+                description="a string or int",
+                location=f"{location}.switchOn",
+            ):
+                return None, type_error
+
             dynamic_input_keys.update(extract_argument_structure(switch_on.ast))
 
     cases_spec = logic_switch.get("cases")
@@ -616,4 +768,115 @@ def _load_logic_switch(
         logic_map=logic_map,
         default_logic=default_logic,
         dynamic_input_keys=dynamic_input_keys,
+        case_table=_build_case_table(logic_map),
+        switch_on_typed=is_proven_type(
+            switch_on, allowed=(celtypes.StringType, celtypes.IntType)
+        ),
     )
+
+
+def _build_case_table(
+    logic_map: dict[str | int, Logic],
+) -> dict[celtypes.StringType | celtypes.IntType, Logic]:
+    """Key each case by the `switchOn` values which select it. A case is
+    matched by its string, and cases written as integers also by the int.
+    """
+    case_table: dict[celtypes.StringType | celtypes.IntType, Logic] = {}
+    for case, logic in logic_map.items():
+        case_table[celtypes.StringType(case)] = logic
+
+        try:
+            int_case = int(case)
+        except ValueError:
+            continue
+
+        if str(int_case) == str(case):
+            case_table[celtypes.IntType(int_case)] = logic
+
+    return case_table
+
+
+def _mark_invariants(
+    for_each: structure.ForEach, logic: Logic | structure.LogicSwitch
+) -> structure.ForEach:
+    """Mark the expressions which do not depend upon the iterated item, so
+    they may be evaluated once rather than for each item.
+    """
+    input_key = for_each.input_key
+
+    match logic:
+        case structure.LogicSwitch(switch_on=switch_on):
+            return for_each._replace(
+                switch_invariant=not _uses_input_key(switch_on, input_key)
+            )
+
+        case ValueFunction() | ResourceFunction():
+            return for_each._replace(
+                preconditions_invariant=bool(logic.preconditions)
+                and not _uses_input_key(logic.preconditions, input_key),
+                locals_invariant=bool(logic.local_values)
+                and not _uses_input_key(logic.local_values, input_key),
+            )
+
+    return for_each
+
+
+def _uses_input_key(expression: celpy.Runner, input_key: str) -> bool:
+    """If the expression may depend upon `inputs.<input_key>`. Any use of
+    `inputs` other than accessing a named key is assumed to.
+    """
+    accessed_roots: set[int] = set()
+    for subtree in expression.ast.iter_subtrees():
+        if subtree.data not in ("member_dot", "member_index"):
+            continue
+
+        root = subtree.children[0].children[0]
+        if not _is_ident(root, "inputs"):
+            continue
+
+        accessed_roots.add(id(root))
+
+        if subtree.data == "member_dot":
+            key = f"{subtree.children[1]}"
+        else:
+            key = _literal_string(subtree.children[1])
+
+        if key is None or key == input_key:
+            return True
+
+    return any(
+        _is_ident(subtree, "inputs") and id(subtree) not in accessed_roots
+        for subtree in expression.ast.iter_subtrees()
+    )
+
+
+def _is_ident(tree: Tree, name: str) -> bool:
+    if tree.data != "primary" or not isinstance(tree.children[0], Tree):
+        return False
+
+    ident = tree.children[0]
+    return ident.data == "ident" and f"{ident.children[0]}" == name
+
+
+def _literal_string(tree: Tree) -> str | None:
+    """The value of a plain string-literal expression, otherwise `None`."""
+    while tree.data != "literal" and len(tree.children) == 1:
+        if not isinstance(tree.children[0], Tree):
+            return None
+        tree = tree.children[0]
+
+    if tree.data != "literal":
+        return None
+
+    token = tree.children[0]
+    if token.type != "STRING_LIT" or "\\" in token:
+        return None
+
+    quote = token[0]
+    if len(token) < 2 or quote not in "'\"" or token[-1] != quote:
+        return None
+
+    if token.startswith(quote * 3):
+        return None
+
+    return token[1:-1]
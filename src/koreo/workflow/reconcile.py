@@ -1,6 +1,17 @@
-from typing import NamedTuple, Sequence
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Container,
+    Coroutine,
+    NamedTuple,
+    Sequence,
+    cast,
+)
 import asyncio
 import copy
+import heapq
+import time
 
 import kr8s
 
@@ -8,15 +19,28 @@ import celpy
 from celpy import celtypes
 
 from koreo import result
-from koreo.cel.evaluation import evaluate
+from koreo.cache_helpers import value_digest
+from koreo.cel.evaluation import evaluate, evaluate_predicates
 from koreo.conditions import Condition
-from koreo.resource_function.reconcile import reconcile_resource_function
+from koreo.resource_function.reconcile import (
+    PrefetchedResource,
+    prefetch_api_resource,
+    prefetch_api_resources,
+    reconcile_resource_function,
+)
 from koreo.value_function.reconcile import reconcile_value_function
 
+from . import result_cache
+from . import salvage
 from . import structure
+from .step_graph import build_step_graph
+from .step_outputs import StepOutputs
 
-# TODO: What is reasonable here? Perhaps 10 seconds?
+# The default time budget (seconds) for a Workflow's steps, used unless the
+# Workflow specifies `timeoutSeconds`.
 STEP_TIMEOUT = 10
+# Maximum number of a `forEach` step's items reconciled at once.
+FOR_EACH_CONCURRENCY = 256
 TIMEOUT_RETRY_DELAY = 30
 UNKNOWN_ERROR_RETRY_DELAY = 60
 
@@ -24,12 +48,41 @@ UNKNOWN_ERROR_RETRY_DELAY = 60
 ResourceIds = dict | list["ResourceIds"] | None
 
 
+class StepTrace(NamedTuple):
+    """Seconds, from the start of the Workflow's steps, at which a step's
+    dependencies completed, it was dispatched, and it finished. `None` if the
+    step did not reach that point.
+    """
+
+    label: str
+    ready_at: float | None
+    dispatched_at: float | None
+    finished_at: float | None
+
+    @property
+    def queued(self) -> float | None:
+        """Time spent ready, but waiting for a free slot."""
+        if self.ready_at is None or self.dispatched_at is None:
+            return None
+        return self.dispatched_at - self.ready_at
+
+    @property
+    def ran(self) -> float | None:
+        if self.dispatched_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.dispatched_at
+
+
 class Result(NamedTuple):
     result: result.UnwrappedOutcome[celtypes.Value]
     conditions: list[Condition]
     resource_ids: dict[str, ResourceIds]
     state: celtypes.MapType
     state_errors: dict[str, str]
+    trace: Sequence[StepTrace] = ()
+    # Steps given a DepSkip, without being dispatched, due to a failed
+    # upstream step.
+    pruned_steps: int = 0
 
 
 async def reconcile_workflow(
@@ -38,6 +91,7 @@ async def reconcile_workflow(
     owner: tuple[str, dict],
     trigger: celtypes.Value,
     workflow: structure.Workflow,
+    deadline: float | None = None,
 ) -> Result:
     # This should block no-steps and any non-ok steps.
     # TODO: Make sure to handle resource-ids so we don't cause a problem
@@ -58,12 +112,38 @@ async def reconcile_workflow(
             state_errors={},
         )
 
-    outcomes, conditions, step_state, state_errors = await _reconcile_steps(
+    if workflow.result_key_paths is not None:
+        digest = result_cache.trigger_digest(
+            trigger=trigger, key_paths=workflow.result_key_paths
+        )
+    else:
+        digest = None
+
+    if digest:
+        cached = result_cache.get_cached(
+            workflow_key=workflow_key, workflow=workflow, digest=digest
+        )
+        if isinstance(cached, Result):
+            # No steps were run, so there is nothing to trace.
+            return copy.deepcopy(cached)._replace(trace=())
+
+    (
+        outcomes,
+        conditions,
+        step_state,
+        state_errors,
+        trace,
+        pruned_steps,
+    ) = await _reconcile_steps(
         api=api,
         workflow_key=workflow_key,
         steps=workflow.steps,
         owner=owner,
         trigger=trigger,
+        step_graph=workflow.step_graph,
+        deadline=_workflow_deadline(workflow=workflow, deadline=deadline),
+        salvage_scope=_salvage_scope(workflow=workflow, owner=owner),
+        max_concurrency=workflow.max_concurrent_steps,
     )
 
     outcome_results = {key: result.result for key, result in outcomes.items()}
@@ -83,18 +163,60 @@ async def reconcile_workflow(
         )
     )
 
-    return Result(
+    workflow_result = Result(
         result=overall_outcome,
         conditions=conditions,
         resource_ids=outcome_resources,
         state=step_state,
         state_errors=state_errors,
+        trace=trace,
+        pruned_steps=pruned_steps,
     )
 
+    if digest and result.is_unwrapped_ok(overall_outcome):
+        result_cache.cache_result(
+            workflow_key=workflow_key,
+            workflow=workflow,
+            digest=digest,
+            workflow_result=copy.deepcopy(workflow_result),
+        )
+
+    return workflow_result
+
+
+def _workflow_deadline(workflow: structure.Workflow, deadline: float | None) -> float:
+    """The (event loop) time by which the Workflow's steps must complete, which
+    is never later than the deadline of the step running it.
+    """
+    budget = workflow.timeout if workflow.timeout else STEP_TIMEOUT
+    workflow_deadline = asyncio.get_running_loop().time() + budget
+    if deadline is None:
+        return workflow_deadline
+
+    return min(deadline, workflow_deadline)
+
+
+def _salvage_scope(workflow: structure.Workflow, owner: tuple[str, dict]) -> str | None:
+    _, owner_ref = owner
+    owner_uid = owner_ref.get("uid") if owner_ref else None
+    if not owner_uid:
+        return None
+
+    return f"{owner_uid}:{workflow.name}"
+
+
+class HoistedValues(NamedTuple):
+    """Function work done once for all of a forEach step's items."""
+
+    preconditions_checked: bool = False
+    local_values: celtypes.MapType | None = None
+
 
 class StepResult(NamedTuple):
     result: result.UnwrappedOutcome[celtypes.Value]
     resource_ids: ResourceIds = None
+    # Set for results which may be salvaged should the run time out.
+    inputs_fingerprint: str | None = None
 
 
 async def _reconcile_steps(
@@ -103,55 +225,203 @@ async def _reconcile_steps(
     owner: tuple[str, dict],
     trigger: celtypes.Value,
     steps: Sequence[structure.Step | structure.ErrorStep],
-) -> tuple[dict[str, StepResult], list[Condition], celtypes.MapType, dict[str, str]]:
+    step_graph: structure.StepGraph | None = None,
+    deadline: float | None = None,
+    salvage_scope: str | None = None,
+    max_concurrency: int | None = None,
+) -> tuple[
+    dict[str, StepResult],
+    list[Condition],
+    celtypes.MapType,
+    dict[str, str],
+    list[StepTrace],
+    int,
+]:
     if not steps:
-        return {}, [], celtypes.MapType({}), {}
+        return {}, [], celtypes.MapType({}), {}, [], 0
+
+    if step_graph is None:
+        step_graph = build_step_graph(steps)
+
+    loop = asyncio.get_running_loop()
+    if deadline is None:
+        deadline = loop.time() + STEP_TIMEOUT
+
+    steps_by_label = {step.label: step for step in steps}
+    step_order = {step.label: idx for idx, step in enumerate(steps)}
+
+    # Resources which can be located using only `parent` are loaded up front,
+    # rather than once the steps they depend on complete.
+    prefetched = _prefetch_resources(api=api, steps=steps, trigger=trigger)
+
+    started_at = time.monotonic()
+    ready_at: dict[str, float] = {}
+    dispatched_at: dict[str, float] = {}
+    finished_at: dict[str, float] = {}
+
+    # Steps are dispatched once all of their dependencies have completed, the
+    # ready step starting the longest chain of remaining steps first.
+    ready: list[tuple[int, int, str]] = []
+
+    def mark_ready(label: str):
+        ready_at[label] = time.monotonic() - started_at
+        heapq.heappush(ready, (-step_graph.priority[label], step_order[label], label))
+
+    remaining_dependencies = dict(step_graph.dependency_counts)
+    for label, dependency_count in remaining_dependencies.items():
+        if not dependency_count:
+            mark_ready(label)
+
+    # Flattened sub-workflow steps complete even if their sub-steps fail.
+    sub_workflow_exits = {
+        step.label
+        for step in steps
+        if isinstance(step, structure.Step)
+        and isinstance(step.logic, structure.SubWorkflowExit)
+    }
 
-    outcome_map: dict[
-        str, tuple[structure.StepConditionSpec | None, celpy.Runner | None]
-    ] = {}
-    task_map: dict[str, asyncio.Task[StepResult]] = {}
+    step_results: dict[str, StepResult] = {}
+    step_outputs = StepOutputs(trigger)
+    failed_steps: set[str] = set()
+    pruned_steps = 0
+    running: dict[asyncio.Task[StepResult], str] = {}
+    timed_out = False
 
     try:
-        async with asyncio.timeout(STEP_TIMEOUT), asyncio.TaskGroup() as task_group:
-            if steps:
-                for step in steps:
+        async with asyncio.timeout_at(deadline):
+            while ready or running:
+                while ready and (
+                    max_concurrency is None or len(running) < max_concurrency
+                ):
+                    _, _, label = heapq.heappop(ready)
+                    step = steps_by_label[label]
+
+                    step_deadline = deadline
                     match step:
-                        case structure.Step(dynamic_input_keys=dynamic_input_keys):
-                            step_dependencies = [
-                                task_map[dependency]
+                        case structure.Step(
+                            dynamic_input_keys=dynamic_input_keys, timeout=step_timeout
+                        ):
+                            step_dependencies = {
+                                dependency: step_results[dependency]
                                 for dependency in dynamic_input_keys
-                            ]
+                                if dependency in step_results
+                            }
+                            if step_timeout:
+                                step_deadline = min(
+                                    deadline, loop.time() + step_timeout
+                                )
 
                         case structure.ErrorStep():
-                            # TODO: Could probably short-circuit here and set step.outcome?
-                            step_dependencies = []
+                            step_dependencies = {}
 
-                    task_map[step.label] = task_group.create_task(
-                        _reconcile_step(
+                    dispatched_at[label] = time.monotonic() - started_at
+                    task = asyncio.create_task(
+                        _reconcile_step_by(
+                            step_deadline,
                             api=api,
                             workflow_key=workflow_key,
                             step=step,
                             owner=owner,
-                            trigger=trigger,
+                            step_outputs=step_outputs,
                             dependencies=step_dependencies,
+                            prefetched=prefetched.get(label),
+                            salvage_scope=salvage_scope,
                         ),
-                        name=step.label,
+                        name=label,
                     )
-                    outcome_map[step.label] = (step.condition, step.state)
-    except:
-        # Exceptions will be processed for each task
-        pass
+                    running[task] = label
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    label = running.pop(task)
+                    finished_at[label] = time.monotonic() - started_at
+
+                    if isinstance(task.exception(), TimeoutError):
+                        timed_out = True
+                        failed_steps.add(label)
+                        step_results[label] = StepResult(
+                            result=result.Retry(
+                                message=f"Timeout running step ({label}), will retry.",
+                                delay=TIMEOUT_RETRY_DELAY,
+                                location=workflow_key,
+                            )
+                        )
+                    elif task.exception():
+                        failed_steps.add(label)
+                        step_results[label] = StepResult(
+                            result=result.Retry(
+                                message=f"Unknown error ({task.exception()}) running Step ({label}), will retry.",
+                                delay=UNKNOWN_ERROR_RETRY_DELAY,
+                                location=workflow_key,
+                            )
+                        )
+                    else:
+                        step_results[label] = task.result()
+                        step_outputs.add(label, step_results[label].result)
+
+                    pruned = _prune_dependents(
+                        workflow_key=workflow_key,
+                        failed_label=label,
+                        step_graph=step_graph,
+                        step_results=step_results,
+                        exempt=sub_workflow_exits,
+                    )
+                    if pruned:
+                        pruned_steps += len(pruned)
+                        pruned_at = time.monotonic() - started_at
+                        for pruned_label in pruned:
+                            finished_at[pruned_label] = pruned_at
+
+                    for completed in (label, *pruned):
+                        for dependent in step_graph.dependents[completed]:
+                            if dependent in step_results:
+                                continue
+
+                            remaining_dependencies[dependent] -= 1
+                            if not remaining_dependencies[dependent]:
+                                mark_ready(dependent)
+
+    except TimeoutError:
+        # Steps which did not finish are reported as timed out below.
+        timed_out = True
+
+    finally:
+        # Also reached if this reconcile is itself cancelled, so that no step
+        # is left running.
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.wait(running)
+
+    if timed_out and salvage_scope:
+        # Keep the work which did complete for the next attempt.
+        for label, step_result in step_results.items():
+            if step_result.inputs_fingerprint:
+                salvage.salvage(
+                    salvage_scope, label, step_result.inputs_fingerprint, step_result
+                )
+
+    for step_prefetch in prefetched.values():
+        if step_prefetch.resource:
+            # Only left running if its step did not use it.
+            step_prefetch.resource.cancel()
 
     outcomes: dict[str, StepResult] = {}
     conditions = []
     state = celtypes.MapType({})
     state_errors: dict[str, str] = {}
 
-    for task in task_map.values():
-        task_name = task.get_name()
+    for step in steps:
+        if _is_inlined(step):
+            # Reported through the result of its sub-workflow step.
+            continue
+
+        task_name = step.label
+        step_result = step_results.get(task_name)
 
-        if task.cancelled():
+        if not step_result:
             timeout_outcome = StepResult(
                 result=result.Retry(
                     message=f"Timeout running step ({task_name}), will retry.",
@@ -169,53 +439,141 @@ async def _reconcile_steps(
                 )
             )
 
-        elif task.exception():
-            error_outcome = StepResult(
-                result=result.Retry(
-                    message=f"Unknown error ({task.exception()}) running Step ({task_name}), will retry.",
-                    delay=UNKNOWN_ERROR_RETRY_DELAY,
-                    location=workflow_key,
-                )
-            )
-            outcomes[task_name] = error_outcome
+        elif task_name in failed_steps:
+            outcomes[task_name] = step_result
             conditions.append(
                 _condition_helper(
                     condition_type="Ready",
                     thing_name=f"Workflow {workflow_key}",
-                    outcome=error_outcome,
+                    outcome=step_result,
                     workflow_key=workflow_key,
                 )
             )
 
-        elif task.done():
-            step_result = task.result()
+        else:
             outcomes[task_name] = step_result
-            condition_config, state_runner = outcome_map[task_name]
-            if condition_config:
+            if step.condition:
                 conditions.append(
                     _condition_helper(
-                        condition_type=condition_config.type_,
-                        thing_name=condition_config.name,
+                        condition_type=step.condition.type_,
+                        thing_name=step.condition.name,
                         outcome=step_result.result,
                         workflow_key=workflow_key,
                     )
                 )
-            if state_runner and result.is_unwrapped_ok(step_result.result):
-                match evaluate(
-                    expression=state_runner,
-                    inputs={"value": step_result.result},
-                    location=f"{task_name}:state",
+            if step.state and result.is_unwrapped_ok(step_result.result):
+                match _evaluate_step_state(
+                    state_expression=step.state,
+                    value=step_result.result,
+                    step_label=task_name,
                 ):
                     case celtypes.MapType() as step_state:
                         state.update(step_state)
-                    case result.PermFail() as err:
-                        state_errors[task_name] = f"{err.message} at {err.location}"
-                    case _ as bad_state:
-                        state_errors[task_name] = (
-                            f"Invalid state type ({type(bad_state)})"
-                        )
+                    case error:
+                        state_errors[task_name] = error
+
+    trace = [
+        StepTrace(
+            label=step.label,
+            ready_at=ready_at.get(step.label),
+            dispatched_at=dispatched_at.get(step.label),
+            finished_at=finished_at.get(step.label),
+        )
+        for step in steps
+    ]
+
+    return outcomes, conditions, state, state_errors, trace, pruned_steps
+
+
+def _is_inlined(step: structure.Step | structure.ErrorStep) -> bool:
+    """If the step was inlined from a flattened sub-workflow."""
+    if not isinstance(step, structure.Step):
+        return False
+
+    return bool(step.parent_step) or isinstance(step.logic, structure.SubWorkflowEntry)
+
+
+async def _reconcile_step_by(deadline: float, **kwargs) -> StepResult:
+    """Reconcile the step, which must complete by the (event loop time)
+    `deadline`. The deadline carries into sub-workflows and forEach items, and
+    cancels any API calls still in flight when it passes.
+    """
+    async with asyncio.timeout_at(deadline):
+        return await _reconcile_step(deadline=deadline, **kwargs)
+
+
+def _prune_dependents(
+    workflow_key: str,
+    failed_label: str,
+    step_graph: structure.StepGraph,
+    step_results: dict[str, StepResult],
+    exempt: Container[str] = (),
+) -> list[str]:
+    """If step `failed_label` is not Ok, record a DepSkip for every step
+    downstream of it, other than `exempt` steps, so that none of them are
+    dispatched. Returns the labels of the pruned steps.
+    """
+    pruned: list[str] = []
+
+    pending = [failed_label]
+    while pending:
+        label = pending.pop()
+        outcome = step_results[label].result
+
+        for dependent in step_graph.dependents[label]:
+            if dependent in step_results or dependent in exempt:
+                continue
+
+            dependency_skip = _dependency_skip(
+                step_label=label,
+                outcome=outcome,
+                location=f"{workflow_key}.spec.steps.{dependent}",
+            )
+            if not dependency_skip:
+                continue
 
-    return outcomes, conditions, state, state_errors
+            step_results[dependent] = StepResult(result=dependency_skip)
+            pending.append(dependent)
+            pruned.append(dependent)
+
+    return pruned
+
+
+def _prefetch_resources(
+    api: kr8s.Api,
+    steps: Sequence[structure.Step | structure.ErrorStep],
+    trigger: celtypes.Value,
+) -> dict[str, PrefetchedResource]:
+    prefetched: dict[str, PrefetchedResource] = {}
+
+    for step in steps:
+        match step:
+            case structure.Step(
+                logic=structure.ResourceFunction() as function,
+                prefetch=structure.StepPrefetch(inputs=prefetch_inputs),
+            ):
+                pass
+            case _:
+                continue
+
+        match evaluate(
+            expression=prefetch_inputs,
+            inputs={"parent": trigger},
+            location=f"{step.label}:prefetch",
+        ):
+            case None:
+                inputs = celtypes.MapType()
+            case celtypes.MapType() as inputs:
+                pass
+            case _:
+                # The step will report the error when it runs.
+                continue
+
+        step_prefetch = prefetch_api_resource(api=api, function=function, inputs=inputs)
+        if step_prefetch:
+            prefetched[step.label] = step_prefetch
+
+    return prefetched
 
 
 def _outcome_encoder(outcome: result.UnwrappedOutcome):
@@ -235,134 +593,39 @@ async def _reconcile_step(
     api: kr8s.Api,
     workflow_key: str,
     step: structure.Step | structure.ErrorStep,
-    trigger: celtypes.Value,
-    dependencies: list[asyncio.Task[StepResult]],
+    step_outputs: StepOutputs,
+    dependencies: dict[str, StepResult],
     owner: tuple[str, dict],
+    prefetched: PrefetchedResource | None = None,
+    deadline: float | None = None,
+    salvage_scope: str | None = None,
 ) -> StepResult:
     location = f"{workflow_key}.spec.steps.{step.label}"
 
     if isinstance(step, structure.ErrorStep):
         return StepResult(result=step.outcome)
 
-    if not dependencies:
-        workflow_inputs = celtypes.MapType({"parent": trigger})
-
-        if not step.inputs:
-            inputs = celtypes.MapType()
-        else:
-            inputs = evaluate(
-                expression=step.inputs,
-                inputs=workflow_inputs,
-                location=f"{location}.inputs",
-            )
-            if not result.is_unwrapped_ok(inputs):
-                return StepResult(result=inputs)
-
-        if step.skip_if:
-            match evaluate(
-                expression=step.skip_if,
-                inputs=workflow_inputs,
-                location=f"{location}.skipIf",
-            ):
-                case result.PermFail() as err:
-                    return StepResult(result=err)
-                case celtypes.BoolType() as should_skip:
-                    if should_skip:
-                        return StepResult(
-                            result=result.Skip(message="skipped by workflow")
-                        )
-                case _ as bad_type:
-                    return StepResult(
-                        result=result.PermFail(
-                            message=f"`skipIf` must evaluate to a bool, received '{bad_type}' a {type(bad_type)}",
-                            location=f"{location}.skipIf",
-                        )
-                    )
-
-        if step.for_each:
-            return await _for_each_reconciler(
-                api=api,
-                workflow_key=workflow_key,
-                location=location,
-                step=step,
-                owner=owner,
-                workflow_inputs=workflow_inputs,
-                inputs=inputs,
-            )
-        else:
-            return await _reconcile_step_logic(
-                api=api,
-                workflow_key=workflow_key,
-                location=location,
-                logic=step.logic,
-                owner=owner,
-                workflow_inputs=workflow_inputs,
-                inputs=inputs,
-            )
+    if step.dependency_labels is not None:
+        dependencies = {
+            step.dependency_labels[label]: step_result
+            for label, step_result in dependencies.items()
+            if label in step.dependency_labels
+        }
 
-    # TODO: Error handling review
-    _, pending = await asyncio.wait(dependencies)
-    if pending:
-        timed_out_tasks = ", ".join(task.get_name() for task in pending)
-        return StepResult(
-            result=result.Retry(
-                message=f"Timeout running Workflow Steps ({timed_out_tasks}), will retry.",
-                delay=15,
-                location=location,
-            )
+    if isinstance(step.logic, structure.SubWorkflowExit):
+        return _complete_sub_workflow(
+            sub_workflow=step.logic, dependencies=dependencies
         )
 
-    ok_outcomes = celtypes.MapType()
-
-    for task in dependencies:
-        step_label = task.get_name()
-        step_result = task.result()
-        match step_result.result:
-            case result.DepSkip(message=skip_message, location=skip_location):
-                return StepResult(
-                    result=result.DepSkip(
-                        f"'{step_label}' is waiting on dependency ({skip_message} at {skip_location}).",
-                        location=location,
-                    )
-                )
-
-            case result.Skip(message=skip_message, location=skip_location):
-                return StepResult(
-                    result=result.DepSkip(
-                        f"'{step_label}' was skipped ({skip_message} at {skip_location}).",
-                        location=location,
-                    )
-                )
-
-            case result.Retry(message=retry_message, location=retry_location):
-                return StepResult(
-                    result=result.DepSkip(
-                        f"'{step_label}' is waiting ({retry_message} at {retry_location}).",
-                        location=location,
-                    )
-                )
-
-            case result.PermFail(message=fail_message, location=fail_location):
-                return StepResult(
-                    result=result.DepSkip(
-                        f"'{step_label}' is in failure state ({fail_message} at {fail_location}).",
-                        location=location,
-                    )
-                )
-
-            case result.Ok(data=data):
-                ok_outcomes[celtypes.StringType(step_label)] = data
+    for step_label, step_result in dependencies.items():
+        if dependency_skip := _dependency_skip(
+            step_label=step_label, outcome=step_result.result, location=location
+        ):
+            return StepResult(result=dependency_skip)
 
-            case _ as data:
-                # This should be an UnwrappedOutcome (Ok)
-                ok_outcomes[celtypes.StringType(step_label)] = data
+    # Shared with the other steps which have the same dependencies.
+    workflow_inputs = step_outputs.workflow_inputs(step)
 
-    workflow_inputs: dict[str, celtypes.Value] = celtypes.MapType(
-        {
-            "steps": ok_outcomes,
-            "parent": trigger,
-        }
-    )
     if not step.inputs:
         inputs = celtypes.MapType()
     else:
@@ -382,7 +645,10 @@ async def _reconcile_step(
         ):
             case result.PermFail() as err:
                 return StepResult(result=err)
-            case celtypes.BoolType() as should_skip:
+            # The type is only checked if prepare could not prove it.
+            case should_skip if step.skip_if_typed or isinstance(
+                should_skip, celtypes.BoolType
+            ):
                 if should_skip:
                     return StepResult(result=result.Skip(message="skipped by workflow"))
             case _ as bad_type:
@@ -402,17 +668,127 @@ async def _reconcile_step(
             workflow_inputs=workflow_inputs,
             owner=owner,
             inputs=inputs,
+            deadline=deadline,
         )
+
+    # ValueFunctions' results depend only upon their inputs, so a result
+    # completed by a timed out run may be reused. ResourceFunctions' results
+    # also depend upon their resource, which may have since changed.
+    if salvage_scope and isinstance(step.logic, structure.ValueFunction):
+        fingerprint = value_digest(inputs)
+        salvaged = salvage.take_salvaged(salvage_scope, step.label, fingerprint)
+        if isinstance(salvaged, StepResult):
+            # Only salvaged once, so a result is not carried indefinitely.
+            return salvaged._replace(inputs_fingerprint=None)
     else:
-        return await _reconcile_step_logic(
-            api=api,
-            workflow_key=workflow_key,
-            location=location,
-            logic=step.logic,
-            owner=owner,
-            inputs=inputs,
-            workflow_inputs=workflow_inputs,
+        fingerprint = None
+
+    step_result = await _reconcile_step_logic(
+        api=api,
+        workflow_key=workflow_key,
+        location=location,
+        logic=step.logic,
+        owner=owner,
+        inputs=inputs,
+        workflow_inputs=workflow_inputs,
+        prefetched=prefetched,
+        deadline=deadline,
+    )
+
+    if fingerprint and result.is_unwrapped_ok(step_result.result):
+        return step_result._replace(inputs_fingerprint=fingerprint)
+
+    return step_result
+
+
+def _complete_sub_workflow(
+    sub_workflow: structure.SubWorkflowExit, dependencies: dict[str, StepResult]
+) -> StepResult:
+    """The result of a flattened sub-workflow step, matching that of reconciling
+    the sub-workflow itself.
+    """
+    entry_result = dependencies[sub_workflow.entry]
+    if not result.is_unwrapped_ok(entry_result.result):
+        return StepResult(result=entry_result.result)
+
+    outcome_results = {}
+    resources = {}
+    for label, step_label, _ in sub_workflow.steps:
+        step_result = dependencies[label]
+        outcome_results[step_label] = step_result.result
+        resources[step_label] = step_result.resource_ids
+
+    resource_ids = {"workflow": sub_workflow.workflow_name, "resources": resources}
+
+    overall_outcome = result.unwrapped_combine(outcomes=outcome_results.values())
+    if not result.is_unwrapped_ok(overall_outcome):
+        return StepResult(result=overall_outcome, resource_ids=resource_ids)
+
+    state = celtypes.MapType({})
+    for _, step_label, state_expression in sub_workflow.steps:
+        if not state_expression:
+            continue
+
+        step_state = _evaluate_step_state(
+            state_expression=state_expression,
+            value=outcome_results[step_label],
+            step_label=step_label,
         )
+        if isinstance(step_state, celtypes.MapType):
+            state.update(step_state)
+
+    return StepResult(result=state, resource_ids=resource_ids)
+
+
+def _evaluate_step_state(
+    state_expression: celpy.Runner, value: celtypes.Value, step_label: str
+) -> celtypes.MapType | str:
+    """Evaluate a step's `state`, returning the state or an error message."""
+    match evaluate(
+        expression=state_expression,
+        inputs={"value": value},
+        location=f"{step_label}:state",
+    ):
+        case celtypes.MapType() as step_state:
+            return step_state
+        case result.PermFail() as err:
+            return f"{err.message} at {err.location}"
+        case _ as bad_state:
+            return f"Invalid state type ({type(bad_state)})"
+
+
+def _dependency_skip(
+    step_label: str, outcome: result.UnwrappedOutcome, location: str
+) -> result.DepSkip | None:
+    """The DepSkip for a step which depends on step `step_label`, or `None` if
+    that step's outcome is Ok.
+    """
+    match outcome:
+        case result.DepSkip(message=skip_message, location=skip_location):
+            return result.DepSkip(
+                f"'{step_label}' is waiting on dependency ({skip_message} at {skip_location}).",
+                location=location,
+            )
+
+        case result.Skip(message=skip_message, location=skip_location):
+            return result.DepSkip(
+                f"'{step_label}' was skipped ({skip_message} at {skip_location}).",
+                location=location,
+            )
+
+        case result.Retry(message=retry_message, location=retry_location):
+            return result.DepSkip(
+                f"'{step_label}' is waiting ({retry_message} at {retry_location}).",
+                location=location,
+            )
+
+        case result.PermFail(message=fail_message, location=fail_location):
+            return result.DepSkip(
+                f"'{step_label}' is in failure state ({fail_message} at {fail_location}).",
+                location=location,
+            )
+
+    return None
 
 
 async def _reconcile_ref_switch(
@@ -423,7 +799,46 @@ async def _reconcile_ref_switch(
     workflow_inputs: celtypes.MapType,
     inputs: celtypes.Value,
     location: str,
+    deadline: float | None = None,
+):
+    match _select_switch_logic(
+        logic_switch=logic_switch,
+        workflow_inputs=workflow_inputs,
+        inputs=inputs,
+        location=location,
+    ):
+        case StepResult() as failure:
+            return failure
+        case (switch_value, logic):
+            pass
+
+    return await _reconcile_step_logic(
+        api=api,
+        workflow_key=workflow_key,
+        owner=owner,
+        inputs=inputs,
+        workflow_inputs=workflow_inputs,
+        location=f"{location}['{switch_value}']",
+        logic=logic,
+        deadline=deadline,
+    )
+
+
+def _select_switch_logic(
+    logic_switch: structure.LogicSwitch,
+    workflow_inputs: celtypes.MapType,
+    inputs: celtypes.Value,
+    location: str,
+) -> (
+    tuple[
+        celtypes.StringType | celtypes.IntType,
+        structure.ResourceFunction | structure.ValueFunction | structure.Workflow,
+    ]
+    | StepResult
 ):
+    """Evaluate `switchOn`, returning the value and the case's Logic, or the
+    failure.
+    """
     # This gives the switch-on expression access to direct outcomes through
     # `steps`, but also to the step's `inputs`. In addition to possible
     # convenience, this gives the switch access to the iterated values from a
@@ -437,9 +852,11 @@ async def _reconcile_ref_switch(
     ):
         case result.PermFail() as err:
             return StepResult(result=err)
-        case (celtypes.StringType() | celtypes.IntType()) as switch_value:
-            # Just needed to extract the `switch_on` value
-            pass
+        # The type is only checked if prepare could not prove it.
+        case switch_value if logic_switch.switch_on_typed or isinstance(
+            switch_value, (celtypes.StringType, celtypes.IntType)
+        ):
+            switch_value = cast(celtypes.StringType | celtypes.IntType, switch_value)
         case bad_type:
             return StepResult(
                 result=result.PermFail(
@@ -448,7 +865,12 @@ async def _reconcile_ref_switch(
                 )
             )
 
-    logic = logic_switch.logic_map.get(switch_value, logic_switch.default_logic)
+    if logic_switch.case_table is None:
+        case_table = logic_switch.logic_map
+    else:
+        case_table = logic_switch.case_table
+
+    logic = case_table.get(switch_value, logic_switch.default_logic)
 
     if not logic:
         # TODO: Should this be a PermFail or a Retry? I _think_ PermFail
@@ -465,15 +887,7 @@ async def _reconcile_ref_switch(
             )
         )
 
-    return await _reconcile_step_logic(
-        api=api,
-        workflow_key=workflow_key,
-        owner=owner,
-        inputs=inputs,
-        workflow_inputs=workflow_inputs,
-        location=f"{location}['{switch_value}']",
-        logic=logic,
-    )
+    return switch_value, logic
 
 
 async def _reconcile_step_logic(
@@ -488,10 +902,20 @@ async def _reconcile_step_logic(
         | structure.ValueFunction
         | structure.Workflow
         | structure.LogicSwitch
+        | structure.SubWorkflowEntry
         | result.NonOkOutcome
     ),
+    prefetched: PrefetchedResource | None = None,
+    deadline: float | None = None,
+    hoisted: HoistedValues | None = None,
 ) -> StepResult:
+    if hoisted is None:
+        hoisted = HoistedValues()
+
     match logic:
+        case structure.SubWorkflowEntry():
+            return StepResult(result=inputs)
+
         case structure.Workflow():
             workflow_result = await reconcile_workflow(
                 api=api,
@@ -499,6 +923,7 @@ async def _reconcile_step_logic(
                 owner=owner,
                 trigger=inputs,
                 workflow=logic,
+                deadline=deadline,
             )
             if result.is_unwrapped_ok(workflow_result.result):
                 return StepResult(
@@ -517,6 +942,9 @@ async def _reconcile_step_logic(
                 function=logic,
                 owner=owner,
                 inputs=inputs,
+                prefetched=prefetched,
+                preconditions_checked=hoisted.preconditions_checked,
+                local_values=hoisted.local_values,
             )
             return StepResult(result=func_result, resource_ids=resource_id)
 
@@ -526,6 +954,8 @@ async def _reconcile_step_logic(
                     location=location,
                     function=logic,
                     inputs=inputs,
+                    preconditions_checked=hoisted.preconditions_checked,
+                    local_values=hoisted.local_values,
                 )
             )
 
@@ -538,11 +968,55 @@ async def _reconcile_step_logic(
                 workflow_inputs=workflow_inputs,
                 inputs=inputs,
                 location=f"{location}.refSwitch",
+                deadline=deadline,
             )
 
     return StepResult(result=logic)
 
 
+def _hoist_invariants(
+    for_each: structure.ForEach,
+    logic: structure.ResourceFunction
+    | structure.ValueFunction
+    | structure.Workflow
+    | structure.LogicSwitch,
+    inputs: celtypes.Value,
+    location: str,
+) -> HoistedValues | None:
+    """Evaluate, once, the Function's expressions which do not depend upon the
+    iterated item. Failures are left for each item to report.
+    """
+    if not isinstance(logic, (structure.ResourceFunction, structure.ValueFunction)):
+        return None
+
+    if not (for_each.preconditions_invariant or for_each.locals_invariant):
+        return None
+
+    function_inputs = {"inputs": inputs}
+
+    preconditions_checked = for_each.preconditions_invariant and not (
+        evaluate_predicates(
+            predicates=logic.preconditions,
+            inputs=function_inputs,
+            location=f"{location}:spec.preconditions",
+        )
+    )
+
+    local_values = None
+    if for_each.locals_invariant:
+        match evaluate(
+            expression=logic.local_values,
+            inputs=function_inputs,
+            location=f"{location}:spec.locals",
+        ):
+            case celtypes.MapType() as evaluated_locals:
+                local_values = evaluated_locals
+
+    return HoistedValues(
+        preconditions_checked=preconditions_checked, local_values=local_values
+    )
+
+
 async def _for_each_reconciler(
     api: kr8s.Api,
     step: structure.Step,
@@ -551,6 +1025,7 @@ async def _for_each_reconciler(
     owner: tuple[str, dict],
     workflow_inputs: celtypes.MapType,
     inputs: celtypes.Value,
+    deadline: float | None = None,
 ) -> StepResult:
     assert step.for_each
 
@@ -562,9 +1037,11 @@ async def _for_each_reconciler(
         case result.PermFail() as failure:
             return StepResult(result=failure)
 
-        case celtypes.ListType() as source_iterator:
-            # Without this, if the source_iterator is empty the task-group
-            # raises an exception at context-manager exit.
+        # The type is only checked if prepare could not prove it.
+        case source_iterator if step.for_each.source_iterator_typed or isinstance(
+            source_iterator, celtypes.ListType
+        ):
+            source_iterator = cast(celtypes.ListType, source_iterator)
             if not source_iterator:
                 return StepResult(result=celtypes.ListType())
 
@@ -576,97 +1053,222 @@ async def _for_each_reconciler(
                 )
             )
 
-    tasks: list[asyncio.Task[StepResult]] = []
+    item_logic = step.logic
+    item_location = ""
+    if step.for_each.switch_invariant and isinstance(step.logic, structure.LogicSwitch):
+        # The same case is selected for every item, so it is selected once.
+        match _select_switch_logic(
+            logic_switch=step.logic,
+            workflow_inputs=workflow_inputs,
+            inputs=inputs,
+            location=f"{location}.refSwitch",
+        ):
+            case StepResult() as failure:
+                return failure
+            case (switch_value, item_logic):
+                item_location = f".refSwitch['{switch_value}']"
+
+    hoisted = _hoist_invariants(
+        for_each=step.for_each, logic=item_logic, inputs=inputs, location=location
+    )
+
+    # Only the iterated key differs between items, so the rest of the inputs
+    # are shared rather than copied.
+    def item_inputs(idx: int) -> celtypes.MapType:
+        iterated_inputs = celtypes.MapType(inputs)
+        iterated_inputs[step.for_each.input_key] = source_iterator[idx]
+        return iterated_inputs
+
+    # Resources managed by each iteration are identified together, so that
+    # those sharing a namespace may be resolved with a single LIST.
+    if isinstance(item_logic, structure.ResourceFunction):
+        all_iterated_inputs = [item_inputs(idx) for idx in range(len(source_iterator))]
+        prefetched = prefetch_api_resources(
+            api=api,
+            function=item_logic,
+            inputs=all_iterated_inputs,
+            local_values=hoisted.local_values if hoisted else None,
+        )
+    else:
+        all_iterated_inputs = None
+        prefetched = [None] * len(source_iterator)
+
+    if deadline is None:
+        deadline = asyncio.get_running_loop().time() + STEP_TIMEOUT
 
+    def reconcile_item(idx: int) -> Coroutine[Any, Any, StepResult]:
+        if all_iterated_inputs:
+            iterated_inputs = all_iterated_inputs[idx]
+        else:
+            iterated_inputs = item_inputs(idx)
+
+        return _reconcile_step_logic(
+            api=api,
+            workflow_key=workflow_key,
+            location=f"{location}[{idx}]{item_location}",
+            logic=item_logic,
+            owner=owner,
+            inputs=iterated_inputs,
+            workflow_inputs=workflow_inputs,
+            prefetched=prefetched[idx],
+            deadline=deadline,
+            hoisted=hoisted,
+        )
+
+    # Items' results are folded in as they complete, so only their encoded
+    # values (and not every StepResult) are held until the step completes.
+    values: list[celtypes.Value | None] = [None] * len(source_iterator)
+    errors: list[result.NonOkOutcome] = []
+    if step.for_each.summarize_resource_ids:
+        summary = ResourceIdSummary()
+        resource_ids: list[ResourceIds] = []
+    else:
+        summary = None
+        resource_ids = [None] * len(source_iterator)
+
+    completed = 0
     try:
-        async with asyncio.timeout(STEP_TIMEOUT), asyncio.TaskGroup() as task_group:
-            for idx, map_value in enumerate(source_iterator):
-                iterated_inputs = copy.deepcopy(inputs)
-                iterated_inputs[step.for_each.input_key] = map_value
-                tasks.append(
-                    task_group.create_task(
-                        _reconcile_step_logic(
-                            api=api,
-                            workflow_key=workflow_key,
-                            location=f"{location}[{idx}]",
-                            logic=step.logic,
-                            owner=owner,
-                            inputs=iterated_inputs,
-                            workflow_inputs=workflow_inputs,
-                        ),
-                        name=f"{step.label}-{idx}",
-                    )
-                )
-    except:
-        # Handled per-task below
-        pass
-
-    # TODO: This shouldn't even be needed. The context manager does this already?
-    _, pending = await asyncio.wait(tasks)
-    if pending:
-        timed_out_tasks = ", ".join(task.get_name() for task in pending)
+        async with asyncio.timeout_at(deadline):
+            async for idx, item_result in _stream_for_each(
+                item_count=len(source_iterator),
+                reconcile_item=reconcile_item,
+                name=step.label,
+                workflow_key=workflow_key,
+            ):
+                completed += 1
+
+                if summary:
+                    summary.add(item_result.resource_ids)
+                else:
+                    resource_ids[idx] = item_result.resource_ids
+
+                if result.is_error(item_result.result):
+                    errors.append(item_result.result)
+                elif not errors:
+                    values[idx] = _outcome_encoder(item_result.result)
+
+    except TimeoutError:
         return StepResult(
             result=result.Retry(
-                message=f"Timeout running Workflow For Each Step ({timed_out_tasks}), will retry.",
+                message=f"Timeout running Workflow For Each Step ({step.label}, {len(source_iterator) - completed} of {len(source_iterator)} items unfinished), will retry.",
                 delay=15,
                 location=location,
             )
         )
 
-    outcomes = []
-    for task in tasks:
-        task_name = task.get_name()
-
-        if task.cancelled():
-            outcomes.append(
-                StepResult(
-                    result=result.Retry(
-                        message=f"Timeout running step ({task_name}), will retry.",
-                        delay=TIMEOUT_RETRY_DELAY,
-                        location=workflow_key,
-                    )
+    finally:
+        for item_prefetch in prefetched:
+            if item_prefetch and item_prefetch.listing:
+                # Only left running if no iteration used it.
+                item_prefetch.listing.cancel()
+
+    if summary:
+        encoded_resource_ids: ResourceIds = summary.encode()
+    else:
+        encoded_resource_ids = resource_ids
+
+    if errors:
+        return StepResult(
+            result=result.unwrapped_combine(errors), resource_ids=encoded_resource_ids
+        )
+
+    return StepResult(
+        result=celtypes.ListType(values), resource_ids=encoded_resource_ids
+    )
+
+
+async def _stream_for_each(
+    item_count: int,
+    reconcile_item: Callable[[int], Coroutine[Any, Any, StepResult]],
+    name: str,
+    workflow_key: str,
+) -> AsyncIterator[tuple[int, StepResult]]:
+    """Reconcile items `0..item_count`, at most `FOR_EACH_CONCURRENCY` at
+    once, yielding each item's index and result as it completes.
+
+    Items are started in order, but may complete in any order. An item which
+    raises is reported as a Retry rather than cancelling the others. Items
+    still running when the stream is closed are cancelled.
+    """
+    running: dict[asyncio.Task[StepResult], int] = {}
+    next_idx = 0
+
+    try:
+        while next_idx < item_count or running:
+            while next_idx < item_count and len(running) < FOR_EACH_CONCURRENCY:
+                task = asyncio.create_task(
+                    reconcile_item(next_idx), name=f"{name}-{next_idx}"
                 )
+                running[task] = next_idx
+                next_idx += 1
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield running.pop(task), _item_task_result(task, workflow_key)
+
+    finally:
+        for task in running:
+            task.cancel()
+
+
+def _item_task_result(task: asyncio.Task[StepResult], workflow_key: str) -> StepResult:
+    task_name = task.get_name()
+
+    if task.cancelled():
+        return StepResult(
+            result=result.Retry(
+                message=f"Timeout running step ({task_name}), will retry.",
+                delay=TIMEOUT_RETRY_DELAY,
+                location=workflow_key,
             )
+        )
 
-        elif task.exception():
-            outcomes.append(
-                StepResult(
-                    result=result.Retry(
-                        message=f"Error ({task.exception()}) running Step ({task_name}), will retry.",
-                        delay=UNKNOWN_ERROR_RETRY_DELAY,
-                        location=workflow_key,
-                    )
-                )
+    if task.exception():
+        return StepResult(
+            result=result.Retry(
+                message=f"Error ({task.exception()}) running Step ({task_name}), will retry.",
+                delay=UNKNOWN_ERROR_RETRY_DELAY,
+                location=workflow_key,
             )
+        )
 
-        elif task.done():
-            outcomes.append(task.result())
+    return task.result()
 
-        else:
-            outcomes.append(
-                StepResult(
-                    result=result.Retry(
-                        message=f"Unexpected task-state running Step ({task_name}), will retry.",
-                        delay=UNKNOWN_ERROR_RETRY_DELAY,
-                        location=workflow_key,
-                    )
-                )
-            )
 
-    error_outcome = result.combine(
-        [outcome.result for outcome in outcomes if result.is_error(outcome.result)]
-    )
-    resource_ids = [outcome.resource_ids for outcome in outcomes]
+class ResourceIdSummary:
+    """Counts of the resources managed by a `forEach` step's items, grouped by
+    `apiVersion`, `kind`, and `namespace` (or by sub-Workflow).
+    """
 
-    if result.is_error(error_outcome):
-        return StepResult(result=error_outcome, resource_ids=resource_ids)
+    def __init__(self):
+        self.items = 0
+        self.counts: dict[tuple[tuple[str, str], ...], int] = {}
 
-    return StepResult(
-        result=celtypes.ListType(
-            [_outcome_encoder(outcome.result) for outcome in outcomes]
-        ),
-        resource_ids=resource_ids,
-    )
+    def add(self, resource_ids: ResourceIds):
+        self.items += 1
+
+        match resource_ids:
+            case {"kind": _}:
+                key = tuple(
+                    (field, resource_ids[field])
+                    for field in ("apiVersion", "kind", "namespace")
+                    if field in resource_ids
+                )
+            case {"workflow": workflow}:
+                key = (("workflow", workflow),)
+            case _:
+                return
+
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def encode(self) -> dict:
+        return {
+            "items": self.items,
+            "resources": [
+                dict(key) | {"count": count}
+                for key, count in sorted(self.counts.items())
+            ],
+        }
 
 
 def _condition_helper(
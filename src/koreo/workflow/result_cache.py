@@ -0,0 +1,72 @@
+from celpy import celtypes
+
+from koreo.cache_helpers import bounded_insert, value_digest
+
+from .structure import Workflow
+
+# Bound on the number of cached Workflow results.
+WORKFLOW_RESULT_CACHE_SIZE = 1024
+
+# Keyed by (workflow key, trigger digest), the prepared Workflow which
+# produced the result, and the result.
+_results: dict[tuple[str, str], tuple[Workflow, object]] = {}
+
+
+def trigger_digest(trigger: celtypes.Value, key_paths: tuple[str, ...]) -> str | None:
+    """Return a hash of only the `parent` values at `key_paths`, or `None` if
+    they can not be canonically encoded.
+
+    A path the trigger does not contain is keyed by its nearest present
+    ancestor, which also covers paths extended by dynamic indexing.
+    """
+    values: dict[str, celtypes.Value] = {}
+    for path in key_paths:
+        ancestor_path, value = _lookup(trigger, path)
+        values[ancestor_path] = value
+
+    return value_digest(celtypes.MapType(values))
+
+
+def get_cached(workflow_key: str, workflow: Workflow, digest: str) -> object | None:
+    """Return the cached result, provided it was produced by this prepared
+    Workflow; re-preparing the Workflow invalidates its results.
+    """
+    cached = _results.get((workflow_key, digest))
+    if not cached:
+        return None
+
+    cached_workflow, cached_result = cached
+    if cached_workflow is not workflow:
+        del _results[(workflow_key, digest)]
+        return None
+
+    return cached_result
+
+
+def cache_result(
+    workflow_key: str, workflow: Workflow, digest: str, workflow_result: object
+) -> None:
+    bounded_insert(
+        _results,
+        (workflow_key, digest),
+        (workflow, workflow_result),
+        WORKFLOW_RESULT_CACHE_SIZE,
+    )
+
+
+def _lookup(trigger: celtypes.Value, path: str) -> tuple[str, celtypes.Value]:
+    value = trigger
+    found: list[str] = []
+    for segment in path.split("."):
+        if not isinstance(value, celtypes.MapType) or segment not in value:
+            break
+
+        value = value[segment]
+        found.append(segment)
+
+    return ".".join(found), value
+
+
+def _reset():
+    """Helper for unit testing; not intended for usage in normal code."""
+    _results.clear()
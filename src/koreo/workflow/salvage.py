@@ -0,0 +1,49 @@
+import time
+
+from koreo.cache_helpers import bounded_insert
+
+# How long (seconds) the completed step results of a timed out run are kept
+# for its retry.
+SALVAGE_TTL = 90
+
+# Bound on the number of salvaged step results.
+SALVAGE_CACHE_SIZE = 4096
+
+# Keyed by (scope, step label), the step's inputs fingerprint, its result, and
+# the (monotonic) expiry.
+_salvaged: dict[tuple[str, str], tuple[str, object, float]] = {}
+
+
+def salvage(scope: str, label: str, fingerprint: str, step_result: object) -> None:
+    """Keep a completed step's result, from a run which timed out, so that the
+    next attempt need not redo it.
+    """
+    bounded_insert(
+        _salvaged,
+        (scope, label),
+        (fingerprint, step_result, time.monotonic() + SALVAGE_TTL),
+        SALVAGE_CACHE_SIZE,
+    )
+
+
+def take_salvaged(scope: str, label: str, fingerprint: str | None) -> object | None:
+    """Return (once) the salvaged result for the step, provided it was run with
+    the same inputs and has not expired.
+    """
+    if not fingerprint:
+        return None
+
+    salvaged = _salvaged.pop((scope, label), None)
+    if not salvaged:
+        return None
+
+    salvaged_fingerprint, step_result, expiry = salvaged
+    if salvaged_fingerprint != fingerprint or expiry <= time.monotonic():
+        return None
+
+    return step_result
+
+
+def _reset():
+    """Helper for unit testing; not intended for usage in normal code."""
+    _salvaged.clear()
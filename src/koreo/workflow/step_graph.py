@@ -0,0 +1,44 @@
+from typing import Sequence
+
+from . import structure
+
+
+def build_step_graph(
+    steps: Sequence[structure.Step | structure.ErrorStep],
+) -> structure.StepGraph:
+    """Index the dependencies between `steps` and compute the critical-path
+    length of each step, so that ready steps may be dispatched in priority
+    order.
+
+    Steps must follow the steps they depend on, which `prepare` enforces.
+    Dependencies on unknown labels are ignored; the step will fail to evaluate
+    its inputs instead.
+    """
+    labels = {step.label for step in steps}
+
+    dependents: dict[str, list[str]] = {step.label: [] for step in steps}
+    dependency_counts: dict[str, int] = {}
+    for step in steps:
+        match step:
+            case structure.Step(dynamic_input_keys=dynamic_input_keys):
+                dependencies = {key for key in dynamic_input_keys if key in labels}
+            case structure.ErrorStep():
+                dependencies = set()
+
+        dependency_counts[step.label] = len(dependencies)
+        for dependency in dependencies:
+            dependents[dependency].append(step.label)
+
+    # Dependents always come later, so a reverse pass sees them first.
+    priority: dict[str, int] = {}
+    for step in reversed(steps):
+        priority[step.label] = 1 + max(
+            (priority.get(dependent, 0) for dependent in dependents[step.label]),
+            default=0,
+        )
+
+    return structure.StepGraph(
+        dependents={label: tuple(waiting) for label, waiting in dependents.items()},
+        dependency_counts=dependency_counts,
+        priority=priority,
+    )
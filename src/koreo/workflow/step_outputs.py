@@ -0,0 +1,89 @@
+from celpy import celtypes
+
+from koreo import result
+
+from .structure import Step
+
+ProjectionKey = tuple[str | None, frozenset[tuple[str, str]]]
+
+
+class StepOutputs:
+    """The Ok values of a Workflow run's completed steps, shared by all of the
+    run's steps rather than re-collected for each.
+
+    A step sees the outputs through a projection restricted to its
+    dependencies. Outputs are never replaced once added, so projections are
+    cached; steps with the same dependencies share one `workflow_inputs` map,
+    which must be treated as immutable.
+    """
+
+    def __init__(self, trigger: celtypes.Value):
+        self.trigger = trigger
+        self._values: dict[str, celtypes.Value] = {}
+        self._projections: dict[ProjectionKey, celtypes.MapType] = {}
+
+    def add(
+        self,
+        label: str,
+        outcome: result.UnwrappedOutcome[celtypes.Value] | result.Ok[celtypes.Value],
+    ):
+        """Record step `label`'s outcome, if it is Ok."""
+        if isinstance(outcome, result.Ok):
+            value = outcome.data
+        elif result.is_unwrapped_ok(outcome):
+            value = outcome
+        else:
+            return
+
+        self._values[label] = value
+
+    def get(self, label: str) -> celtypes.Value | None:
+        return self._values.get(label)
+
+    def workflow_inputs(self, step: Step) -> celtypes.MapType:
+        """The `steps` and `parent` available to `step`'s expressions.
+
+        `steps` holds the completed dependencies, under the labels the step
+        knows them by. Steps inlined from a sub-workflow see their parent
+        step's output as `parent`.
+        """
+        if step.dependency_labels is None:
+            labels = frozenset(
+                (label, label)
+                for label in step.dynamic_input_keys
+                if label in self._values
+            )
+        else:
+            labels = frozenset(
+                (label, known_as)
+                for label, known_as in step.dependency_labels.items()
+                if label in self._values
+            )
+
+        key = (step.parent_step, labels)
+        projection = self._projections.get(key)
+        if projection is not None:
+            return projection
+
+        if step.parent_step:
+            trigger = self._values[step.parent_step]
+        else:
+            trigger = self.trigger
+
+        if labels:
+            projection = celtypes.MapType(
+                {
+                    "steps": celtypes.MapType(
+                        {
+                            celtypes.StringType(known_as): self._values[label]
+                            for label, known_as in labels
+                        }
+                    ),
+                    "parent": trigger,
+                }
+            )
+        else:
+            projection = celtypes.MapType({"parent": trigger})
+
+        self._projections[key] = projection
+        return projection
@@ -2,6 +2,7 @@ from __future__ import annotations
 from typing import NamedTuple, Sequence
 
 import celpy
+from celpy import celtypes
 
 from koreo.result import NonOkOutcome, Outcome
 
@@ -27,10 +28,53 @@ class LogicSwitch(NamedTuple):
 
     dynamic_input_keys: set[str]
 
+    # `logic_map`, keyed by the typed `switchOn` values matching each case.
+    case_table: (
+        dict[
+            celtypes.StringType | celtypes.IntType,
+            ResourceFunction | ValueFunction | Workflow,
+        ]
+        | None
+    ) = None
+
+    # If `switch_on` is proven, at prepare, to evaluate to a string or int.
+    switch_on_typed: bool = False
+
+
+class StepPrefetch(NamedTuple):
+    # The step inputs its ResourceFunction's resource name is computed from.
+    # These depend only on `parent`.
+    inputs: celpy.Runner | None
+
+
+class SubWorkflowEntry(NamedTuple):
+    """Starts a flattened sub-workflow step. It evaluates the step's `inputs`,
+    which become the sub-workflow's `parent`.
+    """
+
+
+class SubWorkflowExit(NamedTuple):
+    """Completes a flattened sub-workflow step, combining the outcomes of the
+    sub-workflow's steps as reconciling the sub-workflow would.
+    """
+
+    workflow_name: str
+    entry: str
+    # The sub-workflow's own steps, in order, as (dependency label, sub-step
+    # label, sub-step state).
+    steps: Sequence[tuple[str, str, celpy.Runner | None]]
+
 
 class Step(NamedTuple):
     label: str
-    logic: ResourceFunction | ValueFunction | Workflow | LogicSwitch
+    logic: (
+        ResourceFunction
+        | ValueFunction
+        | Workflow
+        | LogicSwitch
+        | SubWorkflowEntry
+        | SubWorkflowExit
+    )
 
     skip_if: celpy.Runner | None
     for_each: ForEach | None
@@ -41,12 +85,39 @@ class Step(NamedTuple):
 
     dynamic_input_keys: set[str]
 
+    prefetch: StepPrefetch | None = None
+
+    # Seconds the step may run for, within the Workflow's own budget.
+    timeout: int | None = None
+
+    # For steps inlined from a sub-workflow, the step providing `parent`.
+    parent_step: str | None = None
+    # For steps inlined from a sub-workflow, the label each dependency is
+    # known by within `steps`.
+    dependency_labels: dict[str, str] | None = None
+
+    # If `skip_if` is proven, at prepare, to evaluate to a bool.
+    skip_if_typed: bool = False
+
 
 class ForEach(NamedTuple):
     source_iterator: celpy.Runner
     input_key: str
     condition: StepConditionSpec | None
 
+    # If `source_iterator` is proven, at prepare, to evaluate to a list.
+    source_iterator_typed: bool = False
+
+    # If the step's `refSwitch` does not depend on the iterated item, so may
+    # be evaluated once for all items.
+    switch_invariant: bool = False
+    # Likewise, for the step's Function's `preconditions` and `locals`.
+    preconditions_invariant: bool = False
+    locals_invariant: bool = False
+
+    # Report a count of the managed resources, rather than every item's.
+    summarize_resource_ids: bool = False
+
 
 class ErrorStep(NamedTuple):
     label: str
@@ -56,6 +127,16 @@ class ErrorStep(NamedTuple):
     state: None = None
 
 
+class StepGraph(NamedTuple):
+    # Labels of the steps which wait on each step.
+    dependents: dict[str, tuple[str, ...]]
+    # Number of steps each step waits on.
+    dependency_counts: dict[str, int]
+    # Length of the longest chain of steps starting from each step. Steps on
+    # longer chains are dispatched first.
+    priority: dict[str, int]
+
+
 class Workflow(NamedTuple):
     name: str
     crd_ref: ConfigCRDRef | None
@@ -64,3 +145,15 @@ class Workflow(NamedTuple):
     steps: Sequence[Step | ErrorStep]
 
     dynamic_input_keys: set[str]
+
+    step_graph: StepGraph | None = None
+
+    # Seconds the Workflow's steps may run for.
+    timeout: int | None = None
+
+    # Maximum number of the Workflow's steps reconciled at once, unbounded if
+    # `None`.
+    max_concurrent_steps: int | None = None
+
+    # When results are cached, the `parent` paths they are keyed by.
+    result_key_paths: tuple[str, ...] | None = None
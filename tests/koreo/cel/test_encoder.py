@@ -71,6 +71,32 @@ class TestEncodeBools(unittest.TestCase):
             json.dumps(convert_bools(value)),
         )
 
+    def test_scalar_types(self):
+        self.assertIs(True, convert_bools(celtypes.BoolType(True)))
+        self.assertIs(False, convert_bools(celtypes.BoolType(False)))
+        self.assertIsNone(convert_bools(celtypes.NullType()))
+        self.assertEqual("YQ==", convert_bools(celtypes.BytesType(b"a")))
+        self.assertEqual(2.5, convert_bools(celtypes.DoubleType(2.5)))
+        self.assertEqual(
+            [1, "two", [3]],
+            convert_bools((celtypes.IntType(1), celtypes.StringType("two"), (3,))),
+        )
+
+    def test_deeply_nested(self):
+        depth = 5000
+        value = celtypes.BoolType(True)
+        for _ in range(depth):
+            value = celtypes.MapType(
+                {celtypes.StringType("nested"): celtypes.ListType([value])}
+            )
+
+        converted = convert_bools(value)
+
+        for _ in range(depth):
+            converted = converted["nested"][0]
+
+        self.assertIs(True, converted)
+
 
 class TestEncodeCel(unittest.TestCase):
     def test_empty_str(self):
@@ -193,3 +219,21 @@ class TestEncodeCel(unittest.TestCase):
             encode_cel(value),
         )
         # fmt: on
+
+    def test_exponent_float_str(self):
+        value = "1e5"
+        self.assertEqual("1e5", encode_cel(value))
+
+    def test_non_numeric_float_str(self):
+        for value in ("nan", "inf", "Infinity", "1_000"):
+            self.assertEqual(f'"{value}"', encode_cel(value))
+
+    def test_deeply_nested(self):
+        depth = 5000
+        value = "=inputs.value"
+        for _ in range(depth):
+            value = {"nested": [value]}
+
+        encoded = encode_cel(value)
+
+        self.assertEqual(f"{'{"nested":[' * depth}inputs.value{']}' * depth}", encoded)
@@ -0,0 +1,33 @@
+import unittest
+
+from celpy import celtypes
+
+from koreo.cel.functions import koreo_function_annotations
+from koreo.cel.prepare import get_cel_environment
+
+
+class TestGetCelEnvironment(unittest.TestCase):
+    def test_default_is_shared(self):
+        self.assertIs(get_cel_environment(), get_cel_environment())
+
+    def test_same_annotations_share(self):
+        self.assertIs(
+            get_cel_environment(),
+            get_cel_environment(annotations=dict(koreo_function_annotations)),
+        )
+
+    def test_distinct_annotations(self):
+        custom = get_cel_environment(annotations={"unit_test": celtypes.FunctionType})
+
+        self.assertIsNot(get_cel_environment(), custom)
+        self.assertIs(
+            custom,
+            get_cel_environment(annotations={"unit_test": celtypes.FunctionType}),
+        )
+
+    def test_annotations_not_mutated(self):
+        annotations = {"unit_test": celtypes.FunctionType}
+
+        get_cel_environment(annotations=annotations)
+
+        self.assertDictEqual({"unit_test": celtypes.FunctionType}, annotations)
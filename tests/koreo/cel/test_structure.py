@@ -2,7 +2,12 @@ import unittest
 
 import celpy
 
-from koreo.cel.structure_extractor import extract_argument_structure
+from koreo.cel.structure_extractor import (
+    extract_argument_structure,
+    extract_argument_trie,
+    extract_read_paths,
+    trie_paths,
+)
 
 
 class TestArgumentStructureExtractor(unittest.TestCase):
@@ -98,3 +103,99 @@ class TestArgumentStructureExtractor(unittest.TestCase):
         )
 
         self.assertListEqual(expected, sorted_result)
+
+    def test_method_chain_args(self):
+        env = celpy.Environment()
+
+        cel_str = "steps['list'][0].split('-').size + parent.spec.values.map(v, v)"
+
+        result = extract_argument_structure(env.compile(cel_str))
+
+        expected = sorted(
+            [
+                "parent.spec",
+                "parent.spec.values",
+                "steps.list",
+                "steps.list.0",
+                "steps.list.0.split.size",
+            ]
+        )
+
+        self.assertListEqual(expected, sorted(result))
+
+    def test_repeated_extraction(self):
+        env = celpy.Environment()
+
+        compiled = env.compile("steps.one.value + steps['two'].value")
+
+        first = extract_argument_structure(compiled)
+        first.add("mutated")
+
+        self.assertNotIn("mutated", extract_argument_structure(compiled))
+
+
+class TestArgumentTrie(unittest.TestCase):
+    def test_trie(self):
+        env = celpy.Environment()
+
+        cel_str = """{
+            "step": steps.nested1.one,
+            "other_step": steps['nested2'][0],
+            "parent": parent.spec.value,
+            "parent_index": parent.metadata['labels'],
+            "inputs": inputs.value
+        }
+        """
+
+        trie = extract_argument_trie(env.compile(cel_str))
+
+        self.assertDictEqual(
+            {
+                "steps": {"nested1": {"one": {}}, "nested2": {"0": {}}},
+                "parent": {"spec": {"value": {}}, "metadata": {"labels": {}}},
+                "inputs": {"value": {}},
+            },
+            trie,
+        )
+
+    def test_trie_paths(self):
+        trie = {"spec": {"value": {}, "other": {"deep": {}}}, "metadata": {}}
+
+        self.assertSetEqual(
+            {"spec", "spec.value", "spec.other", "spec.other.deep", "metadata"},
+            trie_paths(trie),
+        )
+
+    def test_trie_paths_empty(self):
+        self.assertSetEqual(set(), trie_paths({}))
+
+
+class TestReadPaths(unittest.TestCase):
+    def _read_paths(self, cel_str: str):
+        env = celpy.Environment()
+        return extract_read_paths(env.compile(cel_str))
+
+    def test_members(self):
+        self.assertSetEqual(
+            {("parent", "spec", "value"), ("parent", "metadata", "labels")},
+            self._read_paths("[parent.spec.value, parent.metadata['labels']]"),
+        )
+
+    def test_whole_value(self):
+        self.assertSetEqual({("parent",)}, self._read_paths("{'p': parent}"))
+        self.assertSetEqual({("parent",)}, self._read_paths("size(parent) > 0"))
+        self.assertSetEqual(
+            {("parent", "spec"), ("parent", "spec", "value")},
+            self._read_paths("size(parent.spec) + parent.spec.value"),
+        )
+
+    def test_computed_index(self):
+        self.assertSetEqual(
+            {("parent", "spec"), ("steps", "key")},
+            self._read_paths("parent.spec[steps.key].value"),
+        )
+
+    def test_method_call(self):
+        self.assertIn(
+            ("parent", "items"), self._read_paths("parent.items.all(i, i > 0)")
+        )
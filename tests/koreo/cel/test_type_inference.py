@@ -0,0 +1,120 @@
+import unittest
+
+import celpy
+from celpy import celtypes
+
+from koreo.cel.type_inference import (
+    check_result_type,
+    infer_result_type,
+    is_proven_type,
+)
+from koreo.result import PermFail
+
+
+class TestInferResultType(unittest.TestCase):
+    def test_known_types(self):
+        env = celpy.Environment()
+
+        cases = (
+            ("true", celtypes.BoolType),
+            ("inputs.count > 1", celtypes.BoolType),
+            ("!inputs.enabled", celtypes.BoolType),
+            ("inputs.a && inputs.b || inputs.c", celtypes.BoolType),
+            ("'value' in inputs.values", celtypes.BoolType),
+            ("has(inputs.value)", celtypes.BoolType),
+            ("inputs.name.startsWith('test')", celtypes.BoolType),
+            ("(inputs.count == 2)", celtypes.BoolType),
+            ("'a string'", celtypes.StringType),
+            ("string(inputs.count)", celtypes.StringType),
+            ("inputs.enabled ? 'on' : 'off'", celtypes.StringType),
+            ("17", celtypes.IntType),
+            ("-(17)", celtypes.IntType),
+            ("size(inputs.values)", celtypes.IntType),
+            ("1.5", celtypes.DoubleType),
+            ("null", celtypes.NullType),
+            ("{'key': inputs.value}", celtypes.MapType),
+            ("[inputs.value]", celtypes.ListType),
+            ("inputs.values.map(value, value + 1)", celtypes.ListType),
+        )
+
+        for expression, expected in cases:
+            self.assertIs(
+                expected, infer_result_type(env.compile(expression)), expression
+            )
+
+    def test_unknown_types(self):
+        env = celpy.Environment()
+
+        cases = (
+            "inputs.value",
+            "inputs['value']",
+            "inputs.value + 1",
+            "-inputs.count",
+            "inputs.enabled ? 'on' : 1",
+            "unknown_function(inputs.value)",
+        )
+
+        for expression in cases:
+            self.assertIsNone(infer_result_type(env.compile(expression)), expression)
+
+
+class TestCheckResultType(unittest.TestCase):
+    def test_allowed(self):
+        env = celpy.Environment()
+        expression = env.program(env.compile("inputs.count > 1"))
+
+        self.assertIsNone(
+            check_result_type(
+                expression,
+                allowed=(celtypes.BoolType,),
+                description="a bool",
+                location="unit-test",
+            )
+        )
+
+    def test_unknown_is_allowed(self):
+        env = celpy.Environment()
+        expression = env.program(env.compile("inputs.value"))
+
+        self.assertIsNone(
+            check_result_type(
+                expression,
+                allowed=(celtypes.BoolType,),
+                description="a bool",
+                location="unit-test",
+            )
+        )
+
+    def test_mismatch(self):
+        env = celpy.Environment()
+        expression = env.program(env.compile("'true'"))
+
+        result = check_result_type(
+            expression,
+            allowed=(celtypes.BoolType,),
+            description="a bool",
+            location="unit-test",
+        )
+
+        self.assertIsInstance(result, PermFail)
+        self.assertIn("must evaluate to a bool", result.message)
+
+
+class TestIsProvenType(unittest.TestCase):
+    def test_proven(self):
+        env = celpy.Environment()
+        expression = env.program(env.compile("inputs.count > 1"))
+
+        self.assertTrue(is_proven_type(expression, allowed=(celtypes.BoolType,)))
+
+    def test_unknown_is_not_proven(self):
+        env = celpy.Environment()
+        expression = env.program(env.compile("inputs.value"))
+
+        self.assertFalse(is_proven_type(expression, allowed=(celtypes.BoolType,)))
+
+    def test_mismatch_is_not_proven(self):
+        env = celpy.Environment()
+        expression = env.program(env.compile("'true'"))
+
+        self.assertFalse(is_proven_type(expression, allowed=(celtypes.BoolType,)))
@@ -156,6 +156,7 @@ class TestEndToEndResourceFunction(unittest.IsolatedAsyncioTestCase):
                                     "bool": True,
                                     "list": [1, 2, 3],
                                     "object": {"one": 1, "two": 2},
+                                    "createOnly": "value",
                                 }
                             },
                         },
@@ -230,3 +231,42 @@ class TestEndToEndResourceFunction(unittest.IsolatedAsyncioTestCase):
             )
 
             raise self.failureException(f"{test_name} Failure: {message}")
+
+
+class TestMockApi(unittest.IsolatedAsyncioTestCase):
+    def _current(self):
+        return {
+            "apiVersion": "test.koreo.dev/v1",
+            "kind": "TestResource",
+            "metadata": {"name": "current", "namespace": "unittests"},
+            "spec": {"keep": 1, "change": 1, "remove": 1},
+        }
+
+    async def test_get_by_name(self):
+        api = run.MockApi(current_resource=self._current())
+
+        self.assertEqual(
+            1, len([match async for match in api.async_get(None, "current")])
+        )
+        self.assertEqual(
+            0, len([match async for match in api.async_get(None, "other")])
+        )
+
+    async def test_list(self):
+        api = run.MockApi(current_resource=self._current())
+
+        listed = [match async for match in api.async_get(None, namespace="unittests")]
+
+        self.assertEqual(["current"], [match.name for match in listed])
+
+    async def test_patch_merges(self):
+        api = run.MockApi(current_resource=self._current())
+
+        async with api.call_api(
+            "PATCH", data='{"spec": {"change": 2, "remove": null}}'
+        ):
+            pass
+
+        self.assertDictEqual(
+            self._current() | {"spec": {"keep": 1, "change": 2}}, api.materialized
+        )
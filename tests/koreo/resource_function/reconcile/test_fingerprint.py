@@ -0,0 +1,93 @@
+import unittest
+
+from koreo.resource_function.reconcile import fingerprint
+
+
+def _resource(uid: str, resource_version: str) -> dict:
+    return {
+        "metadata": {
+            "name": "unit-test",
+            "uid": uid,
+            "resourceVersion": resource_version,
+        }
+    }
+
+
+class TestIntentFingerprint(unittest.TestCase):
+    def test_key_order_stable(self):
+        self.assertEqual(
+            fingerprint.intent_fingerprint({"a": 1, "b": {"c": [1, 2], "d": True}}),
+            fingerprint.intent_fingerprint({"b": {"d": True, "c": [1, 2]}, "a": 1}),
+        )
+
+    def test_value_change(self):
+        self.assertNotEqual(
+            fingerprint.intent_fingerprint({"spec": {"replicas": 1}}),
+            fingerprint.intent_fingerprint({"spec": {"replicas": 2}}),
+        )
+
+    def test_unencodable(self):
+        self.assertIsNone(fingerprint.intent_fingerprint({"a": 1, 2: "mixed keys"}))
+
+
+class TestMatchCache(unittest.TestCase):
+    def tearDown(self):
+        fingerprint._reset()
+
+    def test_unknown(self):
+        intent = fingerprint.intent_fingerprint({"spec": {}})
+
+        self.assertFalse(fingerprint.is_known_match(_resource("uid-1", "1"), intent))
+
+    def test_known_match(self):
+        intent = fingerprint.intent_fingerprint({"spec": {}})
+
+        fingerprint.record_match(_resource("uid-1", "1"), intent)
+
+        self.assertTrue(fingerprint.is_known_match(_resource("uid-1", "1"), intent))
+
+    def test_resource_version_changed(self):
+        intent = fingerprint.intent_fingerprint({"spec": {}})
+
+        fingerprint.record_match(_resource("uid-1", "1"), intent)
+
+        self.assertFalse(fingerprint.is_known_match(_resource("uid-1", "2"), intent))
+
+    def test_intent_changed(self):
+        fingerprint.record_match(
+            _resource("uid-1", "1"), fingerprint.intent_fingerprint({"spec": {}})
+        )
+
+        self.assertFalse(
+            fingerprint.is_known_match(
+                _resource("uid-1", "1"),
+                fingerprint.intent_fingerprint({"spec": {"value": 1}}),
+            )
+        )
+
+    def test_missing_metadata(self):
+        intent = fingerprint.intent_fingerprint({"spec": {}})
+
+        fingerprint.record_match({"metadata": {}}, intent)
+
+        self.assertFalse(fingerprint.is_known_match({"metadata": {}}, intent))
+        self.assertFalse(fingerprint.is_known_match({}, intent))
+
+    def test_no_fingerprint(self):
+        fingerprint.record_match(_resource("uid-1", "1"), None)
+
+        self.assertFalse(fingerprint.is_known_match(_resource("uid-1", "1"), None))
+
+    def test_bounded(self):
+        intent = fingerprint.intent_fingerprint({"spec": {}})
+
+        for idx in range(fingerprint.MATCH_CACHE_SIZE + 10):
+            fingerprint.record_match(_resource(f"uid-{idx}", "1"), intent)
+
+        self.assertEqual(fingerprint.MATCH_CACHE_SIZE, len(fingerprint._matched))
+        self.assertFalse(fingerprint.is_known_match(_resource("uid-0", "1"), intent))
+        self.assertTrue(
+            fingerprint.is_known_match(
+                _resource(f"uid-{fingerprint.MATCH_CACHE_SIZE + 9}", "1"), intent
+            )
+        )
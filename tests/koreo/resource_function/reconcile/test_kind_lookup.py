@@ -1,11 +1,16 @@
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, patch
 import asyncio
+import contextlib
 import unittest
 
 import kr8s.asyncio
 
+from koreo.resource_function.reconcile import kind_lookup
 from koreo.resource_function.reconcile.kind_lookup import (
+    cached_plural_kind,
     get_plural_kind,
+    prefetch_plural_kinds,
+    schedule_plural_prefetch,
     _reset,
     _lookup_locks,
 )
@@ -127,3 +132,265 @@ class TestGetFullKind(unittest.IsolatedAsyncioTestCase):
 
         with self.assertRaises(ZeroDivisionError):
             await get_plural_kind(api_mock, "unittest", api_version)
+
+
+API_RESOURCES = [
+    {"version": "v1", "kind": "Pod", "name": "pods", "namespaced": True},
+    {"version": "unit.test/v1", "kind": "UnitTest", "name": "unittesties"},
+    {
+        "version": "unit.test/v1",
+        "kind": "ClusterTest",
+        "name": "clustertests",
+        "namespaced": False,
+    },
+]
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: dict):
+        self.status_code = status_code
+        self.body = body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"Unit test HTTP {self.status_code}")
+
+    def json(self):
+        return self.body
+
+
+class FakeDiscoveryApi:
+    """Serves `api_resources` and `lookup_kind` from the `cached` discovery, as
+    kr8s does, while group-version discovery reflects what is `installed`.
+    """
+
+    def __init__(self, cached: list[dict]):
+        self.cached = cached
+        self.installed = cached
+        self.api_resources_calls = 0
+        self.lookup_kind_calls = 0
+        self.discovered: list[str] = []
+
+    async def api_resources(self):
+        self.api_resources_calls += 1
+        return self.cached
+
+    async def lookup_kind(self, lookup_kind: str):
+        self.lookup_kind_calls += 1
+        for resource in self.cached:
+            if _lookup_kind(resource) == lookup_kind:
+                return None, resource["name"], resource.get("namespaced", True)
+        raise ValueError(f"Kind {lookup_kind} not found.")
+
+    @contextlib.asynccontextmanager
+    async def call_api(self, url: str, raise_for_status: bool = True, **_):
+        self.discovered.append(url)
+        resources = [
+            {key: value for key, value in resource.items() if key != "version"}
+            for resource in self.installed
+            if resource["version"] == url
+        ]
+        if not resources:
+            yield FakeResponse(404, {})
+        else:
+            yield FakeResponse(200, {"resources": resources})
+
+
+def _lookup_kind(resource: dict) -> str:
+    if resource["version"] == "v1":
+        return resource["kind"]
+    return f"{resource['kind']}.{resource['version']}"
+
+
+class TestPrefetchPluralKinds(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        _reset()
+
+    async def test_batched_discovery(self):
+        api_mock = AsyncMock(kr8s.asyncio.Api)
+        api_mock.api_resources.return_value = API_RESOURCES
+
+        self.assertIsNone(cached_plural_kind("UnitTest", "unit.test/v1"))
+        self.assertIsNone(cached_plural_kind("ClusterTest", "unit.test/v1"))
+        self.assertIsNone(cached_plural_kind("Pod", "v1"))
+
+        await prefetch_plural_kinds(api_mock)
+
+        self.assertEqual(1, api_mock.api_resources.call_count)
+        self.assertEqual("unittesties", cached_plural_kind("UnitTest", "unit.test/v1"))
+        self.assertEqual(
+            "clustertests", cached_plural_kind("ClusterTest", "unit.test/v1")
+        )
+        self.assertEqual("pods", cached_plural_kind("Pod", "v1"))
+
+    async def test_lookup_uses_discovery(self):
+        api_mock = AsyncMock(kr8s.asyncio.Api)
+        api_mock.api_resources.return_value = API_RESOURCES
+
+        cached_plural_kind("UnitTest", "unit.test/v1")
+        cached_plural_kind("ClusterTest", "unit.test/v1")
+
+        self.assertEqual(
+            "unittesties", await get_plural_kind(api_mock, "UnitTest", "unit.test/v1")
+        )
+        self.assertEqual(
+            "clustertests",
+            await get_plural_kind(api_mock, "ClusterTest", "unit.test/v1"),
+        )
+
+        self.assertEqual(1, api_mock.api_resources.call_count)
+        self.assertEqual(0, api_mock.lookup_kind.call_count)
+
+    async def test_discovery_miss_is_missing(self):
+        api_mock = AsyncMock(kr8s.asyncio.Api)
+        api_mock.api_resources.return_value = []
+
+        cached_plural_kind("UnitTest", "unit.test/v1")
+
+        self.assertIsNone(await get_plural_kind(api_mock, "UnitTest", "unit.test/v1"))
+        self.assertIsNone(await get_plural_kind(api_mock, "UnitTest", "unit.test/v1"))
+
+        self.assertEqual(1, api_mock.api_resources.call_count)
+        self.assertEqual(0, api_mock.lookup_kind.call_count)
+
+    async def test_discovery_failure(self):
+        api_mock = AsyncMock(kr8s.asyncio.Api)
+        api_mock.api_resources.side_effect = ZeroDivisionError("Unit Test")
+
+        cached_plural_kind("UnitTest", "unit.test/v1")
+
+        await prefetch_plural_kinds(api_mock)
+
+        self.assertIsNone(cached_plural_kind("UnitTest", "unit.test/v1"))
+
+
+class TestSchedulePluralPrefetch(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        _reset()
+
+    async def test_resolved_in_background(self):
+        api_mock = AsyncMock(kr8s.asyncio.Api)
+        api_mock.api_resources.return_value = API_RESOURCES
+
+        cached_plural_kind("UnitTest", "unit.test/v1")
+        cached_plural_kind("Pod", "v1")
+
+        with patch("kr8s.asyncio.api", AsyncMock(return_value=api_mock)):
+            schedule_plural_prefetch()
+            scheduled = kind_lookup._scheduled
+
+            schedule_plural_prefetch()
+            self.assertIs(scheduled, kind_lookup._scheduled)
+
+            assert scheduled
+            await scheduled
+
+        self.assertEqual(1, api_mock.api_resources.call_count)
+        self.assertEqual("unittesties", cached_plural_kind("UnitTest", "unit.test/v1"))
+        self.assertEqual("pods", cached_plural_kind("Pod", "v1"))
+        self.assertIsNone(kind_lookup._scheduled)
+
+    async def test_nothing_queued(self):
+        schedule_plural_prefetch()
+
+        self.assertIsNone(kind_lookup._scheduled)
+
+    async def test_no_api(self):
+        cached_plural_kind("UnitTest", "unit.test/v1")
+
+        with patch("kr8s.asyncio.api", AsyncMock(side_effect=ValueError("Unit test"))):
+            schedule_plural_prefetch()
+            scheduled = kind_lookup._scheduled
+
+            assert scheduled
+            await scheduled
+
+        # Left queued, to be resolved on use.
+        self.assertIn("UnitTest.unit.test/v1", kind_lookup._pending_kinds)
+
+
+class TestNegativeLookups(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        _reset()
+
+    async def test_missing_kind_cached(self):
+        api_mock = AsyncMock(kr8s.asyncio.Api)
+        api_mock.lookup_kind.side_effect = ValueError("Kind not found")
+
+        self.assertIsNone(await get_plural_kind(api_mock, "UnitTest", "unit.test/v1"))
+        self.assertIsNone(await get_plural_kind(api_mock, "UnitTest", "unit.test/v1"))
+
+        self.assertEqual(1, api_mock.lookup_kind.call_count)
+
+    async def test_missing_kind_not_queued(self):
+        api = FakeDiscoveryApi(cached=[])
+
+        self.assertIsNone(await get_plural_kind(api, "UnitTest", "unit.test/v1"))
+
+        cached_plural_kind("UnitTest", "unit.test/v1")
+        await prefetch_plural_kinds(api)
+
+        self.assertEqual(0, api.api_resources_calls)
+
+    async def test_missing_kind_expires(self):
+        api = FakeDiscoveryApi(cached=[])
+
+        self.assertIsNone(await get_plural_kind(api, "UnitTest", "unit.test/v1"))
+
+        api.installed = list(API_RESOURCES)
+        kind_lookup._missing_kinds["UnitTest.unit.test/v1"] = 0
+
+        self.assertEqual(
+            "unittesties", await get_plural_kind(api, "UnitTest", "unit.test/v1")
+        )
+        self.assertEqual(1, api.lookup_kind_calls)
+        self.assertListEqual(["unit.test/v1"], api.discovered)
+
+    async def test_expired_still_missing(self):
+        api = FakeDiscoveryApi(cached=[])
+
+        self.assertIsNone(await get_plural_kind(api, "UnitTest", "unit.test/v1"))
+
+        kind_lookup._missing_kinds["UnitTest.unit.test/v1"] = 0
+
+        self.assertIsNone(await get_plural_kind(api, "UnitTest", "unit.test/v1"))
+        self.assertIsNone(await get_plural_kind(api, "UnitTest", "unit.test/v1"))
+        self.assertListEqual(["unit.test/v1"], api.discovered)
+
+    async def test_expired_prefetch(self):
+        api = FakeDiscoveryApi(cached=[API_RESOURCES[0]])
+
+        cached_plural_kind("UnitTest", "unit.test/v1")
+        await prefetch_plural_kinds(api)
+        self.assertIsNone(await get_plural_kind(api, "UnitTest", "unit.test/v1"))
+
+        api.installed = list(API_RESOURCES)
+        kind_lookup._missing_kinds["UnitTest.unit.test/v1"] = 0
+
+        self.assertIsNone(cached_plural_kind("UnitTest", "unit.test/v1"))
+        cached_plural_kind("Pod", "v1")
+        await prefetch_plural_kinds(api)
+
+        self.assertEqual("unittesties", cached_plural_kind("UnitTest", "unit.test/v1"))
+        self.assertEqual("pods", cached_plural_kind("Pod", "v1"))
+        self.assertListEqual(["unit.test/v1"], api.discovered)
+        self.assertEqual(2, api.api_resources_calls)
+
+    async def test_failed_lookup_cached(self):
+        api_mock = AsyncMock(kr8s.asyncio.Api)
+        api_mock.lookup_kind.side_effect = asyncio.TimeoutError()
+
+        with self.assertRaises(Exception):
+            await get_plural_kind(api_mock, "UnitTest", "unit.test/v1")
+
+        with self.assertRaises(Exception):
+            await get_plural_kind(api_mock, "UnitTest", "unit.test/v1")
+
+        self.assertEqual(3, api_mock.lookup_kind.call_count)
+
+        kind_lookup._failed_lookups["UnitTest.unit.test/v1"] = 0
+
+        with self.assertRaises(Exception):
+            await get_plural_kind(api_mock, "UnitTest", "unit.test/v1")
+
+        self.assertEqual(6, api_mock.lookup_kind.call_count)
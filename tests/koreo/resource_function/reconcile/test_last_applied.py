@@ -0,0 +1,79 @@
+import json
+import unittest
+
+from koreo.constants import LAST_APPLIED_ANNOTATION
+from koreo.resource_function.reconcile import last_applied
+
+
+def _resource(uid: str | None, resource_version: str | None, applied: dict | None):
+    metadata = {"name": "unit-test"}
+    if uid:
+        metadata["uid"] = uid
+    if resource_version:
+        metadata["resourceVersion"] = resource_version
+    if applied is not None:
+        metadata["annotations"] = {LAST_APPLIED_ANNOTATION: json.dumps(applied)}
+
+    return {"metadata": metadata}
+
+
+class TestExtractLastApplied(unittest.TestCase):
+    def tearDown(self):
+        last_applied._reset()
+
+    def test_missing(self):
+        self.assertIsNone(last_applied.extract_last_applied({}))
+        self.assertIsNone(last_applied.extract_last_applied({"metadata": {}}))
+        self.assertIsNone(
+            last_applied.extract_last_applied(_resource("uid-1", "1", None))
+        )
+
+    def test_parsed(self):
+        applied = {"spec": {"value": 1}}
+
+        self.assertEqual(
+            applied,
+            last_applied.extract_last_applied(_resource("uid-1", "1", applied)),
+        )
+
+    def test_cached_per_resource_version(self):
+        first = last_applied.extract_last_applied(
+            _resource("uid-1", "1", {"spec": {"value": 1}})
+        )
+        second = last_applied.extract_last_applied(
+            _resource("uid-1", "1", {"spec": {"value": 1}})
+        )
+
+        self.assertIs(first, second)
+        self.assertEqual(
+            last_applied.CacheStats(hits=1, misses=1, evictions=0, size=1),
+            last_applied.cache_stats(),
+        )
+
+    def test_resource_version_changed(self):
+        last_applied.extract_last_applied(
+            _resource("uid-1", "1", {"spec": {"value": 1}})
+        )
+        updated = last_applied.extract_last_applied(
+            _resource("uid-1", "2", {"spec": {"value": 2}})
+        )
+
+        self.assertEqual({"spec": {"value": 2}}, updated)
+        self.assertEqual(2, last_applied.cache_stats().misses)
+        self.assertEqual(1, last_applied.cache_stats().size)
+
+    def test_not_cached_without_uid(self):
+        last_applied.extract_last_applied(_resource(None, "1", {"value": 1}))
+        last_applied.extract_last_applied(_resource("uid-1", None, {"value": 1}))
+
+        self.assertEqual(0, last_applied.cache_stats().size)
+
+    def test_bounded(self):
+        for idx in range(last_applied.LAST_APPLIED_CACHE_SIZE + 5):
+            last_applied.extract_last_applied(
+                _resource(f"uid-{idx}", "1", {"value": idx})
+            )
+
+        stats = last_applied.cache_stats()
+        self.assertEqual(last_applied.LAST_APPLIED_CACHE_SIZE, stats.size)
+        self.assertEqual(5, stats.evictions)
@@ -0,0 +1,131 @@
+import copy
+import json
+import unittest
+
+from koreo.constants import LAST_APPLIED_ANNOTATION
+from koreo.resource_function.reconcile import _prepare_patch_for_api
+from koreo.resource_function.reconcile.patch import build_merge_patch
+from koreo.resource_function.reconcile.validate import collect_differences
+
+
+class TestBuildMergePatch(unittest.TestCase):
+    def test_no_differences(self):
+        self.assertEqual(
+            {}, build_merge_patch(target={"spec": {"a": 1}}, differences=[])
+        )
+
+    def test_changed_fields_only(self):
+        target = {
+            "metadata": {"name": "test", "labels": {"a": "1", "b": "2"}},
+            "spec": {"one": 1, "two": 2, "nested": {"three": 3, "four": 4}},
+        }
+        actual = copy.deepcopy(target)
+        actual["metadata"]["labels"]["b"] = "changed"
+        actual["spec"]["nested"]["four"] = "changed"
+
+        patch = build_merge_patch(
+            target=target,
+            differences=collect_differences(target=target, actual=actual),
+        )
+
+        self.assertEqual(
+            {"metadata": {"labels": {"b": "2"}}, "spec": {"nested": {"four": 4}}},
+            patch,
+        )
+
+    def test_missing_subtree(self):
+        target = {"spec": {"one": 1, "nested": {"three": 3, "four": 4}}}
+        actual = {"spec": {"one": 1}}
+
+        patch = build_merge_patch(
+            target=target,
+            differences=collect_differences(target=target, actual=actual),
+        )
+
+        self.assertEqual({"spec": {"nested": {"three": 3, "four": 4}}}, patch)
+
+    def test_arrays_replaced(self):
+        target = {"spec": {"items": [{"name": "a", "value": 1}, {"name": "b"}]}}
+        actual = {"spec": {"items": [{"name": "a", "value": 2}, {"name": "b"}]}}
+
+        patch = build_merge_patch(
+            target=target,
+            differences=collect_differences(target=target, actual=actual),
+        )
+
+        self.assertEqual(target, patch)
+
+    def test_compare_as_map(self):
+        target = {
+            "x-koreo-compare-as-map": {"items": ["name"]},
+            "items": [{"name": "a", "value": 1}, {"name": "b", "value": 2}],
+            "other": "same",
+        }
+        actual = {
+            "items": [{"name": "b", "value": 2}, {"name": "a", "value": 3}],
+            "other": "same",
+        }
+
+        patch = build_merge_patch(
+            target={
+                key: value
+                for key, value in target.items()
+                if key != "x-koreo-compare-as-map"
+            },
+            differences=collect_differences(target=target, actual=actual),
+        )
+
+        self.assertEqual({"items": target["items"]}, patch)
+
+    def test_overlapping_differences(self):
+        target = {"spec": {"nested": {"three": 3, "four": 4}}}
+
+        patch = build_merge_patch(
+            target=target,
+            differences=collect_differences(
+                target=target, actual={"spec": {"nested": {"three": 0, "four": 0}}}
+            )
+            + collect_differences(target=target, actual={"spec": {}}),
+        )
+
+        self.assertEqual(target, patch)
+
+
+class TestPreparePatchForApi(unittest.TestCase):
+    def test_last_applied_changed(self):
+        target = {
+            "metadata": {"name": "test"},
+            "spec": {"x-koreo-compare-as-set": ["values"], "values": [1, 2]},
+        }
+        actual = {"metadata": {"name": "test"}, "spec": {"values": [1]}}
+
+        patch = _prepare_patch_for_api(
+            obj=target,
+            differences=collect_differences(target=target, actual=actual),
+            resource=actual,
+        )
+
+        self.assertEqual([1, 2], patch["spec"]["values"])
+        self.assertNotIn("x-koreo-compare-as-set", patch["spec"])
+        self.assertEqual(
+            {"metadata": {"name": "test"}, "spec": {"values": [1, 2]}},
+            json.loads(patch["metadata"]["annotations"][LAST_APPLIED_ANNOTATION]),
+        )
+
+    def test_last_applied_unchanged(self):
+        target = {"metadata": {"name": "test"}, "spec": {"value": 2}}
+        actual = {
+            "metadata": {
+                "name": "test",
+                "annotations": {LAST_APPLIED_ANNOTATION: json.dumps(target)},
+            },
+            "spec": {"value": 1},
+        }
+
+        patch = _prepare_patch_for_api(
+            obj=target,
+            differences=collect_differences(target=target, actual=actual),
+            resource=actual,
+        )
+
+        self.assertEqual({"spec": {"value": 2}}, patch)
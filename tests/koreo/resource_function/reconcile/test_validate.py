@@ -202,27 +202,42 @@ class TestSetValidator(unittest.TestCase):
             (difference_message, *_) = match.differences
             self.assertIn("unexpectedly", difference_message, f"{label} mismatch")
 
-    def test_dict_error_message(self):
+    def test_dict_match(self):
         objects = [
-            {"name": string_generator(20)},
-            {"name": string_generator(20)},
-            {"name": string_generator(20)},
+            {"name": string_generator(20), "verbs": ["get", "list"]},
+            {"name": string_generator(20), "verbs": ["get"]},
+            {"name": string_generator(20), "nested": {"a": True, "b": 1}},
             {"name": string_generator(20)},
         ]
 
-        lhs = objects[:]
+        lhs = copy.deepcopy(objects)
         random.shuffle(lhs)
 
-        rhs = objects[:]
+        rhs = copy.deepcopy(objects)
         random.shuffle(rhs)
 
+        match = validate._validate_set_match(target=lhs, actual=rhs)
+        self.assertTrue(match.match)
+        self.assertFalse(match.differences)
+
+    def test_dict_mismatch(self):
+        lhs = [{"name": "one", "value": 1}, {"name": "two", "value": 2}]
+        rhs = [{"name": "two", "value": 2}, {"value": 3, "name": "one"}]
+
         match = validate._validate_set_match(target=lhs, actual=rhs)
         self.assertFalse(match.match)
 
         (difference_message, *_) = match.differences
-        self.assertIn("x-koreo-compare-as-map", difference_message)
+        self.assertIn("missing", difference_message)
+        self.assertIn("'value': 1", difference_message)
 
-    def test_list_message(self):
+    def test_bool_distinct_from_int(self):
+        match = validate._validate_set_match(
+            target=[{"value": True}, [1]], actual=[{"value": 1}, [1]]
+        )
+        self.assertFalse(match.match)
+
+    def test_list_match(self):
         objects = [
             [
                 string_generator(random.randint(5, 50))
@@ -241,10 +256,8 @@ class TestSetValidator(unittest.TestCase):
         random.shuffle(rhs)
 
         match = validate._validate_set_match(target=lhs, actual=rhs)
-        self.assertFalse(match.match)
-
-        (difference_message, *_) = match.differences
-        self.assertIn("unhashable", difference_message)
+        self.assertTrue(match.match)
+        self.assertFalse(match.differences)
 
     def test_nulls(self):
         non_nulls = [
@@ -584,3 +597,116 @@ class TestDifferenceValidator(unittest.TestCase):
         )
         self.assertTrue(match.differences)
         self.assertFalse(match.match)
+
+
+class TestCollectDifferences(unittest.TestCase):
+    def test_match(self):
+        target = {"spec": {"one": 1, "list": [1, 2, {"a": "b"}]}}
+
+        self.assertEqual(
+            [],
+            validate.collect_differences(target=target, actual=copy.deepcopy(target)),
+        )
+
+    def test_all_differences(self):
+        target = {
+            "spec": {
+                "one": 1,
+                "two": "two",
+                "list": [1, 2, {"a": "b"}],
+                "missing": True,
+            }
+        }
+        actual = {
+            "spec": {
+                "one": 2,
+                "two": "three",
+                "list": [1, 2, {"a": "c"}],
+                "extra": "ignored",
+            }
+        }
+
+        differences = validate.collect_differences(target=target, actual=actual)
+
+        self.assertEqual(
+            {"/spec/one", "/spec/two", "/spec/list/2/a", "/spec/missing"},
+            {difference.pointer for difference in differences},
+        )
+
+    def test_limit(self):
+        target = {f"key-{idx}": idx for idx in range(20)}
+        actual = {f"key-{idx}": idx + 1 for idx in range(20)}
+
+        differences = validate.collect_differences(
+            target=target, actual=actual, limit=5
+        )
+
+        self.assertEqual(5, len(differences))
+
+    def test_pointer_escaping(self):
+        differences = validate.collect_differences(
+            target={"metadata": {"labels": {"koreo.dev/a~b": "x"}}},
+            actual={"metadata": {"labels": {"koreo.dev/a~b": "y"}}},
+        )
+
+        (difference,) = differences
+        self.assertEqual("/metadata/labels/koreo.dev~1a~0b", difference.pointer)
+
+    def test_compare_as_map_target_index(self):
+        target = {
+            "x-koreo-compare-as-map": {"as-map": ["name"]},
+            "as-map": [
+                {"name": "one", "value": 1},
+                {"name": "two", "value": 2},
+                {"name": "three", "value": 3},
+            ],
+        }
+        actual = {
+            "as-map": [
+                {"name": "two", "value": 2},
+                {"name": "one", "value": 1},
+            ],
+        }
+
+        differences = validate.collect_differences(target=target, actual=actual)
+
+        (difference,) = differences
+        self.assertEqual(("as-map", 2), difference.path)
+        self.assertIn("three", difference.message)
+
+    def test_set_differences(self):
+        target = {"x-koreo-compare-as-set": ["values"], "values": ["a", "b", "c"]}
+        actual = {"values": ["b", "d", "e"]}
+
+        differences = validate.collect_differences(target=target, actual=actual)
+
+        self.assertEqual(4, len(differences))
+        self.assertTrue(
+            all(difference.pointer == "/values" for difference in differences)
+        )
+
+    def test_validate_match_reports_first(self):
+        target = {"spec": {"list": [1, {"a": "b"}]}}
+        actual = {"spec": {"list": [1, {"a": "c"}]}}
+
+        match = validate.validate_match(target=target, actual=actual)
+
+        self.assertFalse(match.match)
+        self.assertEqual(
+            ["'spec'", "'list'", "at index '1'", "'a'", "<target:[b], resource:[c]>"],
+            list(match.differences),
+        )
+
+    def test_last_applied_not_mutated(self):
+        target = {
+            "x-koreo-compare-last-applied": ["value"],
+            "value": 1,
+            "other": 2,
+        }
+        last_applied = {"value": 1}
+
+        validate.collect_differences(
+            target=target, actual={"other": 2}, last_applied_value=last_applied
+        )
+
+        self.assertEqual({"value": 1}, last_applied)
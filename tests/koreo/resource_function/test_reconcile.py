@@ -0,0 +1,359 @@
+import unittest
+
+from celpy import celtypes
+
+from koreo import constants
+from koreo.resource_function.prepare import prepare_resource_function
+from koreo.resource_function.reconcile import (
+    BULK_LOAD_MIN_RESOURCES,
+    load_api_resource,
+    prefetch_api_resource,
+    prefetch_api_resources,
+)
+
+
+class FakeApi:
+    def __init__(self, resources: dict[tuple[str, str | None], dict]):
+        self.resources = resources
+        self.gets: list[tuple[str, str | None]] = []
+        self.lists: list[str | None] = []
+        self.list_error: Exception | None = None
+
+    async def async_get(self, resource_api, *names, namespace=None):
+        if not names:
+            self.lists.append(namespace)
+            if self.list_error:
+                raise self.list_error
+
+            for (name, resource_namespace), resource in self.resources.items():
+                if resource_namespace == namespace:
+                    yield resource_api(resource)
+            return
+
+        for name in names:
+            self.gets.append((name, namespace))
+            resource = self.resources.get((name, namespace))
+            if resource:
+                yield resource_api(resource)
+
+
+async def _prepare(api_config: dict, local_values: dict | None = None):
+    spec = {
+        "apiConfig": {
+            "apiVersion": "test.koreo.dev/v1",
+            "kind": "TestResource",
+            "plural": "testresources",
+        }
+        | api_config,
+        "resource": {"spec": {"value": "=inputs.value"}},
+    }
+    if local_values:
+        spec["locals"] = local_values
+
+    function, _ = await prepare_resource_function(cache_key="unit-test", spec=spec)
+    return function
+
+
+class TestResourceIdInputs(unittest.IsolatedAsyncioTestCase):
+    async def test_inputs(self):
+        function = await _prepare(
+            {
+                "name": "=inputs.metadata.name + '-suffix'",
+                "namespace": "=inputs.namespace",
+            }
+        )
+
+        self.assertEqual(
+            frozenset(("metadata", "namespace")),
+            function.crud_config.resource_id_inputs,
+        )
+
+    async def test_through_locals(self):
+        function = await _prepare(
+            {"name": "=locals.name", "namespace": "unit-test"},
+            local_values={"name": "=inputs.base + '-name'"},
+        )
+
+        self.assertEqual(frozenset(("base",)), function.crud_config.resource_id_inputs)
+
+    async def test_constant(self):
+        function = await _prepare({"name": "fixed-name", "namespace": "unit-test"})
+
+        self.assertEqual(frozenset(), function.crud_config.resource_id_inputs)
+
+    async def test_missing_locals(self):
+        function = await _prepare({"name": "=locals.name", "namespace": "unit-test"})
+
+        self.assertIsNone(function.crud_config.resource_id_inputs)
+
+
+class TestPrefetchApiResource(unittest.IsolatedAsyncioTestCase):
+    async def test_prefetched_resource_used(self):
+        function = await _prepare(
+            {"name": "=inputs.name + '-suffix'", "namespace": "=inputs.namespace"}
+        )
+        api = FakeApi(
+            {
+                ("unit-suffix", "unit-test"): {
+                    "metadata": {"name": "unit-suffix", "namespace": "unit-test"}
+                }
+            }
+        )
+
+        prefetched = prefetch_api_resource(
+            api=api,
+            function=function,
+            inputs=celtypes.MapType(
+                {
+                    celtypes.StringType("name"): celtypes.StringType("unit"),
+                    celtypes.StringType("namespace"): celtypes.StringType("unit-test"),
+                }
+            ),
+        )
+        assert prefetched
+
+        self.assertEqual("unit-suffix", prefetched.name)
+        self.assertEqual("unit-test", prefetched.namespace)
+
+        resource = await load_api_resource(
+            api=api,
+            resource_api=function.crud_config.resource_api,
+            name="unit-suffix",
+            namespace="unit-test",
+            prefetched=prefetched,
+        )
+
+        self.assertEqual("unit-suffix", resource.name)
+        self.assertListEqual([("unit-suffix", "unit-test")], api.gets)
+
+    async def test_prefetched_resource_mismatch(self):
+        function = await _prepare(
+            {"name": "=inputs.name", "namespace": "=inputs.namespace"}
+        )
+        api = FakeApi({})
+
+        prefetched = prefetch_api_resource(
+            api=api,
+            function=function,
+            inputs=celtypes.MapType(
+                {
+                    celtypes.StringType("name"): celtypes.StringType("guessed"),
+                    celtypes.StringType("namespace"): celtypes.StringType("unit-test"),
+                }
+            ),
+        )
+        assert prefetched and prefetched.resource
+
+        resource = await load_api_resource(
+            api=api,
+            resource_api=function.crud_config.resource_api,
+            name="actual",
+            namespace="unit-test",
+            prefetched=prefetched,
+        )
+        await prefetched.resource
+
+        self.assertIsNone(resource)
+        self.assertCountEqual(
+            [("guessed", "unit-test"), ("actual", "unit-test")], api.gets
+        )
+
+    async def test_name_not_computable(self):
+        function = await _prepare(
+            {"name": "=inputs.name", "namespace": "=inputs.namespace"}
+        )
+        api = FakeApi({})
+
+        prefetched = prefetch_api_resource(
+            api=api, function=function, inputs=celtypes.MapType()
+        )
+
+        self.assertIsNone(prefetched)
+        self.assertListEqual([], api.gets)
+
+    async def test_plural_lookup_needed(self):
+        function = await _prepare({"name": "fixed-name", "namespace": "unit-test"})
+        function.crud_config.resource_api.plural = constants.PLURAL_LOOKUP_NEEDED
+        api = FakeApi({})
+
+        try:
+            prefetched = prefetch_api_resource(
+                api=api, function=function, inputs=celtypes.MapType()
+            )
+        finally:
+            function.crud_config.resource_api.plural = "testresources"
+
+        self.assertIsNone(prefetched)
+
+
+def _item_inputs(name: str, namespace: str = "unit-test") -> celtypes.MapType:
+    return celtypes.MapType(
+        {
+            celtypes.StringType("name"): celtypes.StringType(name),
+            celtypes.StringType("namespace"): celtypes.StringType(namespace),
+        }
+    )
+
+
+def _resource(name: str, namespace: str = "unit-test") -> dict:
+    return {"metadata": {"name": name, "namespace": namespace}}
+
+
+class TestPrefetchApiResources(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.function = await _prepare(
+            {"name": "=inputs.name", "namespace": "=inputs.namespace"}
+        )
+
+    async def _load_all(self, api: FakeApi, names: list[str], namespaces=None):
+        if not namespaces:
+            namespaces = ["unit-test"] * len(names)
+
+        inputs = [
+            _item_inputs(name, namespace) for name, namespace in zip(names, namespaces)
+        ]
+        prefetched = prefetch_api_resources(
+            api=api, function=self.function, inputs=inputs
+        )
+
+        loaded = []
+        for name, namespace, item_prefetch in zip(names, namespaces, prefetched):
+            resource = await load_api_resource(
+                api=api,
+                resource_api=self.function.crud_config.resource_api,
+                name=name,
+                namespace=namespace,
+                prefetched=item_prefetch,
+            )
+            loaded.append(resource.name if resource else None)
+
+        return loaded
+
+    async def test_single_list(self):
+        api = FakeApi(
+            {
+                ("one", "unit-test"): _resource("one"),
+                ("two", "unit-test"): _resource("two"),
+                ("three", "unit-test"): _resource("three"),
+                ("other", "unit-test"): _resource("other"),
+            }
+        )
+
+        loaded = await self._load_all(api, ["one", "two", "three", "missing"])
+
+        self.assertListEqual(["one", "two", "three", None], loaded)
+        self.assertListEqual(["unit-test"], api.lists)
+        self.assertListEqual([], api.gets)
+
+    async def test_below_threshold(self):
+        api = FakeApi({("one", "unit-test"): _resource("one")})
+
+        names = ["one", "two", "three"][: BULK_LOAD_MIN_RESOURCES - 1]
+        loaded = await self._load_all(api, names)
+
+        self.assertListEqual(["one"] + [None] * (len(names) - 1), loaded)
+        self.assertListEqual([], api.lists)
+        self.assertEqual(len(names), len(api.gets))
+
+    async def test_below_threshold_loaded_on_use(self):
+        api = FakeApi({})
+
+        prefetched = prefetch_api_resources(
+            api=api,
+            function=self.function,
+            inputs=[_item_inputs(f"item-{idx}", f"ns-{idx}") for idx in range(50)],
+        )
+
+        self.assertEqual(50, len(prefetched))
+        self.assertTrue(all(item and not item.listing for item in prefetched))
+        self.assertListEqual([], api.lists)
+        self.assertListEqual([], api.gets)
+
+    async def test_request_count(self):
+        api = FakeApi(
+            {
+                (f"item-{idx}", "unit-test"): _resource(f"item-{idx}")
+                for idx in range(50)
+            }
+        )
+
+        loaded = await self._load_all(api, [f"item-{idx}" for idx in range(50)])
+
+        self.assertListEqual([f"item-{idx}" for idx in range(50)], loaded)
+        self.assertListEqual(["unit-test"], api.lists)
+        self.assertListEqual([], api.gets)
+
+    async def test_local_values_reused(self):
+        function = await _prepare(
+            {"name": "=locals.prefix + inputs.name", "namespace": "unit-test"},
+            local_values={"prefix": "=inputs.prefix"},
+        )
+        local_values = celtypes.MapType(
+            {celtypes.StringType("prefix"): celtypes.StringType("hoisted-")}
+        )
+
+        prefetched = prefetch_api_resources(
+            api=FakeApi({}),
+            function=function,
+            inputs=[_item_inputs("one")],
+            local_values=local_values,
+        )
+
+        item_prefetch = prefetched[0]
+        assert item_prefetch
+
+        self.assertEqual("hoisted-one", item_prefetch.name)
+        self.assertIs(local_values, item_prefetch.local_values)
+
+    async def test_local_values_evaluated(self):
+        function = await _prepare(
+            {"name": "=locals.name", "namespace": "unit-test"},
+            local_values={"name": "=inputs.name + '-local'"},
+        )
+
+        prefetched = prefetch_api_resources(
+            api=FakeApi({}), function=function, inputs=[_item_inputs("one")]
+        )
+
+        item_prefetch = prefetched[0]
+        assert item_prefetch and item_prefetch.local_values is not None
+
+        self.assertEqual("one-local", item_prefetch.name)
+        self.assertEqual("one-local", item_prefetch.local_values["name"])
+
+    async def test_grouped_by_namespace(self):
+        api = FakeApi(
+            {
+                ("one", "alpha"): _resource("one", "alpha"),
+                ("two", "alpha"): _resource("two", "alpha"),
+                ("three", "alpha"): _resource("three", "alpha"),
+                ("four", "beta"): _resource("four", "beta"),
+            }
+        )
+
+        loaded = await self._load_all(
+            api,
+            ["one", "two", "three", "four"],
+            namespaces=["alpha", "alpha", "alpha", "beta"],
+        )
+
+        self.assertListEqual(["one", "two", "three", "four"], loaded)
+        self.assertListEqual(["alpha"], api.lists)
+        self.assertListEqual([("four", "beta")], api.gets)
+
+    async def test_list_failure_falls_back(self):
+        api = FakeApi(
+            {
+                ("one", "unit-test"): _resource("one"),
+                ("two", "unit-test"): _resource("two"),
+                ("three", "unit-test"): _resource("three"),
+            }
+        )
+        api.list_error = Exception("Unit test list failure")
+
+        with self.assertLogs("koreo.function", level="WARNING"):
+            loaded = await self._load_all(api, ["one", "two", "three"])
+
+        self.assertListEqual(["one", "two", "three"], loaded)
+        self.assertListEqual(["unit-test"], api.lists)
+        self.assertEqual(3, len(api.gets))
@@ -76,3 +76,27 @@ class TestPrepareResourceTemplate(unittest.IsolatedAsyncioTestCase):
         self.assertIsInstance(
             prepared_template.template.get("spec", {}).get("bool"), celtypes.BoolType
         )
+
+    async def test_compare_plan(self):
+        prepared = await prepare_resource_template(
+            "test-case",
+            {
+                "template": {
+                    "apiVersion": "api.group/v1",
+                    "kind": "TestResource",
+                    "spec": {
+                        "x-koreo-compare-as-set": ["values"],
+                        "values": [1, 2],
+                    },
+                },
+            },
+        )
+
+        self.assertTrue(is_unwrapped_ok(prepared))
+
+        prepared_template, _ = prepared
+        assert prepared_template.compare_plan
+        self.assertEqual(
+            frozenset({"values"}),
+            prepared_template.compare_plan.children["spec"].as_set,
+        )
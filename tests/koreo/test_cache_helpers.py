@@ -0,0 +1,91 @@
+import unittest
+
+from celpy import celtypes
+
+from koreo.cache_helpers import bounded_insert, canonical_digest, value_digest
+
+
+class TestBoundedInsert(unittest.TestCase):
+    def test_within_size(self):
+        cache = {}
+
+        self.assertEqual(0, bounded_insert(cache, "a", 1, 2))
+        self.assertEqual(0, bounded_insert(cache, "b", 2, 2))
+
+        self.assertDictEqual({"a": 1, "b": 2}, cache)
+
+    def test_evicts_oldest(self):
+        cache = {"a": 1, "b": 2}
+
+        self.assertEqual(1, bounded_insert(cache, "c", 3, 2))
+
+        self.assertDictEqual({"b": 2, "c": 3}, cache)
+
+    def test_rewrite_refreshes(self):
+        cache = {"a": 1, "b": 2}
+
+        self.assertEqual(0, bounded_insert(cache, "a", 3, 2))
+        self.assertEqual(1, bounded_insert(cache, "c", 4, 2))
+
+        self.assertDictEqual({"a": 3, "c": 4}, cache)
+
+
+class TestCanonicalDigest(unittest.TestCase):
+    def test_key_order_ignored(self):
+        self.assertEqual(
+            canonical_digest({"a": 1, "b": [1, 2]}),
+            canonical_digest({"b": [1, 2], "a": 1}),
+        )
+
+    def test_values_differ(self):
+        self.assertNotEqual(canonical_digest({"a": 1}), canonical_digest({"a": 2}))
+
+    def test_unencodable(self):
+        with self.assertRaises(TypeError):
+            canonical_digest({"a": object()})
+
+
+class TestValueDigest(unittest.TestCase):
+    def test_key_order_ignored(self):
+        self.assertEqual(
+            value_digest(
+                celtypes.MapType(
+                    {
+                        celtypes.StringType("a"): celtypes.IntType(1),
+                        celtypes.StringType("b"): celtypes.StringType("x"),
+                    }
+                )
+            ),
+            value_digest(
+                celtypes.MapType(
+                    {
+                        celtypes.StringType("b"): celtypes.StringType("x"),
+                        celtypes.StringType("a"): celtypes.IntType(1),
+                    }
+                )
+            ),
+        )
+
+    def test_type_distinguished(self):
+        self.assertNotEqual(
+            value_digest(celtypes.ListType([celtypes.BoolType(True)])),
+            value_digest(celtypes.ListType([celtypes.IntType(1)])),
+        )
+        self.assertNotEqual(
+            value_digest(celtypes.IntType(1)), value_digest(celtypes.DoubleType(1))
+        )
+        self.assertNotEqual(
+            value_digest(celtypes.IntType(1)), value_digest(celtypes.StringType("1"))
+        )
+
+    def test_unencodable(self):
+        self.assertIsNone(
+            value_digest(
+                celtypes.MapType(
+                    {
+                        celtypes.StringType("a"): celtypes.IntType(1),
+                        celtypes.IntType(2): celtypes.IntType(2),
+                    }
+                )
+            )
+        )
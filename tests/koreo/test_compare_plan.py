@@ -0,0 +1,100 @@
+import copy
+import unittest
+
+from koreo.compare_plan import compile_compare_plan
+from koreo.resource_function.reconcile.validate import collect_differences
+
+
+class TestCompileComparePlan(unittest.TestCase):
+    def test_no_directives(self):
+        self.assertIsNone(
+            compile_compare_plan({"spec": {"value": 1, "nested": {"a": "b"}}})
+        )
+
+    def test_not_an_object(self):
+        self.assertIsNone(compile_compare_plan("=inputs.resource"))
+        self.assertIsNone(compile_compare_plan([{"a": "b"}]))
+
+    def test_nested_directives(self):
+        plan = compile_compare_plan(
+            {
+                "metadata": "=inputs.metadata",
+                "spec": {
+                    "x-koreo-compare-as-set": ["values", ""],
+                    "x-koreo-compare-last-applied": ["config"],
+                    "x-koreo-compare-as-map": {"env": ["name", ""]},
+                    "values": [1, 2],
+                    "config": {"a": "b"},
+                    "env": [{"name": "a", "value": "b"}],
+                },
+            }
+        )
+
+        assert plan
+        self.assertFalse(plan.has_directives)
+        self.assertEqual({"spec"}, set(plan.children))
+
+        spec_plan = plan.children["spec"]
+        self.assertTrue(spec_plan.has_directives)
+        self.assertEqual(frozenset({"values"}), spec_plan.as_set)
+        self.assertEqual(frozenset({"config"}), spec_plan.last_applied)
+        self.assertEqual({"env": ("name",)}, spec_plan.as_map)
+        self.assertEqual({}, spec_plan.children)
+
+    def test_dynamic_directives(self):
+        self.assertIsNone(
+            compile_compare_plan({"x-koreo-compare-as-set": "=inputs.set_keys"})
+        )
+        self.assertIsNone(
+            compile_compare_plan({"x-koreo-compare-as-set": ["=inputs.key"]})
+        )
+        self.assertIsNone(
+            compile_compare_plan({"x-koreo-compare-as-map": {"env": "=inputs.env"}})
+        )
+
+    def test_plan_matches_discovery(self):
+        target = {
+            "apiVersion": "v1",
+            "spec": {
+                "x-koreo-compare-as-set": ["values"],
+                "x-koreo-compare-last-applied": ["config"],
+                "x-koreo-compare-as-map": {"env": ["name"]},
+                "values": [1, 2, 3],
+                "config": {"a": "b"},
+                "env": [{"name": "a", "value": "b"}, {"name": "c", "value": "d"}],
+                "other": "value",
+            },
+        }
+        plan = compile_compare_plan(target)
+
+        actual = copy.deepcopy(target)
+        actual["spec"]["values"] = [3, 2, 1]
+        actual["spec"]["config"] = {"controller": "changed"}
+        actual["spec"]["env"].reverse()
+        last_applied = copy.deepcopy(target)
+
+        self.assertEqual(
+            [],
+            collect_differences(
+                target=target, actual=actual, last_applied_value=last_applied, plan=plan
+            ),
+        )
+
+        actual["spec"]["values"] = [4, 2, 1]
+        actual["spec"]["other"] = "changed"
+
+        self.assertEqual(
+            sorted(
+                collect_differences(
+                    target=target, actual=actual, last_applied_value=last_applied
+                )
+            ),
+            sorted(
+                collect_differences(
+                    target=target,
+                    actual=actual,
+                    last_applied_value=last_applied,
+                    plan=plan,
+                )
+            ),
+        )
@@ -0,0 +1,119 @@
+import unittest
+
+import celpy
+from celpy import celtypes
+
+from koreo.value_function.structure import ValueFunction
+from koreo.workflow import prepare
+from koreo.workflow import structure
+
+
+class TestCaseTable(unittest.TestCase):
+    def test_typed_keys(self):
+        case_table = prepare._build_case_table(
+            {"alpha": "alpha-logic", "7": "seven-logic", "07": "padded-logic"}
+        )
+
+        self.assertEqual("alpha-logic", case_table[celtypes.StringType("alpha")])
+        self.assertEqual("seven-logic", case_table[celtypes.StringType("7")])
+        self.assertEqual("seven-logic", case_table[celtypes.IntType(7)])
+        self.assertEqual("padded-logic", case_table[celtypes.StringType("07")])
+        self.assertEqual(4, len(case_table))
+
+
+class TestUsesInputKey(unittest.TestCase):
+    def _uses(self, expression: str) -> bool:
+        cel_env = celpy.Environment()
+        return prepare._uses_input_key(
+            cel_env.program(cel_env.compile(expression)), "item"
+        )
+
+    def test_independent(self):
+        self.assertFalse(self._uses("steps.config.kind"))
+        self.assertFalse(self._uses("inputs.kind"))
+        self.assertFalse(self._uses("inputs['kind']"))
+        self.assertFalse(self._uses("inputs.kind.lowerAscii()"))
+        self.assertFalse(self._uses("inputs.config.item"))
+
+    def test_dependent(self):
+        self.assertTrue(self._uses("inputs.item"))
+        self.assertTrue(self._uses("inputs.item.kind"))
+        self.assertTrue(self._uses("inputs['item']"))
+        self.assertTrue(self._uses("inputs.kind + inputs.item"))
+
+    def test_indeterminate(self):
+        self.assertTrue(self._uses("inputs[steps.config.key]"))
+        self.assertTrue(self._uses("inputs['''item''']"))
+        self.assertTrue(self._uses("size(inputs) > 1 ? 'a' : 'b'"))
+        self.assertTrue(self._uses("inputs.map(key, key)[0]"))
+
+
+class TestMarkInvariants(unittest.TestCase):
+    def _for_each(self):
+        cel_env = celpy.Environment()
+        return structure.ForEach(
+            source_iterator=cel_env.program(cel_env.compile("[1, 2]")),
+            input_key="item",
+            condition=None,
+        )
+
+    def test_value_function(self):
+        cel_env = celpy.Environment()
+        function = ValueFunction(
+            preconditions=cel_env.program(cel_env.compile("[inputs.enabled]")),
+            local_values=cel_env.program(
+                cel_env.compile("{'name': inputs.item + inputs.suffix}")
+            ),
+            return_value=None,
+            dynamic_input_keys=set(),
+        )
+
+        for_each = prepare._mark_invariants(for_each=self._for_each(), logic=function)
+
+        self.assertTrue(for_each.preconditions_invariant)
+        self.assertFalse(for_each.locals_invariant)
+        self.assertFalse(for_each.switch_invariant)
+
+    def test_no_expressions(self):
+        function = ValueFunction(
+            preconditions=None,
+            local_values=None,
+            return_value=None,
+            dynamic_input_keys=set(),
+        )
+
+        for_each = prepare._mark_invariants(for_each=self._for_each(), logic=function)
+
+        self.assertFalse(for_each.preconditions_invariant)
+        self.assertFalse(for_each.locals_invariant)
+
+
+class TestPrepareForEach(unittest.TestCase):
+    def _prepare(self, item_in: str):
+        return prepare._prepare_for_each(
+            cel_env=celpy.Environment(),
+            step_label="items",
+            step_location="spec.steps[2]",
+            spec={"itemIn": item_in, "inputKey": "item"},
+        )
+
+    def test_literal_list_is_typed(self):
+        prepared = self._prepare("=[1, 2]")
+        assert isinstance(prepared, tuple)
+
+        for_each, _ = prepared
+        self.assertTrue(for_each.source_iterator_typed)
+
+    def test_dynamic_list_is_not_typed(self):
+        prepared = self._prepare("=inputs.values")
+        assert isinstance(prepared, tuple)
+
+        for_each, _ = prepared
+        self.assertFalse(for_each.source_iterator_typed)
+
+    def test_mismatch_uses_step_location(self):
+        prepared = self._prepare("='not-a-list'")
+
+        self.assertIsInstance(prepared, structure.ErrorStep)
+        assert isinstance(prepared, structure.ErrorStep)
+        self.assertIn("spec.steps[2].forEach.itemIn", prepared.outcome.message)
@@ -1,16 +1,25 @@
+from unittest.mock import patch
+import asyncio
 import unittest
 
 import celpy
 from celpy import celtypes
 
-from koreo.result import Ok, is_unwrapped_ok
+from koreo.result import DepSkip, Ok, Retry, is_unwrapped_ok
 
-from koreo.cel.prepare import prepare_overlay_expression
+from koreo.cel.prepare import prepare_map_expression, prepare_overlay_expression
+from koreo.predicate_helpers import predicate_extractor
+from koreo.resource_function.prepare import prepare_resource_function
+from koreo.resource_function.structure import ResourceFunction
 
 from koreo.value_function import structure as function_structure
 
+from koreo.workflow import prepare
 from koreo.workflow import reconcile
+from koreo.workflow import result_cache
+from koreo.workflow import salvage
 from koreo.workflow import structure as workflow_structure
+from koreo.workflow.flatten import flatten_sub_workflows
 
 
 class TestReconcileWorkflow(unittest.IsolatedAsyncioTestCase):
@@ -315,6 +324,1408 @@ class TestReconcileWorkflow(unittest.IsolatedAsyncioTestCase):
         # TODO: Check Condition
 
 
+class FakeApi:
+    def __init__(self, resources: dict[str, dict]):
+        self.resources = resources
+        self.gets: list[str] = []
+        self.lists: list[str | None] = []
+
+    async def async_get(self, resource_api, *names, namespace=None):
+        if not names:
+            self.lists.append(namespace)
+            for resource in self.resources.values():
+                yield resource_api(resource)
+            return
+
+        for name in names:
+            self.gets.append(name)
+            resource = self.resources.get(name)
+            if resource:
+                yield resource_api(resource)
+
+
+class TestPrefetch(unittest.IsolatedAsyncioTestCase):
+    async def _resource_function(self, name: str):
+        function, _ = await prepare_resource_function(
+            cache_key=f"unit-test-{name}",
+            spec={
+                "apiConfig": {
+                    "apiVersion": "test.koreo.dev/v1",
+                    "kind": "TestResource",
+                    "plural": "testresources",
+                    "name": name,
+                    "namespace": "=inputs.namespace",
+                    "readonly": True,
+                },
+                "resource": {},
+                "return": {"name": "=resource.metadata.name"},
+            },
+        )
+        return function
+
+    async def test_dependent_resource_loaded_up_front(self):
+        cel_env = celpy.Environment()
+
+        first = await self._resource_function("=inputs.name")
+        second = await self._resource_function("=inputs.name")
+
+        second_inputs = {
+            "name": "=parent.name + '-two'",
+            "namespace": "=parent.namespace",
+            "prior": "=steps.first.name",
+        }
+
+        workflow = workflow_structure.Workflow(
+            name="unit-test",
+            crd_ref=None,
+            steps_ready=Ok(None),
+            steps=[
+                workflow_structure.Step(
+                    label="first",
+                    skip_if=None,
+                    for_each=None,
+                    inputs=prepare_map_expression(
+                        cel_env=cel_env,
+                        spec={
+                            "name": "=parent.name + '-one'",
+                            "namespace": "=parent.namespace",
+                        },
+                        location="unittest",
+                    ),
+                    dynamic_input_keys=set(),
+                    logic=first,
+                    condition=None,
+                    state=None,
+                ),
+                workflow_structure.Step(
+                    label="second",
+                    skip_if=None,
+                    for_each=None,
+                    inputs=prepare_map_expression(
+                        cel_env=cel_env, spec=second_inputs, location="unittest"
+                    ),
+                    dynamic_input_keys={"first"},
+                    logic=second,
+                    condition=None,
+                    state=cel_env.program(cel_env.compile("{'second': value}")),
+                    prefetch=prepare._prepare_prefetch(
+                        cel_env=cel_env,
+                        logic=second,
+                        for_each=None,
+                        inputs_spec=second_inputs,
+                        needed_steps={"first"},
+                        location="unittest",
+                    ),
+                ),
+            ],
+            dynamic_input_keys=set(),
+        )
+
+        api = FakeApi(
+            {
+                "unit-one": {"metadata": {"name": "unit-one", "namespace": "unit"}},
+                "unit-two": {"metadata": {"name": "unit-two", "namespace": "unit"}},
+            }
+        )
+
+        workflow_result = await reconcile.reconcile_workflow(
+            api=api,
+            workflow_key="test-case",
+            owner=("unit", celtypes.MapType({"uid": "sam-123"})),
+            trigger=celtypes.MapType({"name": "unit", "namespace": "unit"}),
+            workflow=workflow,
+        )
+
+        self.assertDictEqual({"second": {"name": "unit-two"}}, workflow_result.state)
+
+        # The dependent step's resource is requested first, and only once.
+        self.assertListEqual(["unit-two", "unit-one"], api.gets)
+
+    async def test_for_each_resources_listed(self):
+        cel_env = celpy.Environment()
+
+        function = await self._resource_function("=inputs.name")
+
+        workflow = workflow_structure.Workflow(
+            name="unit-test",
+            crd_ref=None,
+            steps_ready=Ok(None),
+            steps=[
+                workflow_structure.Step(
+                    label="many",
+                    skip_if=None,
+                    for_each=workflow_structure.ForEach(
+                        source_iterator=cel_env.program(
+                            cel_env.compile("['a', 'b', 'c', 'd']")
+                        ),
+                        input_key="name",
+                        condition=None,
+                    ),
+                    inputs=prepare_map_expression(
+                        cel_env=cel_env,
+                        spec={"namespace": "=parent.namespace"},
+                        location="unittest",
+                    ),
+                    dynamic_input_keys=set(),
+                    logic=function,
+                    condition=None,
+                    state=cel_env.program(cel_env.compile("{'many': value}")),
+                ),
+            ],
+            dynamic_input_keys=set(),
+        )
+
+        api = FakeApi(
+            {
+                name: {"metadata": {"name": name, "namespace": "unit"}}
+                for name in ("a", "b", "c", "d")
+            }
+        )
+
+        workflow_result = await reconcile.reconcile_workflow(
+            api=api,
+            workflow_key="test-case",
+            owner=("unit", celtypes.MapType({"uid": "sam-123"})),
+            trigger=celtypes.MapType({"namespace": "unit"}),
+            workflow=workflow,
+        )
+
+        self.assertDictEqual(
+            {"many": [{"name": name} for name in ("a", "b", "c", "d")]},
+            workflow_result.state,
+        )
+        self.assertListEqual(["unit"], api.lists)
+        self.assertListEqual([], api.gets)
+
+    async def test_prefetch_requires_parent_only_name(self):
+        cel_env = celpy.Environment()
+
+        function = await self._resource_function("=inputs.name")
+
+        self.assertIsNone(
+            prepare._prepare_prefetch(
+                cel_env=cel_env,
+                logic=function,
+                for_each=None,
+                inputs_spec={"name": "=steps.first.name", "namespace": "unit"},
+                needed_steps={"first"},
+                location="unittest",
+            )
+        )
+
+        self.assertIsNone(
+            prepare._prepare_prefetch(
+                cel_env=cel_env,
+                logic=function,
+                for_each=None,
+                inputs_spec={"name": "=parent.name", "namespace": "unit"},
+                needed_steps=set(),
+                location="unittest",
+            )
+        )
+
+        self.assertIsNotNone(
+            prepare._prepare_prefetch(
+                cel_env=cel_env,
+                logic=function,
+                for_each=None,
+                inputs_spec={
+                    "name": "=parent.name",
+                    "namespace": "unit",
+                    "other": "=steps.first.name",
+                },
+                needed_steps={"first"},
+                location="unittest",
+            )
+        )
+
+
+def _value_step(
+    cel_env: celpy.Environment, label: str, *dependencies: str
+) -> workflow_structure.Step:
+    return workflow_structure.Step(
+        label=label,
+        skip_if=None,
+        for_each=None,
+        inputs=None,
+        dynamic_input_keys=set(dependencies),
+        logic=function_structure.ValueFunction(
+            preconditions=None,
+            local_values=None,
+            return_value=prepare_overlay_expression(
+                cel_env=cel_env, spec={"label": label}, location="unittest"
+            ),
+            dynamic_input_keys=set(),
+        ),
+        condition=None,
+        state=cel_env.program(cel_env.compile(f"{{'{label}': value.label}}")),
+    )
+
+
+class TestStepScheduler(unittest.IsolatedAsyncioTestCase):
+    def _workflow(self, steps):
+        return workflow_structure.Workflow(
+            name="unit-test",
+            crd_ref=None,
+            steps_ready=Ok(None),
+            steps=steps,
+            dynamic_input_keys=set(),
+        )
+
+    async def test_critical_path_first(self):
+        cel_env = celpy.Environment()
+
+        workflow = self._workflow(
+            [
+                _value_step(cel_env, "short"),
+                _value_step(cel_env, "long"),
+                _value_step(cel_env, "longer", "long"),
+                _value_step(cel_env, "longest", "longer"),
+            ]
+        )
+
+        workflow_result = await reconcile.reconcile_workflow(
+            api=None,
+            workflow_key="test-case",
+            owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+            trigger=celtypes.MapType({}),
+            workflow=workflow._replace(max_concurrent_steps=1),
+        )
+
+        self.assertDictEqual(
+            {
+                "short": "short",
+                "long": "long",
+                "longer": "longer",
+                "longest": "longest",
+            },
+            workflow_result.state,
+        )
+
+        dispatch_order = [
+            trace.label
+            for trace in sorted(
+                workflow_result.trace, key=lambda trace: trace.dispatched_at
+            )
+        ]
+        self.assertListEqual(["long", "longer", "short", "longest"], dispatch_order)
+
+        traces = {trace.label: trace for trace in workflow_result.trace}
+        # Ready from the start, but queued behind the longer chain.
+        self.assertGreaterEqual(
+            traces["short"].dispatched_at, traces["longer"].finished_at
+        )
+        self.assertGreater(traces["short"].queued, 0.0)
+        self.assertGreaterEqual(traces["longest"].ran, 0.0)
+        self.assertGreaterEqual(
+            traces["longest"].ready_at, traces["longer"].finished_at
+        )
+
+    async def test_concurrency_cap(self):
+        cel_env = celpy.Environment()
+
+        workflow = self._workflow(
+            [_value_step(cel_env, f"step_{idx}") for idx in range(5)]
+        )
+
+        running = 0
+        max_running = 0
+        original_reconcile_step = reconcile._reconcile_step
+
+        async def counting_reconcile_step(**kwargs):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0)
+            try:
+                return await original_reconcile_step(**kwargs)
+            finally:
+                running -= 1
+
+        with patch.object(reconcile, "_reconcile_step", counting_reconcile_step):
+            capped_result = await reconcile.reconcile_workflow(
+                api=None,
+                workflow_key="test-case",
+                owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+                trigger=celtypes.MapType({}),
+                workflow=workflow._replace(max_concurrent_steps=2),
+            )
+            capped_max_running = max_running
+
+            max_running = 0
+            await reconcile.reconcile_workflow(
+                api=None,
+                workflow_key="test-case",
+                owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+                trigger=celtypes.MapType({}),
+                workflow=workflow,
+            )
+
+        self.assertEqual(5, len(capped_result.state))
+        self.assertEqual(2, capped_max_running)
+        # By default, every ready step is started at once.
+        self.assertEqual(5, max_running)
+
+    async def test_cancelled_reconcile_cancels_steps(self):
+        cel_env = celpy.Environment()
+
+        workflow = self._workflow(
+            [_value_step(cel_env, f"step_{idx}") for idx in range(3)]
+        )
+
+        started = asyncio.Event()
+        cancelled = []
+
+        async def blocking_reconcile_step(step, **_):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(step.label)
+                raise
+
+        with patch.object(reconcile, "_reconcile_step", blocking_reconcile_step):
+            reconcile_task = asyncio.create_task(
+                reconcile.reconcile_workflow(
+                    api=None,
+                    workflow_key="test-case",
+                    owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+                    trigger=celtypes.MapType({}),
+                    workflow=workflow,
+                )
+            )
+            await started.wait()
+            reconcile_task.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await reconcile_task
+
+        self.assertCountEqual(["step_0", "step_1", "step_2"], cancelled)
+
+    async def test_failure_prunes_downstream(self):
+        cel_env = celpy.Environment()
+
+        steps = [
+            workflow_structure.ErrorStep(
+                label="failing",
+                outcome=Retry(message="unit-test wait", location="unit-test"),
+                condition=None,
+            ),
+            _value_step(cel_env, "independent"),
+            _value_step(cel_env, "first", "failing"),
+            _value_step(cel_env, "second", "first"),
+            _value_step(cel_env, "joined", "first", "independent"),
+        ]
+
+        dispatched = []
+        original_reconcile_step = reconcile._reconcile_step
+
+        async def recording_reconcile_step(**kwargs):
+            dispatched.append(kwargs["step"].label)
+            return await original_reconcile_step(**kwargs)
+
+        with patch.object(reconcile, "_reconcile_step", recording_reconcile_step):
+            (
+                outcomes,
+                _,
+                state,
+                _,
+                trace,
+                pruned_steps,
+            ) = await reconcile._reconcile_steps(
+                api=None,
+                workflow_key="test-case",
+                owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+                trigger=celtypes.MapType({}),
+                steps=steps,
+            )
+
+        self.assertCountEqual(["failing", "independent"], dispatched)
+        self.assertEqual(3, pruned_steps)
+        self.assertDictEqual({"independent": "independent"}, state)
+
+        first = outcomes["first"].result
+        self.assertIsInstance(first, DepSkip)
+        self.assertEqual(
+            "'failing' is waiting (unit-test wait at unit-test).", first.message
+        )
+        self.assertEqual("test-case.spec.steps.first", first.location)
+
+        second = outcomes["second"].result
+        self.assertIsInstance(second, DepSkip)
+        self.assertTrue(second.message.startswith("'first' is waiting on dependency"))
+
+        self.assertIsInstance(outcomes["joined"].result, DepSkip)
+
+        traces = {step_trace.label: step_trace for step_trace in trace}
+        self.assertIsNone(traces["second"].dispatched_at)
+        self.assertIsNotNone(traces["second"].finished_at)
+
+    async def test_step_error_only_blocks_dependents(self):
+        cel_env = celpy.Environment()
+
+        workflow = self._workflow(
+            [
+                _value_step(cel_env, "broken"),
+                _value_step(cel_env, "independent"),
+                _value_step(cel_env, "dependent", "broken"),
+            ]
+        )
+
+        original_reconcile_value_function = reconcile.reconcile_value_function
+
+        async def failing_reconcile_value_function(location, **kwargs):
+            if location.endswith(".broken"):
+                raise Exception("unit-test failure")
+            return await original_reconcile_value_function(location=location, **kwargs)
+
+        with patch.object(
+            reconcile, "reconcile_value_function", failing_reconcile_value_function
+        ):
+            workflow_result = await reconcile.reconcile_workflow(
+                api=None,
+                workflow_key="test-case",
+                owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+                trigger=celtypes.MapType({}),
+                workflow=workflow,
+            )
+
+        self.assertDictEqual({"independent": "independent"}, workflow_result.state)
+        self.assertIsInstance(workflow_result.result, Retry)
+        self.assertEqual(1, workflow_result.pruned_steps)
+
+        traces = {trace.label: trace for trace in workflow_result.trace}
+        self.assertIsNotNone(traces["dependent"].finished_at)
+
+
+class TestDeadlines(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        salvage._reset()
+
+    def _workflow(self, steps, timeout=None):
+        return workflow_structure.Workflow(
+            name="unit-test",
+            crd_ref=None,
+            steps_ready=Ok(None),
+            steps=steps,
+            dynamic_input_keys=set(),
+            timeout=timeout,
+        )
+
+    def _slow_value_functions(self, calls: list[str]):
+        original_reconcile_value_function = reconcile.reconcile_value_function
+
+        async def slow_reconcile_value_function(location, **kwargs):
+            calls.append(location.rsplit(".", 1)[-1])
+            if location.endswith(".slow"):
+                await asyncio.sleep(10)
+            return await original_reconcile_value_function(location=location, **kwargs)
+
+        return patch.object(
+            reconcile, "reconcile_value_function", slow_reconcile_value_function
+        )
+
+    async def _reconcile(self, workflow):
+        return await reconcile.reconcile_workflow(
+            api=None,
+            workflow_key="test-case",
+            owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+            trigger=celtypes.MapType({}),
+            workflow=workflow,
+        )
+
+    async def test_step_timeout_is_isolated(self):
+        cel_env = celpy.Environment()
+
+        workflow = self._workflow(
+            [
+                _value_step(cel_env, "slow")._replace(timeout=0.05),
+                _value_step(cel_env, "fast"),
+                _value_step(cel_env, "after_fast", "fast"),
+                _value_step(cel_env, "after_slow", "slow"),
+            ]
+        )
+
+        calls = []
+        with self._slow_value_functions(calls):
+            workflow_result = await self._reconcile(workflow)
+
+        self.assertDictEqual(
+            {"fast": "fast", "after_fast": "after_fast"}, workflow_result.state
+        )
+        self.assertIsInstance(workflow_result.result, Retry)
+        self.assertIn("Timeout running step (slow)", workflow_result.result.message)
+        self.assertEqual(1, workflow_result.pruned_steps)
+
+    async def test_workflow_timeout_salvages_completed(self):
+        cel_env = celpy.Environment()
+
+        workflow = self._workflow(
+            [_value_step(cel_env, "slow"), _value_step(cel_env, "fast")],
+            timeout=0.05,
+        )
+
+        calls = []
+        with self._slow_value_functions(calls):
+            first_result = await self._reconcile(workflow)
+            second_result = await self._reconcile(workflow)
+            third_result = await self._reconcile(workflow)
+
+        self.assertDictEqual({"fast": "fast"}, first_result.state)
+        self.assertDictEqual({"fast": "fast"}, second_result.state)
+        self.assertDictEqual({"fast": "fast"}, third_result.state)
+
+        # The completed step was not redone by the retry, but a salvaged result
+        # is only reused once.
+        self.assertCountEqual(["slow", "fast", "slow", "slow", "fast"], calls)
+
+    async def test_changed_input_type_not_salvaged(self):
+        cel_env = celpy.Environment()
+
+        workflow = self._workflow(
+            [
+                _value_step(cel_env, "slow"),
+                _value_step(cel_env, "fast")._replace(
+                    inputs=prepare_map_expression(
+                        cel_env=cel_env,
+                        spec={"enabled": "=parent.enabled"},
+                        location="unittest",
+                    )
+                ),
+            ],
+            timeout=0.05,
+        )
+
+        calls = []
+        with self._slow_value_functions(calls):
+            for enabled in (celtypes.BoolType(True), celtypes.IntType(1)):
+                await reconcile.reconcile_workflow(
+                    api=None,
+                    workflow_key="test-case",
+                    owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+                    trigger=celtypes.MapType({"enabled": enabled}),
+                    workflow=workflow,
+                )
+
+        # `true` and `1` are different inputs, so the retry redoes the step.
+        self.assertCountEqual(["slow", "fast", "slow", "fast"], calls)
+
+    async def test_resource_function_not_salvaged(self):
+        cel_env = celpy.Environment()
+
+        workflow = self._workflow(
+            [
+                _value_step(cel_env, "slow"),
+                _value_step(cel_env, "resource")._replace(
+                    logic=ResourceFunction(
+                        name="unit-test",
+                        preconditions=None,
+                        local_values=None,
+                        crud_config=None,
+                        postconditions=None,
+                        return_value=None,
+                        dynamic_input_keys=set(),
+                    )
+                ),
+            ],
+            timeout=0.05,
+        )
+
+        calls = []
+
+        async def reconcile_resource_function(location, **_):
+            calls.append(location.rsplit(".", 1)[-1])
+            return celtypes.MapType({"label": "resource"}), None
+
+        with (
+            self._slow_value_functions(calls),
+            patch.object(
+                reconcile, "reconcile_resource_function", reconcile_resource_function
+            ),
+        ):
+            await self._reconcile(workflow)
+            second_result = await self._reconcile(workflow)
+
+        # The resource may have changed, so it is re-read by the retry.
+        self.assertDictEqual({"resource": "resource"}, second_result.state)
+        self.assertCountEqual(["slow", "resource", "slow", "resource"], calls)
+
+    async def test_sub_workflow_deadline(self):
+        workflow = self._workflow([], timeout=300)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + 1
+
+        self.assertEqual(
+            deadline, reconcile._workflow_deadline(workflow=workflow, deadline=deadline)
+        )
+        self.assertLess(
+            reconcile._workflow_deadline(
+                workflow=workflow._replace(timeout=None), deadline=loop.time() + 300
+            ),
+            loop.time() + reconcile.STEP_TIMEOUT + 1,
+        )
+
+
+def _sub_workflow_steps(cel_env: celpy.Environment):
+    def step(label, inputs, *dependencies, logic=None):
+        return workflow_structure.Step(
+            label=label,
+            skip_if=None,
+            for_each=None,
+            inputs=cel_env.program(cel_env.compile(inputs)),
+            dynamic_input_keys=set(dependencies),
+            logic=logic
+            or function_structure.ValueFunction(
+                preconditions=None,
+                local_values=None,
+                return_value=prepare_overlay_expression(
+                    cel_env=cel_env, spec={"value": "=inputs.value"}, location=label
+                ),
+                dynamic_input_keys=set(),
+            ),
+            condition=None,
+            state=cel_env.program(cel_env.compile(f"{{'{label}': value.value}}")),
+        )
+
+    return step
+
+
+class TestFlattenedSubWorkflows(unittest.IsolatedAsyncioTestCase):
+    def _workflow(self, name, steps):
+        return workflow_structure.Workflow(
+            name=name,
+            crd_ref=None,
+            steps_ready=Ok(None),
+            steps=steps,
+            dynamic_input_keys=set(),
+        )
+
+    def _nested_workflow(self, cel_env: celpy.Environment, inner_workflow=None):
+        step = _sub_workflow_steps(cel_env)
+
+        sub_steps = [
+            step("double", "{'value': parent.value * 2}"),
+            step("plus", "{'value': steps.double.value + parent.value}", "double"),
+        ]
+        if inner_workflow:
+            sub_steps.append(
+                step(
+                    "inner",
+                    "{'value': steps.plus.value}",
+                    "plus",
+                    logic=inner_workflow,
+                )._replace(
+                    state=cel_env.program(cel_env.compile("{'inner': value.plus}"))
+                )
+            )
+        sub_workflow = self._workflow("sub-workflow", sub_steps)
+
+        return self._workflow(
+            "unit-test",
+            [
+                step("source", "{'value': 5}"),
+                step(
+                    "sub", "{'value': steps.source.value}", "source", logic=sub_workflow
+                )._replace(state=cel_env.program(cel_env.compile("{'sub': value}"))),
+                step("after", "{'value': steps.sub.plus * 10}", "sub"),
+            ],
+        )
+
+    def _flattened(self, workflow):
+        return workflow._replace(
+            steps=flatten_sub_workflows(workflow.steps), step_graph=None
+        )
+
+    async def _reconcile(self, workflow):
+        return await reconcile.reconcile_workflow(
+            api=None,
+            workflow_key="test-case",
+            owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+            trigger=celtypes.MapType({}),
+            workflow=workflow,
+        )
+
+    async def test_matches_nested(self):
+        cel_env = celpy.Environment()
+        workflow = self._nested_workflow(cel_env)
+
+        nested_result = await self._reconcile(workflow)
+        flattened_result = await self._reconcile(self._flattened(workflow))
+
+        self.assertDictEqual(
+            {"source": 5, "sub": {"double": 10, "plus": 15}, "after": 150},
+            flattened_result.state,
+        )
+        self.assertDictEqual(nested_result.state, flattened_result.state)
+        self.assertDictEqual(nested_result.resource_ids, flattened_result.resource_ids)
+        self.assertEqual(nested_result.result, flattened_result.result)
+        self.assertListEqual(
+            [condition.get("type") for condition in nested_result.conditions],
+            [condition.get("type") for condition in flattened_result.conditions],
+        )
+
+        self.assertListEqual(
+            ["source", "sub.parent", "sub.double", "sub.plus", "sub", "after"],
+            [trace.label for trace in flattened_result.trace],
+        )
+
+    async def test_deeply_nested(self):
+        cel_env = celpy.Environment()
+        inner_workflow = self._nested_workflow(cel_env).steps[1].logic
+        workflow = self._nested_workflow(cel_env, inner_workflow=inner_workflow)
+
+        # The inner sub-workflow is flattened into the sub-workflow, which is
+        # then flattened into the Workflow.
+        sub_step = workflow.steps[1]
+        flattened_sub_workflow = self._flattened(sub_step.logic)
+        flattened = self._flattened(
+            workflow._replace(
+                steps=[
+                    workflow.steps[0],
+                    sub_step._replace(logic=flattened_sub_workflow),
+                    workflow.steps[2],
+                ]
+            )
+        )
+
+        nested_result = await self._reconcile(workflow)
+        flattened_result = await self._reconcile(flattened)
+
+        self.assertDictEqual(
+            {
+                "source": 5,
+                "sub": {"double": 10, "plus": 15, "inner": 45},
+                "after": 150,
+            },
+            flattened_result.state,
+        )
+        self.assertDictEqual(nested_result.state, flattened_result.state)
+        self.assertDictEqual(nested_result.resource_ids, flattened_result.resource_ids)
+        self.assertIn(
+            "sub.inner.plus", [trace.label for trace in flattened_result.trace]
+        )
+
+    async def test_sub_step_failure(self):
+        cel_env = celpy.Environment()
+        workflow = self._nested_workflow(cel_env)
+
+        original_reconcile_value_function = reconcile.reconcile_value_function
+
+        async def failing_reconcile_value_function(location, **kwargs):
+            if location.endswith("double"):
+                return Retry(message="unit-test wait", location="unit-test")
+            return await original_reconcile_value_function(location=location, **kwargs)
+
+        with patch.object(
+            reconcile, "reconcile_value_function", failing_reconcile_value_function
+        ):
+            nested_result = await self._reconcile(workflow)
+            flattened_result = await self._reconcile(self._flattened(workflow))
+
+        self.assertDictEqual({"source": 5}, flattened_result.state)
+        self.assertIsInstance(flattened_result.result, Retry)
+        self.assertEqual(nested_result.result.message, flattened_result.result.message)
+        self.assertDictEqual(nested_result.resource_ids, flattened_result.resource_ids)
+
+    async def test_skipped_sub_workflow(self):
+        cel_env = celpy.Environment()
+        workflow = self._nested_workflow(cel_env)
+        sub_step = workflow.steps[1]._replace(
+            skip_if=cel_env.program(cel_env.compile("steps.source.value == 5"))
+        )
+        workflow = workflow._replace(
+            steps=[workflow.steps[0], sub_step, workflow.steps[2]]
+        )
+
+        nested_result = await self._reconcile(workflow)
+        flattened_result = await self._reconcile(self._flattened(workflow))
+
+        self.assertDictEqual({"source": 5}, flattened_result.state)
+        self.assertEqual(nested_result.result, flattened_result.result)
+        # Both sub-steps, and the step after the sub-workflow.
+        self.assertEqual(3, flattened_result.pruned_steps)
+
+
+class TestCachedResults(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        result_cache._reset()
+
+    def _workflow(self, cel_env: celpy.Environment):
+        step = _sub_workflow_steps(cel_env)
+        return workflow_structure.Workflow(
+            name="unit-test",
+            crd_ref=None,
+            steps_ready=Ok(None),
+            steps=[
+                step("double", "{'value': parent.spec.value * 2}"),
+                step("plus", "{'value': steps.double.value + 1}", "double"),
+            ],
+            dynamic_input_keys={"spec", "spec.value"},
+            result_key_paths=("spec.value",),
+        )
+
+    async def _reconcile(self, workflow, value, label="a"):
+        return await reconcile.reconcile_workflow(
+            api=None,
+            workflow_key="test-case",
+            owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+            trigger=celtypes.MapType(
+                {
+                    "metadata": celtypes.MapType(
+                        {"labels": celtypes.MapType({"unrelated": label})}
+                    ),
+                    "spec": celtypes.MapType({"value": value}),
+                }
+            ),
+            workflow=workflow,
+        )
+
+    async def test_unchanged_parent_reuses_result(self):
+        cel_env = celpy.Environment()
+        workflow = self._workflow(cel_env)
+
+        calls = []
+        original_reconcile_value_function = reconcile.reconcile_value_function
+
+        async def counting_reconcile_value_function(**kwargs):
+            calls.append(kwargs["location"])
+            return await original_reconcile_value_function(**kwargs)
+
+        with patch.object(
+            reconcile, "reconcile_value_function", counting_reconcile_value_function
+        ):
+            first = await self._reconcile(workflow, 5)
+            relabeled = await self._reconcile(workflow, 5, label="b")
+            changed = await self._reconcile(workflow, 6)
+            reprepared = await self._reconcile(workflow._replace(), 6)
+
+        self.assertDictEqual({"double": 10, "plus": 11}, first.state)
+        self.assertDictEqual(first.state, relabeled.state)
+        self.assertEqual(first.conditions, relabeled.conditions)
+        self.assertTupleEqual((), relabeled.trace)
+
+        self.assertDictEqual({"double": 12, "plus": 13}, changed.state)
+        self.assertDictEqual(changed.state, reprepared.state)
+
+        self.assertEqual(6, len(calls))
+
+    async def test_cached_result_not_shared(self):
+        cel_env = celpy.Environment()
+        workflow = self._workflow(cel_env)
+
+        first = await self._reconcile(workflow, 5)
+        first.conditions.clear()
+        first.state.clear()
+
+        second = await self._reconcile(workflow, 5)
+
+        self.assertDictEqual({"double": 10, "plus": 11}, second.state)
+        self.assertTrue(second.conditions)
+
+    async def test_dynamic_index_keys_whole_value(self):
+        cel_env = celpy.Environment()
+        step = _sub_workflow_steps(cel_env)
+        steps = [step("pick", "{'value': parent.spec[parent.spec.key]}")]
+        workflow = workflow_structure.Workflow(
+            name="unit-test",
+            crd_ref=None,
+            steps_ready=Ok(None),
+            steps=steps,
+            dynamic_input_keys={"spec"},
+            result_key_paths=prepare._result_key_paths(
+                spec={"cacheResults": True}, steps=steps
+            ),
+        )
+
+        async def reconcile_spec(spec: dict):
+            return await reconcile.reconcile_workflow(
+                api=None,
+                workflow_key="test-case",
+                owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+                trigger=celpy.json_to_cel({"spec": spec}),
+                workflow=workflow,
+            )
+
+        first = await reconcile_spec({"key": "a", "a": 1, "b": 2})
+        # `b` is only reachable through the computed index.
+        changed = await reconcile_spec({"key": "a", "a": 1, "b": 3})
+        switched = await reconcile_spec({"key": "b", "a": 1, "b": 3})
+
+        self.assertDictEqual({"pick": 1}, first.state)
+        self.assertNotEqual((), changed.trace)
+        self.assertDictEqual({"pick": 3}, switched.state)
+
+    async def test_whole_parent_not_cached(self):
+        cel_env = celpy.Environment()
+        step = _sub_workflow_steps(cel_env)
+        steps = [step("whole", "{'value': parent.metadata}")]
+        steps.append(step("copy", "{'value': parent}"))
+        workflow = self._workflow(cel_env)._replace(
+            steps=steps,
+            result_key_paths=prepare._result_key_paths(
+                spec={"cacheResults": True}, steps=steps
+            ),
+        )
+
+        first = await self._reconcile(workflow, 5)
+        relabeled = await self._reconcile(workflow, 5, label="b")
+
+        self.assertNotEqual(first.state, relabeled.state)
+        self.assertNotEqual((), relabeled.trace)
+
+    async def test_not_ok_not_cached(self):
+        cel_env = celpy.Environment()
+        workflow = self._workflow(cel_env)
+
+        with patch.object(
+            reconcile,
+            "reconcile_value_function",
+            return_value=Retry(message="unit-test wait", location="unit-test"),
+        ):
+            waiting = await self._reconcile(workflow, 5)
+
+        second = await self._reconcile(workflow, 5)
+
+        self.assertIsInstance(waiting.result, Retry)
+        self.assertDictEqual({"double": 10, "plus": 11}, second.state)
+
+
+class TestResultKeyPaths(unittest.TestCase):
+    def test_value_functions(self):
+        cel_env = celpy.Environment()
+        step = _sub_workflow_steps(cel_env)
+
+        self.assertTupleEqual(
+            ("metadata.name", "spec.a.b"),
+            prepare._result_key_paths(
+                spec={"cacheResults": True},
+                steps=[
+                    step("first", "{'value': parent.spec.a.b}"),
+                    step("second", "{'value': parent.metadata.name + 'x'}"),
+                ],
+            ),
+        )
+
+    def test_whole_value_covers_members(self):
+        cel_env = celpy.Environment()
+        step = _sub_workflow_steps(cel_env)
+
+        self.assertTupleEqual(
+            ("spec",),
+            prepare._result_key_paths(
+                spec={"cacheResults": True},
+                steps=[step("step", "{'value': parent.spec[parent.spec.key]}")],
+            ),
+        )
+
+    def test_whole_parent(self):
+        cel_env = celpy.Environment()
+        step = _sub_workflow_steps(cel_env)
+
+        self.assertIsNone(
+            prepare._result_key_paths(
+                spec={"cacheResults": True}, steps=[step("step", "{'p': parent}")]
+            )
+        )
+
+    def test_not_requested(self):
+        cel_env = celpy.Environment()
+
+        self.assertIsNone(
+            prepare._result_key_paths(spec={}, steps=[_value_step(cel_env, "step")])
+        )
+
+    def test_resource_function(self):
+        cel_env = celpy.Environment()
+        sub_workflow = workflow_structure.Workflow(
+            name="sub-workflow",
+            crd_ref=None,
+            steps_ready=Ok(None),
+            steps=[
+                _value_step(cel_env, "step")._replace(
+                    logic=ResourceFunction(
+                        name="unit-test",
+                        preconditions=None,
+                        local_values=None,
+                        crud_config=None,
+                        postconditions=None,
+                        return_value=None,
+                        dynamic_input_keys=set(),
+                    )
+                )
+            ],
+            dynamic_input_keys=set(),
+        )
+
+        self.assertIsNone(
+            prepare._result_key_paths(
+                spec={"cacheResults": True},
+                steps=[_value_step(cel_env, "step")._replace(logic=sub_workflow)],
+            )
+        )
+
+
+class TestRefSwitchDispatch(unittest.IsolatedAsyncioTestCase):
+    def _switch_step(self, cel_env: celpy.Environment, switch_on: str, for_each=None):
+        def value_function(name):
+            return function_structure.ValueFunction(
+                preconditions=None,
+                local_values=None,
+                return_value=prepare_overlay_expression(
+                    cel_env=cel_env,
+                    spec={"case": name, "item": "=inputs.item"},
+                    location="unittest",
+                ),
+                dynamic_input_keys=set(),
+            )
+
+        logic_map = {"1": value_function("one"), "two": value_function("two")}
+
+        return workflow_structure.Step(
+            label="switched",
+            skip_if=None,
+            for_each=for_each,
+            inputs=prepare_map_expression(
+                cel_env=cel_env,
+                spec={"kind": "=parent.kind", "item": "none"},
+                location="unittest",
+            ),
+            dynamic_input_keys=set(),
+            logic=workflow_structure.LogicSwitch(
+                switch_on=cel_env.program(cel_env.compile(switch_on)),
+                logic_map=logic_map,
+                default_logic=None,
+                dynamic_input_keys=set(),
+                case_table=prepare._build_case_table(logic_map),
+            ),
+            condition=None,
+            state=cel_env.program(cel_env.compile("{'switched': value}")),
+        )
+
+    async def _reconcile(self, step, kind):
+        return await reconcile.reconcile_workflow(
+            api=None,
+            workflow_key="test-case",
+            owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+            trigger=celpy.json_to_cel({"kind": kind}),
+            workflow=workflow_structure.Workflow(
+                name="unit-test",
+                crd_ref=None,
+                steps_ready=Ok(None),
+                steps=[step],
+                dynamic_input_keys=set(),
+            ),
+        )
+
+    async def test_int_switch_value(self):
+        cel_env = celpy.Environment()
+        step = self._switch_step(cel_env, "inputs.kind")
+
+        workflow_result = await self._reconcile(step, 1)
+
+        self.assertDictEqual(
+            {"switched": {"case": "one", "item": "none"}}, workflow_result.state
+        )
+
+    async def test_for_each_switch_selected_once(self):
+        cel_env = celpy.Environment()
+        for_each = workflow_structure.ForEach(
+            source_iterator=cel_env.program(cel_env.compile("['a', 'b', 'c']")),
+            input_key="item",
+            condition=None,
+            switch_invariant=True,
+        )
+        step = self._switch_step(cel_env, "inputs.kind", for_each=for_each)
+
+        selections = []
+        original_select_switch_logic = reconcile._select_switch_logic
+
+        def counting_select_switch_logic(**kwargs):
+            selections.append(kwargs["location"])
+            return original_select_switch_logic(**kwargs)
+
+        with patch.object(
+            reconcile, "_select_switch_logic", counting_select_switch_logic
+        ):
+            workflow_result = await self._reconcile(step, "two")
+
+        self.assertDictEqual(
+            {
+                "switched": [
+                    {"case": "two", "item": "a"},
+                    {"case": "two", "item": "b"},
+                    {"case": "two", "item": "c"},
+                ]
+            },
+            workflow_result.state,
+        )
+        self.assertListEqual(["test-case.spec.steps.switched.refSwitch"], selections)
+
+    async def test_for_each_switch_per_item(self):
+        cel_env = celpy.Environment()
+        for_each = workflow_structure.ForEach(
+            source_iterator=cel_env.program(cel_env.compile("['1', 'two']")),
+            input_key="item",
+            condition=None,
+        )
+        step = self._switch_step(cel_env, "inputs.item", for_each=for_each)
+
+        workflow_result = await self._reconcile(step, "unused")
+
+        self.assertDictEqual(
+            {
+                "switched": [
+                    {"case": "one", "item": "1"},
+                    {"case": "two", "item": "two"},
+                ]
+            },
+            workflow_result.state,
+        )
+
+
+class TestForEachHoisting(unittest.IsolatedAsyncioTestCase):
+    def _step(self, cel_env: celpy.Environment, locals_spec: dict, invariant: bool):
+        function = function_structure.ValueFunction(
+            preconditions=predicate_extractor(
+                cel_env=cel_env,
+                predicate_spec=[
+                    {"assert": "=inputs.enabled", "permFail": {"message": "off"}}
+                ],
+            ),
+            local_values=prepare_map_expression(
+                cel_env=cel_env, spec=locals_spec, location="unittest"
+            ),
+            return_value=prepare_overlay_expression(
+                cel_env=cel_env,
+                spec={"value": "=locals.prefix + inputs.item"},
+                location="unittest",
+            ),
+            dynamic_input_keys=set(),
+        )
+
+        return workflow_structure.Step(
+            label="many",
+            skip_if=None,
+            for_each=workflow_structure.ForEach(
+                source_iterator=cel_env.program(cel_env.compile("['a', 'b', 'c']")),
+                input_key="item",
+                condition=None,
+                preconditions_invariant=invariant,
+                locals_invariant=invariant,
+            ),
+            inputs=prepare_map_expression(
+                cel_env=cel_env,
+                spec={"prefix": "item-", "enabled": True},
+                location="unittest",
+            ),
+            dynamic_input_keys=set(),
+            logic=function,
+            condition=None,
+            state=cel_env.program(cel_env.compile("{'many': value}")),
+        )
+
+    async def _reconcile(self, step):
+        hoisted = []
+        original_reconcile_value_function = reconcile.reconcile_value_function
+
+        async def recording_reconcile_value_function(**kwargs):
+            hoisted.append(
+                (kwargs["preconditions_checked"], kwargs["local_values"] is not None)
+            )
+            return await original_reconcile_value_function(**kwargs)
+
+        with patch.object(
+            reconcile, "reconcile_value_function", recording_reconcile_value_function
+        ):
+            workflow_result = await reconcile.reconcile_workflow(
+                api=None,
+                workflow_key="test-case",
+                owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+                trigger=celtypes.MapType({}),
+                workflow=workflow_structure.Workflow(
+                    name="unit-test",
+                    crd_ref=None,
+                    steps_ready=Ok(None),
+                    steps=[step],
+                    dynamic_input_keys=set(),
+                ),
+            )
+
+        return workflow_result, hoisted
+
+    async def test_invariant_evaluated_once(self):
+        cel_env = celpy.Environment()
+        step = self._step(cel_env, {"prefix": "=inputs.prefix"}, invariant=True)
+
+        workflow_result, hoisted = await self._reconcile(step)
+
+        self.assertDictEqual(
+            {
+                "many": [
+                    {"value": "item-a"},
+                    {"value": "item-b"},
+                    {"value": "item-c"},
+                ]
+            },
+            workflow_result.state,
+        )
+        self.assertListEqual([(True, True)] * 3, hoisted)
+
+    async def test_dependent_evaluated_per_item(self):
+        cel_env = celpy.Environment()
+        step = self._step(cel_env, {"prefix": "=inputs.item + '-'"}, invariant=False)
+
+        workflow_result, hoisted = await self._reconcile(step)
+
+        self.assertDictEqual(
+            {"many": [{"value": "a-a"}, {"value": "b-b"}, {"value": "c-c"}]},
+            workflow_result.state,
+        )
+        self.assertListEqual([(False, False)] * 3, hoisted)
+
+    async def test_failed_invariant_left_to_items(self):
+        cel_env = celpy.Environment()
+        step = self._step(cel_env, {"prefix": "=inputs.missing"}, invariant=True)
+
+        workflow_result, hoisted = await self._reconcile(step)
+
+        self.assertFalse(is_unwrapped_ok(workflow_result.result))
+        self.assertListEqual([(True, False)] * 3, hoisted)
+
+
+class TestForEachStreaming(unittest.IsolatedAsyncioTestCase):
+    def _step(self, item_count: int, summarize_resource_ids: bool = False):
+        cel_env = celpy.Environment()
+        return workflow_structure.Step(
+            label="many",
+            skip_if=None,
+            for_each=workflow_structure.ForEach(
+                source_iterator=cel_env.program(
+                    cel_env.compile(f"{list(range(item_count))}")
+                ),
+                input_key="item",
+                condition=None,
+                summarize_resource_ids=summarize_resource_ids,
+            ),
+            inputs=None,
+            dynamic_input_keys=set(),
+            logic=function_structure.ValueFunction(
+                preconditions=None,
+                local_values=None,
+                return_value=None,
+                dynamic_input_keys=set(),
+            ),
+            condition=None,
+            state=None,
+        )
+
+    async def _reconcile(self, step, reconcile_item):
+        async def fake_reconcile_step_logic(inputs, **_):
+            return await reconcile_item(int(inputs["item"]))
+
+        with patch.object(
+            reconcile, "_reconcile_step_logic", fake_reconcile_step_logic
+        ):
+            return await reconcile._for_each_reconciler(
+                api=None,
+                step=step,
+                workflow_key="test-case",
+                location="many",
+                owner=("unit-tests", celtypes.MapType({"uid": "sam-123"})),
+                workflow_inputs=celtypes.MapType({}),
+                inputs=celtypes.MapType({}),
+            )
+
+    async def test_bounded_concurrency_preserves_order(self):
+        in_flight = 0
+        max_in_flight = 0
+
+        async def reconcile_item(item: int):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            # Later items finish first.
+            await asyncio.sleep((10 - item) / 1000)
+            in_flight -= 1
+            return reconcile.StepResult(result=celtypes.IntType(item * 10))
+
+        with patch.object(reconcile, "FOR_EACH_CONCURRENCY", 3):
+            step_result = await self._reconcile(self._step(10), reconcile_item)
+
+        self.assertEqual(3, max_in_flight)
+        self.assertListEqual([item * 10 for item in range(10)], step_result.result)
+        self.assertListEqual([None] * 10, step_result.resource_ids)
+
+    async def test_item_error_does_not_cancel_others(self):
+        finished = []
+
+        async def reconcile_item(item: int):
+            if item == 0:
+                raise Exception("unit-test failure")
+
+            await asyncio.sleep(0.001)
+            finished.append(item)
+            return reconcile.StepResult(result=celtypes.IntType(item))
+
+        step_result = await self._reconcile(self._step(5), reconcile_item)
+
+        self.assertIsInstance(step_result.result, Retry)
+        self.assertIn("unit-test failure", step_result.result.message)
+        self.assertCountEqual([1, 2, 3, 4], finished)
+
+    async def test_timeout_cancels_unfinished(self):
+        async def reconcile_item(item: int):
+            if item % 2:
+                await asyncio.sleep(1)
+            return reconcile.StepResult(result=celtypes.IntType(item))
+
+        step = self._step(6)
+        with patch.object(reconcile, "STEP_TIMEOUT", 0.01):
+            step_result = await self._reconcile(step, reconcile_item)
+
+        self.assertIsInstance(step_result.result, Retry)
+        self.assertIn("3 of 6 items unfinished", step_result.result.message)
+
+    async def test_summarized_resource_ids(self):
+        async def reconcile_item(item: int):
+            resource_id = {
+                "apiVersion": "v1",
+                "kind": "ConfigMap",
+                "plural": "configmaps",
+                "name": f"item-{item}",
+                "readonly": False,
+                "namespace": "alpha" if item < 3 else "beta",
+            }
+            return reconcile.StepResult(
+                result=celtypes.IntType(item), resource_ids=resource_id
+            )
+
+        step = self._step(5, summarize_resource_ids=True)
+        step_result = await self._reconcile(step, reconcile_item)
+
+        self.assertDictEqual(
+            {
+                "items": 5,
+                "resources": [
+                    {
+                        "apiVersion": "v1",
+                        "kind": "ConfigMap",
+                        "namespace": "alpha",
+                        "count": 3,
+                    },
+                    {
+                        "apiVersion": "v1",
+                        "kind": "ConfigMap",
+                        "namespace": "beta",
+                        "count": 2,
+                    },
+                ],
+            },
+            step_result.resource_ids,
+        )
+
+
 class TestConditionHelper(unittest.TestCase):
 
     def test_ok_outcome_that_is_none(self):
@@ -0,0 +1,98 @@
+from unittest.mock import patch
+import unittest
+
+from celpy import celtypes
+
+from koreo.result import Ok
+
+from koreo.workflow import result_cache
+from koreo.workflow import structure
+
+
+def _trigger(**spec):
+    return celtypes.MapType(
+        {
+            celtypes.StringType("metadata"): celtypes.MapType(
+                {celtypes.StringType("labels"): celtypes.MapType({"unrelated": "a"})}
+            ),
+            celtypes.StringType("spec"): celtypes.MapType(spec),
+        }
+    )
+
+
+def _workflow():
+    return structure.Workflow(
+        name="unit-test",
+        crd_ref=None,
+        steps_ready=Ok(None),
+        steps=[],
+        dynamic_input_keys=set(),
+    )
+
+
+class TestTriggerDigest(unittest.TestCase):
+    def test_only_key_paths(self):
+        key_paths = ("spec.value",)
+
+        digest = result_cache.trigger_digest(_trigger(value=1, other=1), key_paths)
+
+        self.assertEqual(
+            digest, result_cache.trigger_digest(_trigger(value=1, other=2), key_paths)
+        )
+        self.assertNotEqual(
+            digest, result_cache.trigger_digest(_trigger(value=2, other=1), key_paths)
+        )
+
+    def test_missing_path_keys_ancestor(self):
+        key_paths = ("spec.missing",)
+
+        digest = result_cache.trigger_digest(_trigger(value=1), key_paths)
+
+        self.assertNotEqual(
+            digest, result_cache.trigger_digest(_trigger(value=2), key_paths)
+        )
+
+    def test_type_distinguished(self):
+        key_paths = ("spec.enabled",)
+
+        self.assertNotEqual(
+            result_cache.trigger_digest(
+                _trigger(enabled=celtypes.BoolType(True)), key_paths
+            ),
+            result_cache.trigger_digest(
+                _trigger(enabled=celtypes.IntType(1)), key_paths
+            ),
+        )
+
+    def test_no_key_paths(self):
+        self.assertEqual(
+            result_cache.trigger_digest(_trigger(value=1), ()),
+            result_cache.trigger_digest(_trigger(value=2), ()),
+        )
+
+
+class TestResultCache(unittest.TestCase):
+    def tearDown(self):
+        result_cache._reset()
+
+    def test_cached(self):
+        workflow = _workflow()
+        result_cache.cache_result("key", workflow, "digest", "result")
+
+        self.assertEqual("result", result_cache.get_cached("key", workflow, "digest"))
+        self.assertIsNone(result_cache.get_cached("other-key", workflow, "digest"))
+        self.assertIsNone(result_cache.get_cached("key", workflow, "other"))
+
+    def test_reprepared_workflow(self):
+        result_cache.cache_result("key", _workflow(), "digest", "result")
+
+        self.assertIsNone(result_cache.get_cached("key", _workflow(), "digest"))
+
+    def test_bounded(self):
+        workflow = _workflow()
+        with patch.object(result_cache, "WORKFLOW_RESULT_CACHE_SIZE", 2):
+            for digest in ("one", "two", "three"):
+                result_cache.cache_result("key", workflow, digest, digest)
+
+        self.assertIsNone(result_cache.get_cached("key", workflow, "one"))
+        self.assertEqual("three", result_cache.get_cached("key", workflow, "three"))
@@ -0,0 +1,48 @@
+from unittest.mock import patch
+import unittest
+
+from koreo.workflow import salvage
+
+
+class TestSalvage(unittest.TestCase):
+    def tearDown(self):
+        salvage._reset()
+
+    def test_taken_once(self):
+        salvage.salvage("scope", "step", "fingerprint", "result")
+
+        self.assertEqual(
+            "result", salvage.take_salvaged("scope", "step", "fingerprint")
+        )
+        self.assertIsNone(salvage.take_salvaged("scope", "step", "fingerprint"))
+
+    def test_inputs_changed(self):
+        salvage.salvage("scope", "step", "fingerprint", "result")
+
+        self.assertIsNone(salvage.take_salvaged("scope", "step", "other"))
+        self.assertIsNone(salvage.take_salvaged("scope", "step", "fingerprint"))
+
+    def test_scoped(self):
+        salvage.salvage("scope", "step", "fingerprint", "result")
+
+        self.assertIsNone(salvage.take_salvaged("other", "step", "fingerprint"))
+        self.assertIsNone(salvage.take_salvaged("scope", "other", "fingerprint"))
+
+    def test_expired(self):
+        salvage.salvage("scope", "step", "fingerprint", "result")
+
+        with patch("koreo.workflow.salvage.time.monotonic") as monotonic:
+            monotonic.return_value = float("inf")
+            self.assertIsNone(salvage.take_salvaged("scope", "step", "fingerprint"))
+
+    def test_bounded(self):
+        with patch.object(salvage, "SALVAGE_CACHE_SIZE", 2):
+            salvage.salvage("scope", "one", "fingerprint", "one")
+            salvage.salvage("scope", "two", "fingerprint", "two")
+            salvage.salvage("scope", "three", "fingerprint", "three")
+
+        self.assertIsNone(salvage.take_salvaged("scope", "one", "fingerprint"))
+        self.assertEqual("two", salvage.take_salvaged("scope", "two", "fingerprint"))
+        self.assertEqual(
+            "three", salvage.take_salvaged("scope", "three", "fingerprint")
+        )
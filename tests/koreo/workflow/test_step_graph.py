@@ -0,0 +1,83 @@
+import unittest
+
+from koreo.result import PermFail
+from koreo.value_function.structure import ValueFunction
+
+from koreo.workflow import structure
+from koreo.workflow.step_graph import build_step_graph
+
+
+def _step(label: str, *dependencies: str) -> structure.Step:
+    return structure.Step(
+        label=label,
+        logic=ValueFunction(
+            preconditions=None,
+            local_values=None,
+            return_value=None,
+            dynamic_input_keys=set(),
+        ),
+        skip_if=None,
+        for_each=None,
+        inputs=None,
+        condition=None,
+        state=None,
+        dynamic_input_keys=set(dependencies),
+    )
+
+
+class TestBuildStepGraph(unittest.TestCase):
+    def test_empty(self):
+        step_graph = build_step_graph([])
+
+        self.assertDictEqual({}, step_graph.dependents)
+        self.assertDictEqual({}, step_graph.dependency_counts)
+        self.assertDictEqual({}, step_graph.priority)
+
+    def test_chain_and_independent(self):
+        step_graph = build_step_graph(
+            [
+                _step("a"),
+                _step("b"),
+                _step("c", "b"),
+                _step("d", "c"),
+            ]
+        )
+
+        self.assertDictEqual(
+            {"a": (), "b": ("c",), "c": ("d",), "d": ()}, step_graph.dependents
+        )
+        self.assertDictEqual(
+            {"a": 0, "b": 0, "c": 1, "d": 1}, step_graph.dependency_counts
+        )
+        self.assertDictEqual({"a": 1, "b": 3, "c": 2, "d": 1}, step_graph.priority)
+
+    def test_diamond(self):
+        step_graph = build_step_graph(
+            [
+                _step("root"),
+                _step("left", "root"),
+                _step("right", "root"),
+                _step("deep", "right"),
+                _step("join", "left", "deep"),
+            ]
+        )
+
+        self.assertCountEqual(("left", "right"), step_graph.dependents["root"])
+        self.assertEqual(2, step_graph.dependency_counts["join"])
+        self.assertDictEqual(
+            {"root": 4, "left": 2, "right": 3, "deep": 2, "join": 1},
+            step_graph.priority,
+        )
+
+    def test_error_steps_and_unknown_dependencies(self):
+        step_graph = build_step_graph(
+            [
+                structure.ErrorStep(
+                    label="broken", outcome=PermFail("unit-test"), condition=None
+                ),
+                _step("orphan", "missing"),
+            ]
+        )
+
+        self.assertDictEqual({"broken": 0, "orphan": 0}, step_graph.dependency_counts)
+        self.assertDictEqual({"broken": 1, "orphan": 1}, step_graph.priority)
@@ -0,0 +1,89 @@
+import unittest
+
+from celpy import celtypes
+
+from koreo.result import Ok, Retry, Skip
+
+from koreo.workflow import structure
+from koreo.workflow.step_outputs import StepOutputs
+
+
+def _step(
+    label: str,
+    *dependencies: str,
+    parent_step: str | None = None,
+    dependency_labels: dict[str, str] | None = None,
+) -> structure.Step:
+    return structure.Step(
+        label=label,
+        skip_if=None,
+        for_each=None,
+        inputs=None,
+        dynamic_input_keys=set(dependencies),
+        logic=None,
+        condition=None,
+        state=None,
+        parent_step=parent_step,
+        dependency_labels=dependency_labels,
+    )
+
+
+class TestStepOutputs(unittest.TestCase):
+    def setUp(self):
+        self.trigger = celtypes.MapType({"name": celtypes.StringType("unit-test")})
+        self.outputs = StepOutputs(self.trigger)
+
+    def test_no_dependencies(self):
+        workflow_inputs = self.outputs.workflow_inputs(_step("first"))
+
+        self.assertDictEqual({"parent": self.trigger}, workflow_inputs)
+
+    def test_restricted_to_dependencies(self):
+        self.outputs.add("first", celtypes.IntType(1))
+        self.outputs.add("second", celtypes.IntType(2))
+
+        workflow_inputs = self.outputs.workflow_inputs(
+            _step("third", "first", "parent")
+        )
+
+        self.assertDictEqual(
+            {"steps": {"first": 1}, "parent": self.trigger}, workflow_inputs
+        )
+
+    def test_only_ok_outcomes_added(self):
+        self.outputs.add("wrapped", Ok(celtypes.IntType(1)))
+        self.outputs.add("skipped", Skip(message="unit-test"))
+        self.outputs.add("waiting", Retry(message="unit-test"))
+
+        self.assertEqual(1, self.outputs.get("wrapped"))
+        self.assertIsNone(self.outputs.get("skipped"))
+        self.assertIsNone(self.outputs.get("waiting"))
+
+    def test_projection_shared(self):
+        self.outputs.add("first", celtypes.IntType(1))
+
+        workflow_inputs = self.outputs.workflow_inputs(_step("second", "first"))
+
+        self.assertIs(
+            workflow_inputs, self.outputs.workflow_inputs(_step("third", "first"))
+        )
+        self.assertIsNot(workflow_inputs, self.outputs.workflow_inputs(_step("fourth")))
+
+    def test_inlined_step(self):
+        entry_inputs = celtypes.MapType({"value": celtypes.IntType(7)})
+        self.outputs.add("sub.parent", entry_inputs)
+        self.outputs.add("sub.first", celtypes.IntType(1))
+
+        workflow_inputs = self.outputs.workflow_inputs(
+            _step(
+                "sub.second",
+                "sub.parent",
+                "sub.first",
+                parent_step="sub.parent",
+                dependency_labels={"sub.first": "first"},
+            )
+        )
+
+        self.assertDictEqual(
+            {"steps": {"first": 1}, "parent": entry_inputs}, workflow_inputs
+        )